@@ -7,13 +7,25 @@ from dotenv import load_dotenv
 import logfire
 import argparse
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 
 # Import our PDF processing scripts
-from scripts.pdf_analyze import PDFAnalyzer
+from scripts.pdf_analyze import PDFAnalyzer, ANALYSIS_MODES
 from scripts.pdf_to_markdown import PDFToMarkdown
-from scripts.pdf_to_png import PDFToPNG
+from scripts.pdf_to_png import PDFToPNG, RENDER_PROFILES
+from scripts.pipeline import (
+    ProcessingPipeline, PipelineConfig, PDFJob, shorten_filename, reconcile_outputs, remove_output
+)
+from scripts.pdf_document import PDFDocumentSession
+from scripts.manifest import ProcessingManifest, STATUS_DONE, STATUS_FAILED
+from scripts.watcher import FolderWatcher
+from scripts.search_index import SearchIndex, print_results
+from scripts.analysis_index import AnalysisIndex, add_query_arguments, run_query
+from scripts.bibliography import Bibliography
+from scripts.semantic_index import SemanticIndex, print_passages
+from scripts.near_duplicates import NearDuplicateIndex, DEFAULT_THRESHOLD
+from scripts.batch_analysis import BatchAnalyzer, DEFAULT_POLL_INTERVAL
 
 # Configure logging
 logfire.configure(
@@ -32,12 +44,26 @@ logging.basicConfig(
 class ResearchAssistant:
     """Main class to handle all PDF processing workflows."""
 
-    def __init__(self):
-        """Initialize the research assistant."""
+    def __init__(self, pipeline_config: Optional[PipelineConfig] = None, near_duplicates: str = 'skip',
+                 similarity_threshold: float = DEFAULT_THRESHOLD, analysis_mode: Optional[str] = None,
+                 text_token_budget: Optional[int] = None):
+        """
+        Initialize the research assistant.
+
+        Args:
+            pipeline_config: Concurrency and render settings for the pipeline
+            near_duplicates: What to do with PDFs whose text nearly matches another paper:
+                'skip' them, 'flag' them in the log but process them, or 'off' to not check
+            similarity_threshold: Minimum estimated text similarity for a near-duplicate
+            analysis_mode: 'pdf' to upload papers to Gemini, 'text' to send extracted text
+                (see PDFAnalyzer); defaults to GEMINI_ANALYSIS_MODE
+            text_token_budget: Per-paper token budget in text mode
+        """
         self.source_dir = Path("sources_pdf")
         self.markdown_dir = Path("sources_markdown")
         self.png_dir = Path("sources_png")
         self.analysis_dir = Path("sources_analysis")
+        self.bibliography_path = Path("sources_xml") / "sources.xml"
 
         # Create necessary directories
         for directory in [self.source_dir, self.markdown_dir, self.png_dir, self.analysis_dir]:
@@ -52,45 +78,138 @@ class ResearchAssistant:
             raise ValueError("GEMINI_API_KEY environment variable is not set. Please check your .env file.")
 
         # Initialize processors
-        self.analyzer = PDFAnalyzer(self.gemini_api_key)
-        self.markdown_converter = PDFToMarkdown()
-        self.png_converter = PDFToPNG()
+        self.analysis_index = AnalysisIndex()
+        self.analyzer = PDFAnalyzer(self.gemini_api_key, analysis_index=self.analysis_index,
+                                    analysis_mode=analysis_mode, text_token_budget=text_token_budget)
+        self.search_index = SearchIndex()
+        self.semantic_index = SemanticIndex()
+        self.markdown_converter = PDFToMarkdown(index=self.search_index, semantic_index=self.semantic_index)
+        self.pipeline_config = pipeline_config or PipelineConfig()
+        self.png_converter = PDFToPNG(profile=self.pipeline_config.png_profile)
+        self.bibliography = Bibliography(self.analysis_index, self.bibliography_path)
+        self.near_duplicate_mode = near_duplicates
+        self.near_duplicates = (NearDuplicateIndex(threshold=similarity_threshold)
+                                if near_duplicates != 'off' else None)
+
+        # Outputs are rebuilt when these fingerprints change
+        self.stage_settings = {
+            'analysis': self.analyzer.settings_fingerprint(),
+            'markdown': self.markdown_converter.settings_fingerprint(),
+            'png': self.png_converter.settings_fingerprint(),
+        }
+
+        # Per-file, per-stage processing state; adopt existing outputs on first use
+        self.manifest = ProcessingManifest()
+        if self.manifest.is_empty():
+            self.sync_manifest()
 
     def get_pdf_files(self) -> List[Path]:
         """Get list of PDF files to process, excluding .gitkeep."""
         return [f for f in self.source_dir.glob("*.pdf") if f.name != '.gitkeep']
 
+    def sync_manifest(self):
+        """Rebuild the manifest from the outputs currently on disk."""
+        pdf_files = self.get_pdf_files()
+        self.manifest.import_from_disk(pdf_files, self.analysis_dir, self.markdown_dir, self.png_dir)
+        if self.near_duplicates:
+            # Forget text signatures of files that are gone
+            self.near_duplicates.prune(self.manifest.touch_file(f).input_hash for f in pdf_files)
+
+    def get_stage_statuses(self, pdf_files: List[Path]) -> dict:
+        """
+        Return {name: {stage: up to date?}} for the given PDFs.
+
+        Each PDF is re-fingerprinted (hashing only those whose size or mtime changed),
+        then a single manifest query compares it against what every output was built from.
+        """
+        for pdf_path in pdf_files:
+            self.manifest.touch_file(pdf_path)
+        outdated = self.manifest.outdated_stages([f.name for f in pdf_files], self.stage_settings)
+        return {
+            pdf_path.name: {
+                stage: stage not in outdated[pdf_path.name]
+                for stage in ('analysis', 'markdown', 'png')
+            }
+            for pdf_path in pdf_files
+        }
+
+    def find_duplicate(self, pdf_path: Path, check_text: bool = True,
+                       planned: Optional[Dict[str, str]] = None) -> Optional[Tuple[str, float]]:
+        """
+        Another PDF in sources_pdf holding the same paper, recording the match.
+
+        Identical files are matched by content hash, against analyzed files and against
+        `planned` ({input hash: name} of files already kept in the current plan). With
+        `check_text`, PDFs whose text nearly matches another paper (preprint vs. published
+        version, re-downloads) are matched too, unless near-duplicate handling is 'flag' or 'off'.
+
+        Returns:
+            (original name, estimated text similarity), or None
+        """
+        record = self.manifest.touch_file(pdf_path)
+        match = None
+        original = self.manifest.find_duplicate(pdf_path.name, record.input_hash)
+        if not (original and (self.source_dir / original).exists()) and planned:
+            original = planned.get(record.input_hash)
+        if original and original != pdf_path.name and (self.source_dir / original).exists():
+            match = (original, 1.0)
+        elif check_text and self.near_duplicates:
+            match = self.find_near_duplicate(pdf_path.name, record.input_hash)
+            if match and self.near_duplicate_mode == 'flag':
+                logfire.warning(f"⚠️ {pdf_path.name} looks like a near-duplicate of {match[0]} "
+                                f"({match[1]:.0%} similar); processing anyway")
+                match = None
+
+        if (match[0] if match else None) != record.duplicate_of:
+            self.manifest.mark_duplicate(pdf_path.name, *(match or (None,)))
+        return match
+
+    def find_near_duplicate(self, name: str, input_hash: str) -> Optional[Tuple[str, float]]:
+        """Most similar other paper in sources_pdf that is not itself a duplicate."""
+        for other_hash, score in self.near_duplicates.candidates(input_hash):
+            for record in self.manifest.files_with_hashes([other_hash]):
+                if record.name != name and record.duplicate_of is None and (self.source_dir / record.name).exists():
+                    return record.name, score
+        return None
+
     async def process_single_pdf(self, pdf_path: Path, skip_analysis: bool = False):
-        """Process a single PDF file through all converters."""
+        """Process a single PDF file through all converters, opening and parsing it only once."""
+        session = None
         try:
             logfire.info(f"Starting processing of {pdf_path.name}")
 
             if not skip_analysis:
-                # Clean up filename if needed - remove problematic characters
-                clean_name = pdf_path.name
-                if len(clean_name) > 100:  # Truncate very long names
-                    clean_name = clean_name[:90] + "..." + pdf_path.suffix
-                    new_path = pdf_path.parent / clean_name
-                    try:
-                        pdf_path.rename(new_path)
-                        pdf_path = new_path
-                        logfire.info(f"Renamed long filename to: {clean_name}")
-                    except Exception as e:
-                        logfire.warning(f"Could not rename file: {e}")
+                # Clean up filename if needed - truncate very long names
+                pdf_path = shorten_filename(pdf_path)
+                await asyncio.to_thread(self.manifest.touch_file, pdf_path)
+                session = PDFDocumentSession(pdf_path)
 
                 # 1. Analyze PDF
                 logfire.info(f"Analyzing {pdf_path.name}...")
                 max_retries = 3
+                started = time.monotonic()
                 for attempt in range(max_retries):
                     try:
-                        analysis_result = self.analyzer.analyze_single_pdf(pdf_path)
+                        analysis_result = await self.analyzer.analyze_single_pdf_async(pdf_path, session)
                         if analysis_result:
                             logfire.info(f"Analysis completed for {pdf_path.name}")
                             # Get the new file path after potential renaming
-                            new_pdf_path = next(self.source_dir.glob(f"{pdf_path.stem}*.pdf"), pdf_path)
+                            new_pdf_path = self.source_dir / analysis_result[1]
                             if new_pdf_path != pdf_path:
                                 logfire.info(f"File was renamed during analysis to: {new_pdf_path.name}")
+                                self.manifest.rename(pdf_path.name, new_pdf_path.name)
                                 pdf_path = new_pdf_path
+                                session.path = new_pdf_path
+                            analysis_path = self.analysis_dir / f"{pdf_path.stem}_analysis.xml"
+                            reconcile_outputs(self.manifest, pdf_path.name, {
+                                'analysis': analysis_path,
+                                'markdown': self.markdown_dir / f"{pdf_path.stem}.md",
+                                'png': self.png_dir / pdf_path.stem,
+                            }, self.stage_settings)
+                            self.manifest.record_stage(
+                                pdf_path.name, 'analysis', STATUS_DONE, output_path=analysis_path,
+                                settings_hash=self.stage_settings['analysis'], duration=time.monotonic() - started
+                            )
                             break
                         else:
                             logfire.error(f"Analysis failed for {pdf_path.name}")
@@ -99,6 +218,8 @@ class ResearchAssistant:
                                 logfire.info(f"Retrying analysis in {wait_time} seconds...")
                                 await asyncio.sleep(wait_time)
                             else:
+                                self.manifest.record_stage(pdf_path.name, 'analysis', STATUS_FAILED,
+                                                           error="Analysis returned no result")
                                 return
                     except Exception as e:
                         if attempt < max_retries - 1:
@@ -106,6 +227,7 @@ class ResearchAssistant:
                             logfire.warning(f"Analysis attempt {attempt + 1} failed: {e}. Retrying in {wait_time} seconds...")
                             await asyncio.sleep(wait_time)
                         else:
+                            self.manifest.record_stage(pdf_path.name, 'analysis', STATUS_FAILED, error=str(e))
                             raise
 
             # Verify file exists before continuing
@@ -113,22 +235,41 @@ class ResearchAssistant:
                 logfire.error(f"PDF file not found: {pdf_path}")
                 return
 
-            # Check what needs to be processed
-            markdown_exists = (self.markdown_dir / f"{pdf_path.stem}.md").exists()
-            png_dir_exists = (self.png_dir / pdf_path.stem).exists() and any((self.png_dir / pdf_path.stem).glob("*.png"))
+            # Share one parsed document between the remaining stages
+            if session is None:
+                await asyncio.to_thread(self.manifest.touch_file, pdf_path)
+                session = PDFDocumentSession(pdf_path)
+
+            # Check what needs to be processed: missing outputs, or outputs built from
+            # a different version of the PDF or with different converter settings
+            md_path = self.markdown_dir / f"{pdf_path.stem}.md"
+            png_output_dir = self.png_dir / pdf_path.stem
+            outdated = reconcile_outputs(self.manifest, pdf_path.name, {
+                'markdown': md_path,
+                'png': png_output_dir,
+            }, self.stage_settings)
+            markdown_exists = 'markdown' not in outdated
+            png_dir_exists = 'png' not in outdated
 
             max_retries = 3
             # 2. Convert to Markdown if needed
             if not markdown_exists:
                 logfire.info(f"Converting {pdf_path.name} to Markdown...")
+                started = time.monotonic()
                 for attempt in range(max_retries):
                     try:
-                        md_result = self.markdown_converter.convert(
+                        md_result = await asyncio.to_thread(
+                            self.markdown_converter.convert,
                             pdf_path,
-                            self.markdown_dir / f"{pdf_path.stem}.md"
+                            md_path,
+                            stream=True,
+                            session=session
                         )
                         if md_result:
                             logfire.info(f"✅ Markdown conversion completed for {pdf_path.name}")
+                            self.manifest.record_stage(pdf_path.name, 'markdown', STATUS_DONE, output_path=md_path,
+                                                       settings_hash=self.stage_settings['markdown'],
+                                                       duration=time.monotonic() - started)
                             break
                         else:
                             if attempt < max_retries - 1:
@@ -137,6 +278,8 @@ class ResearchAssistant:
                                 await asyncio.sleep(wait_time)
                             else:
                                 logfire.error(f"❌ Markdown conversion failed for {pdf_path.name} after {max_retries} attempts")
+                                self.manifest.record_stage(pdf_path.name, 'markdown', STATUS_FAILED,
+                                                           error="Conversion returned no result")
                     except Exception as e:
                         if attempt < max_retries - 1:
                             wait_time = (attempt + 1) * 10
@@ -144,15 +287,23 @@ class ResearchAssistant:
                             await asyncio.sleep(wait_time)
                         else:
                             logfire.error(f"❌ Markdown conversion failed: {e}")
+                            self.manifest.record_stage(pdf_path.name, 'markdown', STATUS_FAILED, error=str(e))
 
             # 3. Convert to PNG if needed
             if not png_dir_exists:
                 logfire.info(f"Converting {pdf_path.name} to PNG...")
+                remove_output(png_output_dir)
+                started = time.monotonic()
                 for attempt in range(max_retries):
                     try:
-                        png_result = self.png_converter.convert(pdf_path)
+                        png_result = await asyncio.to_thread(
+                            self.png_converter.convert, pdf_path, png_output_dir, session=session
+                        )
                         if png_result:
                             logfire.info(f"✅ PNG conversion completed for {pdf_path.name}")
+                            self.manifest.record_stage(pdf_path.name, 'png', STATUS_DONE, output_path=png_output_dir,
+                                                       settings_hash=self.stage_settings['png'],
+                                                       duration=time.monotonic() - started)
                             break
                         else:
                             if attempt < max_retries - 1:
@@ -161,6 +312,8 @@ class ResearchAssistant:
                                 await asyncio.sleep(wait_time)
                             else:
                                 logfire.error(f"❌ PNG conversion failed for {pdf_path.name} after {max_retries} attempts")
+                                self.manifest.record_stage(pdf_path.name, 'png', STATUS_FAILED,
+                                                           error="Conversion returned no result")
                     except Exception as e:
                         if attempt < max_retries - 1:
                             wait_time = (attempt + 1) * 10
@@ -168,12 +321,22 @@ class ResearchAssistant:
                             await asyncio.sleep(wait_time)
                         else:
                             logfire.error(f"❌ PNG conversion failed: {e}")
+                            self.manifest.record_stage(pdf_path.name, 'png', STATUS_FAILED, error=str(e))
 
+            await asyncio.to_thread(self.update_bibliography)
             logfire.info(f"✨ Completed processing of {pdf_path.name}")
 
         except Exception as e:
             logfire.error(f"❌ Error processing {pdf_path.name}: {e}")
             raise
+        finally:
+            if session is not None:
+                session.close()
+
+    def update_bibliography(self):
+        """Merge new, changed and removed analyses into sources_xml/sources.xml."""
+        self.analysis_index.sync(self.analysis_dir)
+        self.bibliography.update()
 
     def check_processing_status(self):
         """Check the status of all files and their processing outputs."""
@@ -189,10 +352,22 @@ class ResearchAssistant:
         logfire.info(f"\n📊 Processing Status Report for {total_files} files:")
         print("\n" + "="*50)
 
+        statuses = self.get_stage_statuses(pdf_files)
+        duplicates = self.manifest.duplicates()
         for pdf_path in pdf_files:
-            analysis_exists = any(self.analysis_dir.glob(f"{pdf_path.stem}*_analysis.xml"))
-            markdown_exists = (self.markdown_dir / f"{pdf_path.stem}.md").exists()
-            png_dir_exists = (self.png_dir / pdf_path.stem).exists() and any((self.png_dir / pdf_path.stem).glob("*.png"))
+            if pdf_path.name in duplicates:
+                complete_files += 1
+                original, similarity = duplicates[pdf_path.name]
+                print(f"🔁 {pdf_path.name}:")
+                if similarity is None or similarity >= 1.0:
+                    print(f"   Duplicate of {original}")
+                else:
+                    print(f"   Near-duplicate of {original} ({similarity:.0%} similar text)")
+                continue
+
+            analysis_exists = statuses[pdf_path.name]['analysis']
+            markdown_exists = statuses[pdf_path.name]['markdown']
+            png_dir_exists = statuses[pdf_path.name]['png']
 
             status = []
             if analysis_exists:
@@ -231,8 +406,68 @@ class ResearchAssistant:
             print("   🎉 All files completely processed!")
         print("="*50 + "\n")
 
+    def plan_jobs(self, pdf_files: List[Path]) -> List[PDFJob]:
+        """Build pipeline jobs for the PDFs that have missing or outdated outputs."""
+        jobs = []
+        statuses = self.get_stage_statuses(pdf_files)
+        if self.near_duplicates:
+            # Signatures are cached by content hash, so only new files are read
+            self.near_duplicates.ensure([(f, self.manifest.get_file(f.name).input_hash) for f in pdf_files])
+        # One file per content hash is kept; identical copies planned with it are skipped
+        planned: Dict[str, str] = {}
+        for pdf_path in pdf_files:
+            input_hash = self.manifest.get_file(pdf_path.name).input_hash
+            # The same paper under another name is not processed twice. Papers already
+            # analyzed are only matched exactly; their analysis has been paid for.
+            match = self.find_duplicate(pdf_path, check_text=not statuses[pdf_path.name]['analysis'],
+                                        planned=planned)
+            if match:
+                original, similarity = match
+                # A text similarity of 1.0 does not make the files identical; compare their hashes
+                original_record = self.manifest.get_file(original)
+                if original_record and original_record.input_hash == input_hash:
+                    logfire.info(f"🔁 Skipping {pdf_path.name} - same content as {original}")
+                else:
+                    logfire.info(f"🔁 Skipping {pdf_path.name} - near-duplicate of {original} "
+                                 f"({similarity:.0%} similar text)")
+                continue
+            planned.setdefault(input_hash, pdf_path.name)
+
+            # Check which outputs are current
+            analysis_exists = statuses[pdf_path.name]['analysis']
+            markdown_exists = statuses[pdf_path.name]['markdown']
+            png_dir_exists = statuses[pdf_path.name]['png']
+
+            if analysis_exists and markdown_exists and png_dir_exists:
+                logfire.info(f"✅ Skipping {pdf_path.name} - all outputs up to date")
+                continue
+
+            # Log what's missing
+            if not analysis_exists:
+                logfire.info(f"❌ Analysis missing or outdated for {pdf_path.name}")
+            if not markdown_exists:
+                logfire.info(f"❌ Markdown missing or outdated for {pdf_path.name}")
+            if not png_dir_exists:
+                logfire.info(f"❌ PNG files missing or outdated for {pdf_path.name}")
+
+            # Analysis renames the PDF, so the pipeline re-checks the local
+            # outputs under the new name once analysis completes
+            jobs.append(PDFJob(
+                pdf_path=pdf_path,
+                needs_analysis=not analysis_exists,
+                needs_markdown=not analysis_exists or not markdown_exists,
+                needs_png=not analysis_exists or not png_dir_exists
+            ))
+        return jobs
+
+    def create_pipeline(self) -> ProcessingPipeline:
+        """Create a pipeline wired to this assistant's analyzer, outputs and manifest."""
+        return ProcessingPipeline(self.analyzer, self.markdown_dir, self.png_dir, self.pipeline_config,
+                                  manifest=self.manifest, settings=self.stage_settings,
+                                  search_index=self.search_index, semantic_index=self.semantic_index)
+
     async def process_all_pdfs(self):
-        """Process all PDFs in the source directory."""
+        """Process all PDFs in the source directory through the staged pipeline."""
         pdf_files = self.get_pdf_files()
         if not pdf_files:
             logfire.warning("No PDF files found in sources_pdf directory")
@@ -240,48 +475,113 @@ class ResearchAssistant:
 
         logfire.info(f"Found {len(pdf_files)} PDF files to process")
 
-        for i, pdf_path in enumerate(pdf_files):
-            try:
-                # Check if all outputs exist
-                analysis_exists = any(self.analysis_dir.glob(f"{pdf_path.stem}*_analysis.xml"))
-                markdown_exists = (self.markdown_dir / f"{pdf_path.stem}.md").exists()
-                png_dir_exists = (self.png_dir / pdf_path.stem).exists() and any((self.png_dir / pdf_path.stem).glob("*.png"))
+        jobs = self.plan_jobs(pdf_files)
+        if jobs:
+            results = await self.create_pipeline().run(jobs)
+            failed = [r for r in results if not r.success]
+            logfire.info(f"Pipeline finished: {len(results) - len(failed)} stages succeeded, {len(failed)} failed")
 
-                if analysis_exists and markdown_exists and png_dir_exists:
-                    logfire.info(f"✅ Skipping {pdf_path.name} - all outputs exist")
-                    continue
-                else:
-                    # Log what's missing
-                    if not analysis_exists:
-                        logfire.info(f"❌ Analysis missing for {pdf_path.name}")
-                    if not markdown_exists:
-                        logfire.info(f"❌ Markdown missing for {pdf_path.name}")
-                    if not png_dir_exists:
-                        logfire.info(f"❌ PNG files missing for {pdf_path.name}")
-
-                # Add delay between files to avoid rate limiting
-                if i > 0:
-                    delay = 15  # 15 seconds delay between files
-                    logfire.info(f"⏳ Waiting {delay} seconds before processing next file...")
-                    await asyncio.sleep(delay)
-
-                # Skip analysis if it exists
-                await self.process_single_pdf(pdf_path, skip_analysis=analysis_exists)
-
-            except Exception as e:
-                if "429" in str(e) or "quota" in str(e).lower():
-                    wait_time = 300  # 5 minutes if we hit quota limit
-                    logfire.warning(f"⚠️  Hit API quota limit. Waiting {wait_time} seconds before retrying...")
-                    await asyncio.sleep(wait_time)
-                    # Retry this file
-                    await self.process_single_pdf(pdf_path, skip_analysis=analysis_exists)
-                else:
-                    logfire.error(f"❌ Error processing {pdf_path.name}: {e}")
-                    continue
+        await asyncio.to_thread(self.update_bibliography)
 
         # Run final status check
         self.check_processing_status()
 
+    def locate_pdf(self, input_hash: str) -> Optional[Path]:
+        """The PDF in sources_pdf with the given content hash, if any."""
+        for record in self.manifest.files_with_hashes([input_hash]):
+            pdf_path = self.source_dir / record.name
+            if pdf_path.exists():
+                return pdf_path
+        return None
+
+    async def process_batch(self, poll_interval: float = DEFAULT_POLL_INTERVAL, batch_size: Optional[int] = None):
+        """
+        Process all PDFs, sending the analyses as Gemini batch jobs instead of interactive calls.
+
+        Jobs left open by an earlier run are polled as well. Markdown and PNG conversion run
+        meanwhile for PDFs that are already analyzed, and for the others as their job finishes.
+        """
+        pdf_files = self.get_pdf_files()
+        jobs = self.plan_jobs(pdf_files)
+        to_analyze = [shorten_filename(job.pdf_path) for job in jobs if job.needs_analysis]
+
+        pipeline = self.create_pipeline()
+        batch = BatchAnalyzer(self.analyzer, batch_size=batch_size, poll_interval=poll_interval,
+                              locate=self.locate_pdf)
+
+        async def on_result(pdf_path: Path, new_name: str):
+            job = PDFJob(pdf_path=pdf_path, needs_analysis=False, needs_markdown=True, needs_png=True)
+            await pipeline.finish_analysis(job, new_name)
+
+        await pipeline.start()
+        try:
+            for job in jobs:
+                if not job.needs_analysis:
+                    await pipeline.submit(job)
+            logfire.info(f"Sending {len(to_analyze)} PDFs for batch analysis")
+            await batch.run(to_analyze, on_result)
+            await pipeline.join()
+        finally:
+            await pipeline.close()
+            batch.store.close()
+
+        failed = [r for r in pipeline.results if not r.success]
+        logfire.info(f"Batch run finished: {len(pipeline.results) - len(failed)} stages succeeded, {len(failed)} failed")
+        await asyncio.to_thread(self.update_bibliography)
+        self.check_processing_status()
+
+    async def watch(self, debounce: float = 2.0, poll_interval: float = 2.0, use_inotify: bool = True,
+                    bibliography_interval: float = 10.0):
+        """
+        Process pending PDFs, then keep feeding new or replaced ones into a running pipeline.
+
+        The analyzer, process pool and caches stay warm between files, so a paper dropped
+        into sources_pdf is picked up within the debounce interval. The bibliography is
+        refreshed every `bibliography_interval` seconds while analyses come in. Runs until cancelled.
+        """
+        pipeline = self.create_pipeline()
+        await pipeline.start()
+        # Content hashes already queued; analysis renaming a PDF must not re-trigger it
+        submitted = set()
+
+        async def submit(jobs: List[PDFJob]):
+            for job in jobs:
+                record = self.manifest.get_file(job.pdf_path.name)
+                if record:
+                    submitted.add(record.input_hash)
+                await pipeline.submit(job)
+
+        async def refresh_bibliography():
+            while True:
+                await asyncio.sleep(bibliography_interval)
+                try:
+                    await asyncio.to_thread(self.update_bibliography)
+                except Exception as e:
+                    logfire.warning(f"Bibliography update failed: {e}")
+
+        watcher = FolderWatcher(self.source_dir, debounce=debounce, poll_interval=poll_interval,
+                                use_inotify=use_inotify)
+        refresher = asyncio.create_task(refresh_bibliography())
+        try:
+            # Snapshot before planning, which can take minutes on a large folder: PDFs dropped
+            # in meanwhile are still reported, and `submitted` skips any planned twice
+            await asyncio.to_thread(watcher.mark_existing)
+            await submit(await asyncio.to_thread(self.plan_jobs, self.get_pdf_files()))
+            logfire.info(f"👀 Watching {self.source_dir} for new PDFs (Ctrl+C to stop)")
+
+            async for pdf_path in watcher.changes(include_existing=True):
+                record = await asyncio.to_thread(self.manifest.touch_file, pdf_path)
+                if record.input_hash in submitted:
+                    continue
+                logfire.info(f"📥 New PDF: {pdf_path.name}")
+                await submit(await asyncio.to_thread(self.plan_jobs, [pdf_path]))
+        finally:
+            refresher.cancel()
+            await pipeline.close()
+            await asyncio.to_thread(self.update_bibliography)
+            failed = [r for r in pipeline.results if not r.success]
+            logfire.info(f"Watch stopped: {len(pipeline.results) - len(failed)} stages succeeded, {len(failed)} failed")
+
     def list_available_pdfs(self):
         """List all available PDFs in the source directory."""
         pdf_files = self.get_pdf_files()
@@ -292,18 +592,131 @@ class ResearchAssistant:
             for i, pdf in enumerate(pdf_files, 1):
                 print(f"{i}. {pdf.name}")
 
+def search_corpus(query: str, limit: int = 10, markdown_dir: Path = Path("sources_markdown")):
+    """Print papers and pages matching a query, indexing new or changed Markdown first."""
+    index = SearchIndex()
+    try:
+        indexed, removed = index.sync(markdown_dir)
+        if indexed or removed:
+            logging.info(f"Search index updated: {indexed} indexed, {removed} removed")
+        started = time.perf_counter()
+        results = index.search(query, limit=limit)
+        print_results(query, results, time.perf_counter() - started)
+    finally:
+        index.close()
+
+def similar_passages(query: str, limit: int = 10, markdown_dir: Path = Path("sources_markdown")):
+    """Print the passages most similar to a query, embedding new or changed Markdown first."""
+    index = SemanticIndex()
+    try:
+        indexed, removed = index.sync(markdown_dir)
+        if indexed or removed:
+            logging.info(f"Semantic index updated: {indexed} indexed, {removed} removed")
+        started = time.perf_counter()
+        passages = index.search(query, limit=limit)
+        print_passages(query, passages, time.perf_counter() - started)
+    finally:
+        index.close()
+
+def build_bibliography(analysis_dir: Path = Path("sources_analysis"),
+                       output_path: Path = Path("sources_xml") / "sources.xml"):
+    """Bring sources_xml/sources.xml up to date with the analyses on disk."""
+    index = AnalysisIndex()
+    try:
+        index.sync(analysis_dir)
+        stats = Bibliography(index, output_path).update()
+        print(f"📖 {output_path}: {stats.added} added, {stats.updated} updated, "
+              f"{stats.removed} removed, {stats.unchanged} unchanged")
+    finally:
+        index.close()
+
 async def main():
     """Main entry point for the research assistant."""
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Research Assistant - PDF Processing Workflow')
     parser.add_argument('--file', '-f', help='Specific PDF file to process (must be in sources_pdf/)')
     parser.add_argument('--list', '-l', action='store_true', help='List available PDF files')
+    parser.add_argument('--analysis-workers', type=int, default=PipelineConfig.analysis_workers,
+                        help='Number of concurrent Gemini analysis workers')
+    parser.add_argument('--markdown-workers', type=int, default=PipelineConfig.markdown_workers,
+                        help='Number of concurrent Markdown conversion workers')
+    parser.add_argument('--png-workers', type=int, default=PipelineConfig.png_workers,
+                        help='Number of concurrent PNG conversion workers')
+    parser.add_argument('--png-page-workers', type=int, default=PipelineConfig.png_page_workers,
+                        help='Processes rendering the pages of a single PDF in parallel')
+    parser.add_argument('--png-profile', choices=sorted(RENDER_PROFILES), default=PipelineConfig.png_profile,
+                        help='Page image render profile; changing it re-renders existing page images')
+    parser.add_argument('--queue-size', type=int, default=PipelineConfig.queue_size,
+                        help='Maximum number of files waiting in each stage queue')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='Keep running and process PDFs as they are added to sources_pdf/')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='Seconds a new file must stay unchanged before it is processed (--watch)')
+    parser.add_argument('--poll', action='store_true',
+                        help='Poll sources_pdf/ instead of using inotify (--watch)')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds between directory scans when polling (--watch)')
+    parser.add_argument('--analysis-mode', choices=ANALYSIS_MODES,
+                        help="'text' sends extracted, section-trimmed text instead of uploading the PDF "
+                             "(scanned PDFs are still uploaded); default GEMINI_ANALYSIS_MODE or 'pdf'")
+    parser.add_argument('--text-token-budget', type=int,
+                        help='Maximum tokens of paper text sent per paper in text mode')
+    parser.add_argument('--near-duplicates', choices=['skip', 'flag', 'off'], default='skip',
+                        help='Skip, only log, or ignore PDFs whose text nearly matches another paper')
+    parser.add_argument('--similarity-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Minimum estimated text similarity (0-1) for a near-duplicate')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Rebuild the processing manifest from the outputs on disk before running')
+    parser.add_argument('--batch', action='store_true',
+                        help='Analyze through Gemini batch jobs (cheaper, finishes within 24 hours); '
+                             'rerun to resume waiting for jobs submitted earlier')
+    parser.add_argument('--batch-size', type=int,
+                        help='Maximum papers per batch job (--batch); default GEMINI_BATCH_SIZE or 200')
+    parser.add_argument('--batch-poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between batch job state checks (--batch)')
+    subparsers = parser.add_subparsers(dest='command')
+    search_parser = subparsers.add_parser('search', help='Full-text search over sources_markdown/')
+    search_parser.add_argument('query', nargs='+', help='Words to search for, or an FTS5 query')
+    search_parser.add_argument('--limit', '-n', type=int, default=10, help='Maximum number of papers to show')
+    query_parser = subparsers.add_parser(
+        'query', help='Filter analyses by author, year and field contents, optionally exporting to sources_csv/'
+    )
+    add_query_arguments(query_parser)
+    similar_parser = subparsers.add_parser('similar', help='Semantic passage search over sources_markdown/')
+    similar_parser.add_argument('query', nargs='+', help='Research question or statement')
+    similar_parser.add_argument('--limit', '-n', type=int, default=10, help='Number of passages to show')
+    subparsers.add_parser('bibliography', help='Merge sources_analysis/ into sources_xml/sources.xml')
     args = parser.parse_args()
 
+    # Searching and querying need neither the API key nor the processing pipeline
+    if args.command == 'search':
+        search_corpus(' '.join(args.query), args.limit)
+        return
+    if args.command == 'query':
+        run_query(args)
+        return
+    if args.command == 'similar':
+        similar_passages(' '.join(args.query), args.limit)
+        return
+    if args.command == 'bibliography':
+        build_bibliography()
+        return
+
     # Initialize research assistant
-    assistant = ResearchAssistant()
+    assistant = ResearchAssistant(PipelineConfig(
+        analysis_workers=args.analysis_workers,
+        markdown_workers=args.markdown_workers,
+        png_workers=args.png_workers,
+        png_page_workers=args.png_page_workers,
+        png_profile=args.png_profile,
+        queue_size=args.queue_size
+    ), near_duplicates=args.near_duplicates, similarity_threshold=args.similarity_threshold,
+       analysis_mode=args.analysis_mode, text_token_budget=args.text_token_budget)
 
     try:
+        if args.rescan:
+            assistant.sync_manifest()
+
         if args.list:
             assistant.list_available_pdfs()
             return
@@ -315,6 +728,11 @@ async def main():
                 logfire.error(f"PDF file not found: {pdf_path}")
                 return
             await assistant.process_single_pdf(pdf_path)
+        elif args.batch:
+            await assistant.process_batch(poll_interval=args.batch_poll_interval, batch_size=args.batch_size)
+        elif args.watch:
+            await assistant.watch(debounce=args.debounce, poll_interval=args.poll_interval,
+                                  use_inotify=not args.poll)
         else:
             # Process all files
             await assistant.process_all_pdfs()
@@ -322,6 +740,14 @@ async def main():
     except Exception as e:
         logfire.error(f"Error in main process: {e}")
         raise
+    finally:
+        await assistant.analyzer.close_async()
+        assistant.manifest.close()
+        assistant.search_index.close()
+        assistant.semantic_index.close()
+        if assistant.near_duplicates:
+            assistant.near_duplicates.close()
+        assistant.analysis_index.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of Gemini analysis responses.
+
+Entries are keyed by the SHA-256 of the PDF bytes together with the system
+instruction, prompt and model name, so renamed files, duplicate downloads and
+reruns all hit the same entry. Stored in SQLite with LRU eviction once the
+total size exceeds a configured limit.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+try:
+    from scripts.hashing import sha256_file, sha256_text
+except ImportError:
+    from hashing import sha256_file, sha256_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path('.cache') / 'analysis_cache.sqlite'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class AnalysisCache:
+    """Persistent SQLite cache mapping analysis keys to raw model responses."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite file. Defaults to ANALYSIS_CACHE_PATH or .cache/analysis_cache.sqlite
+            max_bytes: Size limit before least-recently-used entries are evicted.
+                Defaults to ANALYSIS_CACHE_MAX_MB or 512 MB.
+        """
+        self.path = Path(path or os.getenv('ANALYSIS_CACHE_PATH') or DEFAULT_CACHE_PATH)
+        if max_bytes is None:
+            max_mb = os.getenv('ANALYSIS_CACHE_MAX_MB')
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                pdf_sha256 TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_used ON analyses (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(pdf_sha256: str, system_instruction: Iterable[str], prompt: str, model_name: str) -> str:
+        """Combine the PDF hash with everything that influences the model's answer."""
+        return sha256_text(pdf_sha256, '\n'.join(system_instruction), prompt, model_name)
+
+    def key_for_file(self, pdf_path: Union[str, Path], system_instruction: Iterable[str],
+                     prompt: str, model_name: str) -> str:
+        """Hash a PDF and build its cache key."""
+        return self.make_key(sha256_file(pdf_path), system_instruction, prompt, model_name)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE analyses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str, pdf_sha256: str = '', model_name: str = ''):
+        """Store a response and evict old entries if the cache grew too large."""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, pdf_sha256, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, pdf_sha256, model_name, response, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM analyses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM analyses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} cached analyses to stay under {self.max_bytes} bytes")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
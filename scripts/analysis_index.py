@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Structured index over the analysis XML files in sources_analysis.
+
+Each `*_analysis.xml` becomes one row in SQLite with the year parsed to an
+integer and the authors split into a normalized, indexed author table, plus an
+FTS5 table over the free-text fields. Corpus-wide questions ("2019-2023 papers
+by Smith whose methodology mentions RCT") become a single indexed query instead
+of re-parsing every XML file, and results can be exported to sources_csv/.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    from scripts.search_index import plain_fts_query, to_fts_query
+except ImportError:
+    from search_index import plain_fts_query, to_fts_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path('.cache') / 'analysis_index.sqlite'
+
+ANALYSIS_SUFFIX = '_analysis'
+
+# Free-text elements stored as columns and searchable; other elements go to `extra`
+TEXT_FIELDS = ('title', 'abstract', 'key_findings', 'methodology', 'results',
+               'limitations', 'research_gap', 'thematic_analysis')
+
+# Tag spellings the model uses for the same field
+FIELD_ALIASES = {
+    'key_findings_contributions': 'key_findings',
+    'key_findings_and_contributions': 'key_findings',
+    'year': 'publication_year',
+}
+
+@dataclass
+class Author:
+    """An author name split into parts, with accent- and case-insensitive keys."""
+    last: str
+    first: str = ''
+
+    @property
+    def last_key(self) -> str:
+        return fold(self.last)
+
+    @property
+    def first_key(self) -> str:
+        return fold(self.first)
+
+    @property
+    def display(self) -> str:
+        return f"{self.last}, {self.first}" if self.first else self.last
+
+@dataclass
+class PaperRecord:
+    """One indexed analysis."""
+    name: str
+    path: str
+    title: str
+    year: Optional[int]
+    authors: List[str] = field(default_factory=list)
+    fields: Dict[str, str] = field(default_factory=dict)
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents and punctuation, for matching names."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9 ]+', '', text.lower()).strip()
+
+def parse_author(name: str) -> Optional[Author]:
+    """Parse 'Last, First' or 'First Last' into an Author."""
+    name = ' '.join(name.split()).strip(' .,')
+    if not name:
+        return None
+    if ',' in name:
+        last, first = name.split(',', 1)
+        return Author(last.strip(), first.strip())
+    parts = name.split(' ')
+    return Author(parts[-1], ' '.join(parts[:-1]))
+
+def parse_authors(authors: str) -> List[Author]:
+    """
+    Split an author list into Authors.
+
+    The prompt asks for 'Last1, First1; Last2, First2', but 'A and B' and
+    comma-separated 'First Last' lists are handled too.
+    """
+    if not authors:
+        return []
+    if ';' in authors:
+        names = authors.split(';')
+    else:
+        names = re.split(r',?\s+and\s+|\s*&\s*', authors)
+        # "First Last, First Last" (no semicolons, every part has a space)
+        if len(names) == 1 and authors.count(',') > 1:
+            names = authors.split(',')
+    parsed = (parse_author(name) for name in names)
+    return [author for author in parsed if author is not None]
+
+def parse_year(text: Optional[str]) -> Optional[int]:
+    """First plausible four-digit year in the text, or None."""
+    match = re.search(r'\b(1[89]\d\d|20\d\d|2100)\b', text or '')
+    return int(match.group(1)) if match else None
+
+def element_text(element: ET.Element) -> str:
+    """All text inside an element, whitespace-normalized."""
+    return ' '.join(' '.join(element.itertext()).split())
+
+def normalize_tag(tag: str) -> str:
+    """Canonical field name for an element tag, e.g. 'Key-Findings-Contributions' -> 'key_findings'."""
+    tag = tag.lower().replace('-', '_')
+    return FIELD_ALIASES.get(tag, tag)
+
+def parse_analysis(xml_text: str) -> Dict[str, str]:
+    """Map each child element of <analysis> to its text, keyed by normalized field name."""
+    root = ET.fromstring(xml_text)
+    return {normalize_tag(child.tag): element_text(child) for child in root}
+
+class AnalysisIndex:
+    """SQLite store of analysis fields with normalized authors and years."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Open or create the index. Defaults to ANALYSIS_INDEX_PATH or .cache/analysis_index.sqlite."""
+        self.path = Path(path or os.getenv('ANALYSIS_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        columns = ', '.join(f"{name} TEXT" for name in TEXT_FIELDS)
+        with self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS papers (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    year INTEGER,
+                    year_text TEXT,
+                    authors_text TEXT,
+                    {columns},
+                    extra TEXT,
+                    indexed REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS authors (
+                    id INTEGER PRIMARY KEY,
+                    last TEXT NOT NULL,
+                    first TEXT NOT NULL,
+                    last_key TEXT NOT NULL,
+                    first_key TEXT NOT NULL,
+                    UNIQUE (last_key, first_key)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS paper_authors (
+                    paper_id INTEGER NOT NULL REFERENCES papers (id) ON DELETE CASCADE,
+                    author_id INTEGER NOT NULL REFERENCES authors (id),
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (paper_id, position)
+                )
+            """)
+            self._conn.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                    {', '.join(TEXT_FIELDS)}, tokenize = 'porter unicode61'
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_papers_year ON papers (year)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_authors_last ON authors (last_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_paper_authors_author ON paper_authors (author_id)")
+
+    @staticmethod
+    def name_for(xml_path: Path) -> str:
+        """Paper name (the PDF stem) for an analysis file."""
+        stem = xml_path.stem
+        return stem[:-len(ANALYSIS_SUFFIX)] if stem.endswith(ANALYSIS_SUFFIX) else stem
+
+    def _author_id(self, author: Author) -> int:
+        row = self._conn.execute(
+            "SELECT id FROM authors WHERE last_key = ? AND first_key = ?", (author.last_key, author.first_key)
+        ).fetchone()
+        if row:
+            return row[0]
+        return self._conn.execute(
+            "INSERT INTO authors (last, first, last_key, first_key) VALUES (?, ?, ?, ?)",
+            (author.last, author.first, author.last_key, author.first_key)
+        ).lastrowid
+
+    def index_fields(self, name: str, fields: Dict[str, str], path: Union[str, Path] = '',
+                     size: int = 0, mtime: float = 0.0) -> int:
+        """Insert or replace one paper's fields. Returns the paper id."""
+        year_text = fields.get('publication_year', '')
+        authors_text = fields.get('authors', '')
+        known = set(TEXT_FIELDS) | {'publication_year', 'authors'}
+        extra = {key: value for key, value in fields.items() if key not in known}
+        text_values = [fields.get(name_, '') for name_ in TEXT_FIELDS]
+
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM papers WHERE name = ?", (name,)).fetchone()
+            values = (str(path), size, mtime, parse_year(year_text), year_text, authors_text,
+                      *text_values, json.dumps(extra) if extra else None, time.time())
+            assignments = ', '.join(f"{column} = ?" for column in
+                                    ('path', 'size', 'mtime', 'year', 'year_text', 'authors_text',
+                                     *TEXT_FIELDS, 'extra', 'indexed'))
+            if row:
+                paper_id = row[0]
+                self._conn.execute(f"UPDATE papers SET {assignments} WHERE id = ?", (*values, paper_id))
+                self._conn.execute("DELETE FROM paper_authors WHERE paper_id = ?", (paper_id,))
+                self._conn.execute("DELETE FROM papers_fts WHERE rowid = ?", (paper_id,))
+            else:
+                columns = ', '.join(('name', 'path', 'size', 'mtime', 'year', 'year_text', 'authors_text',
+                                     *TEXT_FIELDS, 'extra', 'indexed'))
+                placeholders = ', '.join('?' * (len(values) + 1))
+                paper_id = self._conn.execute(
+                    f"INSERT INTO papers ({columns}) VALUES ({placeholders})", (name, *values)
+                ).lastrowid
+
+            for position, author in enumerate(parse_authors(authors_text)):
+                self._conn.execute(
+                    "INSERT INTO paper_authors (paper_id, author_id, position) VALUES (?, ?, ?)",
+                    (paper_id, self._author_id(author), position)
+                )
+            self._conn.execute(
+                f"INSERT INTO papers_fts (rowid, {', '.join(TEXT_FIELDS)}) VALUES (?{', ?' * len(TEXT_FIELDS)})",
+                (paper_id, *text_values)
+            )
+        return paper_id
+
+    def index_file(self, xml_path: Union[str, Path], force: bool = False) -> bool:
+        """Index one analysis file unless unchanged since last time. Returns True if indexed."""
+        xml_path = Path(xml_path)
+        name = self.name_for(xml_path)
+        stat = xml_path.stat()
+        if not force:
+            with self._lock:
+                row = self._conn.execute("SELECT size, mtime FROM papers WHERE name = ?", (name,)).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+                return False
+        try:
+            fields = parse_analysis(xml_path.read_text(encoding='utf-8'))
+        except ET.ParseError as e:
+            logger.warning(f"Skipping {xml_path.name}: invalid XML ({e})")
+            return False
+        self.index_fields(name, fields, xml_path, stat.st_size, stat.st_mtime)
+        return True
+
+    def remove(self, names: Iterable[str]):
+        """Drop papers from the index."""
+        with self._lock, self._conn:
+            for name in names:
+                row = self._conn.execute("SELECT id FROM papers WHERE name = ?", (name,)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM papers_fts WHERE rowid = ?", (row[0],))
+                    self._conn.execute("DELETE FROM papers WHERE id = ?", (row[0],))
+
+    def sync(self, analysis_dir: Union[str, Path]) -> Tuple[int, int]:
+        """Bring the index in line with an analysis directory. Returns (indexed, removed) counts."""
+        on_disk = {self.name_for(path): path for path in Path(analysis_dir).glob(f"*{ANALYSIS_SUFFIX}.xml")}
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT name FROM papers")}
+        indexed = sum(1 for path in on_disk.values() if self.index_file(path))
+        removed = known - on_disk.keys()
+        if removed:
+            self.remove(removed)
+        return indexed, len(removed)
+
+    @staticmethod
+    def _match_expression(text: Optional[str], fields: Optional[Dict[str, str]], convert) -> str:
+        """FTS5 expression for the free-text filters, each converted with `convert`."""
+        filters = ([(None, text)] if text else []) + list((fields or {}).items())
+        expressions = []
+        for field_name, words in filters:
+            expression = convert(words)
+            if not expression:
+                raise ValueError(f"No words to search for in '{words}'")
+            expressions.append(f"{field_name} : ({expression})" if field_name else f"({expression})")
+        return ' AND '.join(expressions)
+
+    def _select(self, sql: str, params: list):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            return rows, self._authors_for([row[0] for row in rows])
+
+    def query(self, author: Optional[str] = None, year_from: Optional[int] = None,
+              year_to: Optional[int] = None, text: Optional[str] = None,
+              fields: Optional[Dict[str, str]] = None, limit: Optional[int] = None) -> List[PaperRecord]:
+        """
+        Find papers matching all given filters.
+
+        Args:
+            author: Author name, e.g. 'Smith', 'Smith, J' or 'Jane Smith' (accent/case-insensitive;
+                a first name or initial narrows the match)
+            year_from: Earliest publication year (inclusive)
+            year_to: Latest publication year (inclusive)
+            text: Words (or an FTS5 expression) to find in any free-text field
+            fields: Words to find per field, e.g. {'methodology': 'RCT'}
+            limit: Maximum number of papers returned
+
+        Returns:
+            Matching papers, newest first
+        """
+        conditions, params = [], []
+        if author:
+            parsed = parse_author(author)
+            condition = ("p.id IN (SELECT pa.paper_id FROM paper_authors pa JOIN authors a "
+                         "ON a.id = pa.author_id WHERE a.last_key = ?")
+            params.append(parsed.last_key)
+            if parsed.first_key:
+                condition += " AND a.first_key LIKE ?"
+                params.append(parsed.first_key[0] + '%')
+            conditions.append(condition + ")")
+        if year_from is not None:
+            conditions.append("p.year >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            conditions.append("p.year <= ?")
+            params.append(year_to)
+
+        for field_name in fields or {}:
+            if field_name not in TEXT_FIELDS:
+                raise ValueError(f"Unknown field '{field_name}'. Searchable fields: {', '.join(TEXT_FIELDS)}")
+        match = self._match_expression(text, fields, to_fts_query)
+        match_param = None
+        if match:
+            conditions.append("p.id IN (SELECT rowid FROM papers_fts WHERE papers_fts MATCH ?)")
+            match_param = len(params)
+            params.append(match)
+
+        sql = f"SELECT p.id, p.name, p.path, p.title, p.year, {', '.join(f'p.{f}' for f in TEXT_FIELDS)}, p.extra FROM papers p"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY p.year IS NULL, p.year DESC, p.name"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        try:
+            rows, authors = self._select(sql, params)
+        except sqlite3.OperationalError as e:
+            # Free text that only looks like FTS5 syntax ("trial AND", "e.g. (RCT)") is searched word by word
+            fallback = self._match_expression(text, fields, plain_fts_query)
+            if match_param is None or fallback == match:
+                raise
+            logger.info(f"Not a valid FTS5 query ({e}); searching for its words instead")
+            params[match_param] = fallback
+            rows, authors = self._select(sql, params)
+
+        records = []
+        for row in rows:
+            paper_fields = {name_: value for name_, value in zip(TEXT_FIELDS, row[5:5 + len(TEXT_FIELDS)]) if value}
+            if row[-1]:
+                paper_fields.update(json.loads(row[-1]))
+            records.append(PaperRecord(row[1], row[2], row[3] or '', row[4], authors.get(row[0], []), paper_fields))
+        return records
+
+    def _authors_for(self, paper_ids: List[int]) -> Dict[int, List[str]]:
+        authors: Dict[int, List[str]] = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(paper_ids), 500):
+            chunk = paper_ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT pa.paper_id, a.last, a.first FROM paper_authors pa JOIN authors a ON a.id = pa.author_id "
+                f"WHERE pa.paper_id IN ({', '.join('?' * len(chunk))}) ORDER BY pa.paper_id, pa.position",
+                chunk
+            ).fetchall()
+            for paper_id, last, first in rows:
+                authors.setdefault(paper_id, []).append(Author(last, first).display)
+        return authors
+
+    def last_modified(self) -> Tuple[int, float]:
+        """(paper count, latest indexing time); changes whenever a paper is added, updated or removed."""
+        with self._lock:
+            count, latest = self._conn.execute("SELECT COUNT(*), MAX(indexed) FROM papers").fetchone()
+        return count, latest or 0.0
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def export_csv(records: List[PaperRecord], output_dir: Union[str, Path] = 'sources_csv',
+               basename: str = 'analyses') -> Tuple[Path, Path]:
+    """
+    Write papers and their authors as CSV files.
+
+    Produces <basename>.csv (one row per paper) and <basename>_authors.csv (one row
+    per paper and author, in author order). Returns both paths.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    papers_path = output_dir / f"{basename}.csv"
+    authors_path = output_dir / f"{basename}_authors.csv"
+
+    columns = ['name', 'title', 'authors', 'year'] + [name for name in TEXT_FIELDS if name != 'title'] + ['analysis_path']
+    with open(papers_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([record.name, record.title, '; '.join(record.authors), record.year or '']
+                            + [record.fields.get(name, '') for name in TEXT_FIELDS if name != 'title']
+                            + [record.path])
+
+    with open(authors_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'position', 'author'])
+        for record in records:
+            for position, author in enumerate(record.authors, 1):
+                writer.writerow([record.name, position, author])
+
+    logger.info(f"Exported {len(records)} papers to {papers_path} and {authors_path}")
+    return papers_path, authors_path
+
+def print_records(records: List[PaperRecord], elapsed: float):
+    """Print query results, one paper per line."""
+    print(f"\n📚 {len(records)} papers ({elapsed * 1000:.1f} ms):\n")
+    for record in records:
+        authors = '; '.join(record.authors[:3]) + (' et al.' if len(record.authors) > 3 else '')
+        print(f"{record.year or '----'}  {record.title or record.name}")
+        print(f"      {authors}  [{record.name}]")
+    print()
+
+def add_query_arguments(parser: argparse.ArgumentParser):
+    """Filters shared by the standalone CLI and `main.py query`."""
+    parser.add_argument('--author', '-a', help="Author, e.g. 'Smith' or 'Smith, J'")
+    parser.add_argument('--from-year', type=int, help='Earliest publication year')
+    parser.add_argument('--to-year', type=int, help='Latest publication year')
+    parser.add_argument('--text', '-t', help='Words to find in any field')
+    parser.add_argument('--field', action='append', default=[], metavar='FIELD=WORDS',
+                        help=f"Words to find in one field ({', '.join(TEXT_FIELDS)}), e.g. methodology=RCT")
+    parser.add_argument('--limit', '-n', type=int, help='Maximum number of papers')
+    parser.add_argument('--csv', nargs='?', const='analyses', metavar='NAME',
+                        help='Export the results to sources_csv/NAME.csv (default: analyses)')
+
+def run_query(args: argparse.Namespace, analysis_dir: Union[str, Path] = 'sources_analysis',
+              csv_dir: Union[str, Path] = 'sources_csv'):
+    """Sync the index, run the query described by `args` and print or export the results."""
+    fields = {}
+    for item in args.field:
+        name, _, words = item.partition('=')
+        fields[name.strip()] = words
+
+    index = AnalysisIndex()
+    try:
+        indexed, removed = index.sync(analysis_dir)
+        if indexed or removed:
+            logger.info(f"Analysis index updated: {indexed} indexed, {removed} removed")
+        started = time.perf_counter()
+        try:
+            records = index.query(author=args.author, year_from=args.from_year, year_to=args.to_year,
+                                  text=args.text, fields=fields, limit=args.limit)
+        except ValueError as e:
+            logger.error(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        print_records(records, elapsed)
+        if args.csv:
+            export_csv(records, csv_dir, args.csv)
+    finally:
+        index.close()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Query the analyses in sources_analysis')
+    parser.add_argument('-d', '--analysis-dir', default='sources_analysis', help='Analysis XML directory')
+    parser.add_argument('-o', '--csv-dir', default='sources_csv', help='Directory for CSV exports')
+    add_query_arguments(parser)
+    args = parser.parse_args()
+    run_query(args, args.analysis_dir, args.csv_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Offline analysis of large backlogs through Gemini batch jobs.
+
+Interactive analysis pays per-request latency and is paced by the per-minute
+rate limits. For thousands of papers, the same generateContent requests can be
+grouped into batch jobs instead: they run within 24 hours at half the price and
+outside the interactive quota.
+
+Submitted jobs and the PDF behind every request are kept in a small SQLite
+store, so polling resumes where it left off after a restart and a PDF is never
+submitted twice while a job holding it is still open. Each job's analyses are
+saved to sources_analysis/ (and the analysis cache) as soon as the job finishes.
+Run against fake_gemini_server.py to exercise the whole flow locally.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+try:
+    from scripts.gemini_async import BatchJob, GeminiAPIError, file_part, generate_request, text_part
+    from scripts.pdf_analyze import PDFAnalyzer, ANALYSIS_PROMPT, SYSTEM_INSTRUCTION, TEXT_ANALYSIS_PROMPT
+    from scripts.pdf_document import PDFDocumentSession
+    from scripts.rate_limiter import is_rate_limit_error, retry_after_seconds
+except ImportError:
+    from gemini_async import BatchJob, GeminiAPIError, file_part, generate_request, text_part
+    from pdf_analyze import PDFAnalyzer, ANALYSIS_PROMPT, SYSTEM_INSTRUCTION, TEXT_ANALYSIS_PROMPT
+    from pdf_document import PDFDocumentSession
+    from rate_limiter import is_rate_limit_error, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = Path('.cache') / 'batch_jobs.sqlite'
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_POLL_INTERVAL = 60.0
+# Inline batch requests are limited to 20 MB per job
+MAX_BATCH_BYTES = 19 * 1024 * 1024
+# Pause before retrying a rejected job creation when the server sends no retry hint
+CREATE_RETRY_BACKOFF = 30.0
+
+REQUEST_PENDING = 'pending'
+REQUEST_DONE = 'done'
+REQUEST_FAILED = 'failed'
+
+# Called with the PDF a request was built from and the name save_analysis gave it
+ResultCallback = Callable[[Path, str], Awaitable[None]]
+
+@dataclass
+class BatchRequest:
+    """One paper inside a batch job."""
+    job_name: str
+    key: str
+    pdf_path: Path
+    pdf_sha256: str
+    cache_key: str
+
+@dataclass
+class BatchStats:
+    """What a batch run did."""
+    submitted: int = 0
+    jobs: int = 0
+    completed: int = 0
+    cached: int = 0
+    failed: int = 0
+
+class BatchJobStore:
+    """SQLite record of submitted batch jobs and the PDFs behind their requests."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Initialize the store. Defaults to BATCH_JOBS_PATH or .cache/batch_jobs.sqlite."""
+        self.path = Path(path or os.getenv('BATCH_JOBS_PATH') or DEFAULT_STORE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                name TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                state TEXT NOT NULL,
+                request_count INTEGER NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS requests (
+                job_name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                pdf_path TEXT NOT NULL,
+                pdf_sha256 TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (job_name, key)
+            );
+            CREATE INDEX IF NOT EXISTS requests_status ON requests (status, pdf_sha256);
+        """)
+        self._conn.commit()
+
+    def add_job(self, name: str, model: str, state: str, requests: List[BatchRequest]):
+        """Record a submitted job and its requests."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (name, model, state, request_count, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (name, model, state, len(requests), now, now)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO requests "
+                "(job_name, key, pdf_path, pdf_sha256, cache_key, status, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(name, r.key, str(r.pdf_path), r.pdf_sha256, r.cache_key, REQUEST_PENDING, now) for r in requests]
+            )
+
+    def set_state(self, name: str, state: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET state = ?, updated = ? WHERE name = ?", (state, time.time(), name))
+
+    def open_jobs(self) -> List[str]:
+        """Jobs that still have requests waiting for a result, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM jobs WHERE EXISTS "
+                "(SELECT 1 FROM requests WHERE job_name = jobs.name AND status = ?) ORDER BY created",
+                (REQUEST_PENDING,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def pending_requests(self, job_name: str) -> Dict[str, BatchRequest]:
+        """Requests of a job still waiting for a result, by key."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_name, key, pdf_path, pdf_sha256, cache_key FROM requests "
+                "WHERE job_name = ? AND status = ?", (job_name, REQUEST_PENDING)
+            ).fetchall()
+        return {row[1]: BatchRequest(row[0], row[1], Path(row[2]), row[3], row[4]) for row in rows}
+
+    def pending_hashes(self) -> set:
+        """Content hashes of PDFs in open jobs, which must not be submitted again."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT pdf_sha256 FROM requests WHERE status = ?", (REQUEST_PENDING,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def finish_request(self, job_name: str, key: str, error: Optional[str] = None):
+        """Mark a request done, or failed with `error`, so the PDF can be submitted again."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE requests SET status = ?, error = ?, updated = ? WHERE job_name = ? AND key = ?",
+                (REQUEST_FAILED if error else REQUEST_DONE, error, time.time(), job_name, key)
+            )
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+class BatchAnalyzer:
+    """Submit analyses as batch jobs and save their results as the jobs finish."""
+
+    def __init__(self, analyzer: PDFAnalyzer, store: Optional[BatchJobStore] = None,
+                 batch_size: Optional[int] = None, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 locate: Optional[Callable[[str], Optional[Path]]] = None):
+        """
+        Initialize the batch analyzer.
+
+        Args:
+            analyzer: Builds the requests (text or upload, per its analysis mode) and saves the results
+            store: Job store (default BATCH_JOBS_PATH)
+            batch_size: Maximum papers per job (default GEMINI_BATCH_SIZE or 200)
+            poll_interval: Seconds between job state checks
+            locate: Finds a PDF by content hash when it has moved since it was submitted
+        """
+        self.analyzer = analyzer
+        self.store = store or BatchJobStore()
+        self.batch_size = batch_size or int(os.getenv('GEMINI_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self.poll_interval = poll_interval
+        self.locate = locate
+
+    async def _build_request(self, pdf_path: Path, on_result: Optional[ResultCallback],
+                             stats: BatchStats) -> Optional[Tuple[BatchRequest, Dict[str, Any]]]:
+        """The request body for a PDF, or None if the analysis was cached or the PDF could not be read."""
+        analyzer = self.analyzer
+        try:
+            with PDFDocumentSession(pdf_path) as session:
+                pdf_hash, cache_key, cached = await asyncio.to_thread(analyzer.cache_lookup, pdf_path, session)
+                paper = None
+                if cached is None:
+                    paper = await asyncio.to_thread(analyzer.prepare_text, pdf_path, session)
+                    if paper is not None:
+                        cache_key = analyzer.text_cache_key(pdf_hash)
+                        cached = await asyncio.to_thread(analyzer.cache.get, cache_key)
+                if cached is not None:
+                    logger.info(f"Using cached analysis for {pdf_path.name}")
+                    _, new_name = await asyncio.to_thread(analyzer.save_analysis, pdf_path, cached)
+                    stats.cached += 1
+                    if on_result:
+                        await on_result(pdf_path, new_name)
+                    return None
+
+                if paper is not None:
+                    parts = [text_part(TEXT_ANALYSIS_PROMPT), text_part(paper.text)]
+                else:
+                    pdf_file = await analyzer.ensure_uploaded_async(pdf_path, pdf_hash, session)
+                    parts = [file_part(pdf_file), text_part(ANALYSIS_PROMPT)]
+        except Exception as e:
+            logger.error(f"Could not prepare {pdf_path.name} for batch analysis: {e}")
+            stats.failed += 1
+            return None
+
+        request = BatchRequest('', pdf_hash, pdf_path, pdf_hash, cache_key)
+        return request, generate_request(parts, SYSTEM_INSTRUCTION)
+
+    async def submit(self, pdf_paths: List[Path], on_result: Optional[ResultCallback] = None,
+                     stats: Optional[BatchStats] = None) -> BatchStats:
+        """
+        Build requests for the PDFs and submit them as batch jobs of up to `batch_size` papers.
+
+        PDFs already waiting in an open job are left out; cached analyses are saved right away.
+        """
+        stats = stats or BatchStats()
+        pending = await asyncio.to_thread(self.store.pending_hashes)
+        semaphore = asyncio.Semaphore(self.analyzer.max_async_concurrency)
+
+        async def build(pdf_path: Path):
+            async with semaphore:
+                return await self._build_request(pdf_path, on_result, stats)
+
+        for start in range(0, len(pdf_paths), self.batch_size):
+            built = await asyncio.gather(*(build(p) for p in pdf_paths[start:start + self.batch_size]))
+            group, size = [], 0
+            for item in built:
+                if item is None or item[0].pdf_sha256 in pending:
+                    continue
+                pending.add(item[0].pdf_sha256)
+                item_size = len(json.dumps(item[1]))
+                if group and size + item_size > MAX_BATCH_BYTES:
+                    await self._create_job(group, stats)
+                    group, size = [], 0
+                group.append(item)
+                size += item_size
+            if group:
+                await self._create_job(group, stats)
+        return stats
+
+    async def _create_job(self, group: List[Tuple[BatchRequest, Dict[str, Any]]], stats: BatchStats):
+        """
+        Create a batch job for the group, retrying rate limits and server errors.
+
+        If the job still cannot be created, its papers are counted as failed and
+        left out of the store, so a later run submits them again.
+        """
+        client = self.analyzer.get_async_client()
+        display_name = f"analysis-{time.strftime('%Y%m%d-%H%M%S')}-{len(group)}"
+        retries = self.analyzer.max_rate_limit_retries
+        for attempt in range(retries):
+            try:
+                job = await client.create_batch(self.analyzer.model_name, [(r.key, body) for r, body in group],
+                                                display_name)
+                break
+            except GeminiAPIError as e:
+                if not (is_rate_limit_error(e) or e.code >= 500) or attempt == retries - 1:
+                    logger.error(f"Could not create a batch job for {len(group)} papers: {e}")
+                    stats.failed += len(group)
+                    return
+                wait = retry_after_seconds(e) or (attempt + 1) * CREATE_RETRY_BACKOFF
+                logger.warning(f"Batch job creation rejected (attempt {attempt + 1}/{retries}): {e}; "
+                               f"retrying in {wait:.0f}s...")
+                await asyncio.sleep(wait)
+
+        requests = [BatchRequest(job.name, r.key, r.pdf_path, r.pdf_sha256, r.cache_key) for r, _ in group]
+        await asyncio.to_thread(self.store.add_job, job.name, self.analyzer.model_name, job.state, requests)
+        stats.submitted += len(requests)
+        stats.jobs += 1
+        logger.info(f"Submitted batch job {job.name} with {len(requests)} papers")
+
+    def _resolve(self, request: BatchRequest) -> Optional[Path]:
+        """The PDF a request was built from, following it if it has moved."""
+        if request.pdf_path.exists():
+            return request.pdf_path
+        return self.locate(request.pdf_sha256) if self.locate else None
+
+    async def _collect(self, job: BatchJob, on_result: Optional[ResultCallback], stats: BatchStats):
+        """Save the results of a finished job."""
+        requests = await asyncio.to_thread(self.store.pending_requests, job.name)
+        for key, request in requests.items():
+            result = job.results.get(key)
+            if result is None:
+                error = f"no result ({job.state})"
+            elif isinstance(result, GeminiAPIError):
+                error = str(result)
+            else:
+                error = None
+
+            pdf_path = self._resolve(request) if error is None else None
+            if error is None and pdf_path is None:
+                error = f"{request.pdf_path.name} is no longer available"
+            if error is None:
+                try:
+                    analysis, new_name = await asyncio.to_thread(self.analyzer.save_analysis, pdf_path, result.text)
+                    await asyncio.to_thread(self.analyzer.cache_store, request.pdf_sha256, request.cache_key,
+                                            result.text, analysis)
+                except Exception as e:
+                    error = f"could not save analysis: {e}"
+
+            await asyncio.to_thread(self.store.finish_request, job.name, key, error)
+            if error:
+                logger.error(f"❌ Batch analysis failed for {request.pdf_path.name}: {error}")
+                stats.failed += 1
+                continue
+            stats.completed += 1
+            logger.info(f"✅ Batch analysis saved for {new_name}")
+            if on_result:
+                await on_result(pdf_path, new_name)
+
+    async def poll(self, on_result: Optional[ResultCallback] = None,
+                   stats: Optional[BatchStats] = None) -> int:
+        """
+        Check every open job once and save the results of those that finished.
+
+        Returns:
+            Number of jobs still running
+        """
+        stats = stats or BatchStats()
+        client = self.analyzer.get_async_client()
+        running = 0
+        for name in await asyncio.to_thread(self.store.open_jobs):
+            try:
+                job = await client.get_batch(name)
+            except GeminiAPIError as e:
+                if e.code != 404:
+                    logger.warning(f"Could not check batch job {name}: {e}")
+                    running += 1
+                    continue
+                # The job is gone; its papers can be submitted again
+                job = BatchJob(name, 'BATCH_STATE_EXPIRED')
+            await asyncio.to_thread(self.store.set_state, name, job.state)
+            if job.done:
+                logger.info(f"Batch job {name} finished: {job.state}")
+                await self._collect(job, on_result, stats)
+            else:
+                running += 1
+        return running
+
+    async def run(self, pdf_paths: List[Path], on_result: Optional[ResultCallback] = None) -> BatchStats:
+        """
+        Submit the PDFs, then poll until every open job, including ones from earlier runs, has finished.
+        """
+        stats = BatchStats()
+        if pdf_paths:
+            await self.submit(pdf_paths, on_result, stats)
+        while await self.poll(on_result, stats):
+            logger.info(f"Waiting for batch jobs ({stats.completed} analyses saved so far)...")
+            await asyncio.sleep(self.poll_interval)
+        logger.info(f"Batch analysis finished: {stats.submitted} submitted in {stats.jobs} jobs, "
+                    f"{stats.completed} saved, {stats.cached} from cache, {stats.failed} failed")
+        return stats
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Analyze PDFs through Gemini batch jobs')
+    parser.add_argument('files', nargs='*', help='PDFs to analyze (default: everything in sources_pdf/)')
+    parser.add_argument('--resume', action='store_true', help='Only wait for jobs submitted earlier')
+    parser.add_argument('--batch-size', type=int, help='Maximum papers per batch job')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between job state checks')
+    parser.add_argument('--mode', choices=['pdf', 'text'], help='Analysis mode (default GEMINI_ANALYSIS_MODE)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable is not set")
+
+    analyzer = PDFAnalyzer(api_key, analysis_mode=args.mode)
+    if args.resume:
+        pdf_paths = []
+    elif args.files:
+        pdf_paths = [Path(f) for f in args.files]
+    else:
+        pdf_paths = sorted(analyzer.source_dir.glob('*.pdf'))
+    batch = BatchAnalyzer(analyzer, batch_size=args.batch_size, poll_interval=args.poll_interval)
+
+    async def run():
+        try:
+            await batch.run(pdf_paths)
+        finally:
+            await analyzer.close_async()
+
+    try:
+        asyncio.run(run())
+    finally:
+        batch.store.close()
+
+if __name__ == "__main__":
+    main()
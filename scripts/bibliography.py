@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Merge the per-paper analyses into one bibliography, sources_xml/sources.xml.
+
+Entries are built from the analysis index rather than by re-reading every
+analysis file, and each carries a digest of its contents. An update streams
+the existing file line by line, copies unchanged entries through verbatim,
+renders only new or changed ones, drops removed ones, and atomically replaces
+the file. Nothing is written when no entry changed.
+"""
+
+import argparse
+import logging
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple, Union
+from xml.sax.saxutils import escape, unescape
+
+try:
+    from scripts.analysis_index import AnalysisIndex, Author, PaperRecord, parse_author
+    from scripts.hashing import sha256_text
+except ImportError:
+    from analysis_index import AnalysisIndex, Author, PaperRecord, parse_author
+    from hashing import sha256_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = Path('sources_xml') / 'sources.xml'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<sources>\n'
+XML_FOOTER = '</sources>\n'
+
+# Opening line of an entry as written by render_entry
+ENTRY_START = re.compile(r'^  <source id="([^"]*)" digest="([0-9a-f]{64})">$')
+ENTRY_END = '  </source>\n'
+
+@dataclass
+class BibEntry:
+    """Bibliographic fields of one paper."""
+    id: str
+    title: str = ''
+    authors: List[Author] = field(default_factory=list)
+    year: Optional[int] = None
+    abstract: str = ''
+    analysis: str = ''
+
+    @classmethod
+    def from_record(cls, record: PaperRecord) -> 'BibEntry':
+        authors = [parse_author(name) for name in record.authors]
+        return cls(record.name, record.title, [a for a in authors if a], record.year,
+                   record.fields.get('abstract', ''), record.path)
+
+    @property
+    def digest(self) -> str:
+        parts = [self.id, self.title, str(self.year or ''), self.abstract, self.analysis]
+        for author in self.authors:
+            parts += [author.last, author.first]
+        return sha256_text(*parts)
+
+@dataclass
+class MergeStats:
+    """What an update changed."""
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+def render_entry(entry: BibEntry, digest: Optional[str] = None) -> str:
+    """Serialize one entry; the first and last lines are what ENTRY_START and ENTRY_END match."""
+    entry_id = escape(entry.id, {'"': '&quot;'})
+    lines = [f'  <source id="{entry_id}" digest="{digest or entry.digest}">']
+    if entry.title:
+        lines.append(f'    <title>{escape(entry.title)}</title>')
+    if entry.authors:
+        lines.append('    <authors>')
+        for author in entry.authors:
+            first = f'<first>{escape(author.first)}</first>' if author.first else ''
+            lines.append(f'      <author><last>{escape(author.last)}</last>{first}</author>')
+        lines.append('    </authors>')
+    if entry.year:
+        lines.append(f'    <year>{entry.year}</year>')
+    if entry.abstract:
+        lines.append(f'    <abstract>{escape(entry.abstract)}</abstract>')
+    if entry.analysis:
+        lines.append(f'    <analysis>{escape(entry.analysis)}</analysis>')
+    return '\n'.join(lines) + '\n' + ENTRY_END
+
+def read_entries(handle: TextIO) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Stream (id, digest, lines) for each entry of a file written by render_entry.
+
+    Raises ValueError on anything else, so a hand-edited or foreign file is rebuilt
+    from scratch instead of being partially copied.
+    """
+    lines = iter(handle)
+    if ''.join(next(lines, '') for _ in range(2)) != XML_HEADER:
+        raise ValueError("unexpected header")
+    for line in lines:
+        if line == XML_FOOTER:
+            return
+        match = ENTRY_START.match(line.rstrip('\n'))
+        if not match:
+            raise ValueError(f"unexpected line: {line[:80]!r}")
+        body = [line]
+        for line in lines:
+            body.append(line)
+            if line == ENTRY_END:
+                break
+        else:
+            raise ValueError("truncated entry")
+        yield unescape(match.group(1), {'&quot;': '"'}), match.group(2), body
+    raise ValueError("missing </sources>")
+
+class Bibliography:
+    """Keeps sources.xml in step with the analysis index."""
+
+    def __init__(self, index: AnalysisIndex, output_path: Union[str, Path] = DEFAULT_OUTPUT):
+        """
+        Initialize the builder.
+
+        Args:
+            index: Analysis index the entries are read from
+            output_path: Bibliography file to maintain
+        """
+        self.index = index
+        self.output_path = Path(output_path)
+        # Digests of the entries currently in the file, once known, and the index
+        # state they were built from; lets a no-op update skip reading the file
+        self._written: Optional[Dict[str, str]] = None
+        self._index_state: Optional[Tuple[int, float]] = None
+        # Serializes updates, e.g. a periodic refresh and a final one on shutdown
+        self._lock = threading.Lock()
+
+    def _current_entries(self) -> Dict[str, BibEntry]:
+        return {record.name: BibEntry.from_record(record) for record in self.index.query()}
+
+    def _existing_digests(self) -> Optional[Dict[str, str]]:
+        """Digests of the entries in the file, or None if it is missing or not in the expected format."""
+        if not self.output_path.exists() or self.output_path.stat().st_size == 0:
+            return None
+        try:
+            with open(self.output_path, encoding='utf-8') as f:
+                return {entry_id: digest for entry_id, digest, _ in read_entries(f)}
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"Rebuilding {self.output_path}: {e}")
+            return None
+
+    def update(self, force: bool = False) -> MergeStats:
+        """
+        Merge changed analyses into the bibliography.
+
+        Args:
+            force: Rewrite the file even if the index has not changed since the last update
+
+        Returns:
+            Counts of added, updated, removed and unchanged entries
+        """
+        with self._lock:
+            state = self.index.last_modified()
+            if not force and self._written is not None and state == self._index_state \
+                    and self.output_path.exists():
+                return MergeStats(unchanged=len(self._written))
+
+            current = self._current_entries()
+            existing = None if force else (self._written if self._written is not None else self._existing_digests())
+            digests = {entry_id: entry.digest for entry_id, entry in current.items()}
+
+            if existing is not None and existing == digests and self.output_path.exists():
+                stats = MergeStats(unchanged=len(digests))
+            else:
+                stats = self._write(current, digests, existing)
+                logger.info(f"Bibliography {self.output_path}: {stats.added} added, {stats.updated} updated, "
+                            f"{stats.removed} removed, {stats.unchanged} unchanged")
+
+            self._written = digests
+            self._index_state = state
+            return stats
+
+    def _write(self, current: Dict[str, BibEntry], digests: Dict[str, str],
+               existing: Optional[Dict[str, str]]) -> MergeStats:
+        """Stream the old file into a new one, replacing only entries whose digest changed."""
+        stats = MergeStats()
+        pending = sorted(current)
+        position = 0
+        emitted = set()
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.output_path.parent, prefix=f".{self.output_path.name}.",
+                                         suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                out.write(XML_HEADER)
+
+                def emit_new_until(limit: Optional[str]):
+                    nonlocal position
+                    while position < len(pending) and (limit is None or pending[position] < limit):
+                        entry_id = pending[position]
+                        position += 1
+                        if entry_id not in emitted:
+                            emitted.add(entry_id)
+                            out.write(render_entry(current[entry_id], digests[entry_id]))
+                            stats.added += 1
+
+                if existing is not None:
+                    try:
+                        with open(self.output_path, encoding='utf-8') as old:
+                            for entry_id, digest, lines in read_entries(old):
+                                # Both sides are sorted by id, so this is a merge join
+                                emit_new_until(entry_id)
+                                if entry_id not in current or entry_id in emitted:
+                                    stats.removed += entry_id not in current
+                                    continue
+                                emitted.add(entry_id)
+                                if digest == digests[entry_id]:
+                                    out.writelines(lines)
+                                    stats.unchanged += 1
+                                else:
+                                    out.write(render_entry(current[entry_id], digests[entry_id]))
+                                    stats.updated += 1
+                    except (OSError, ValueError) as e:
+                        # The file changed under us; what was copied so far is still valid
+                        logger.warning(f"Stopped reading {self.output_path}: {e}")
+
+                emit_new_until(None)
+                out.write(XML_FOOTER)
+                out.flush()
+                os.fsync(out.fileno())
+
+            os.replace(temp_name, self.output_path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+        return stats
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Merge analyses into sources_xml/sources.xml')
+    parser.add_argument('-d', '--analysis-dir', default='sources_analysis', help='Analysis XML directory')
+    parser.add_argument('-o', '--output', default=str(DEFAULT_OUTPUT), help='Bibliography file')
+    parser.add_argument('--force', action='store_true', help='Rewrite every entry')
+    args = parser.parse_args()
+
+    index = AnalysisIndex()
+    try:
+        index.sync(args.analysis_dir)
+        Bibliography(index, args.output).update(force=args.force)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
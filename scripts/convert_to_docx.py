@@ -6,9 +6,9 @@ Handles bullet points, images, tables, and citations consistently.
 
 import os
 import sys
+import json
 import argparse
 import warnings
-import panflute as pf
 from pathlib import Path
 import subprocess
 import tempfile
@@ -18,9 +18,16 @@ from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.style import WD_STYLE_TYPE
-from docx.oxml import parse_xml
-from docx.oxml.ns import nsdecls
 from docx.enum.table import WD_TABLE_ALIGNMENT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+try:
+    from scripts.hashing import sha256_file, sha256_text
+    from scripts.docx_sections import SectionBuilder
+except ImportError:
+    from hashing import sha256_file, sha256_text
+    from docx_sections import SectionBuilder
 
 # Configure logging
 logging.basicConfig(
@@ -32,11 +39,185 @@ logger = logging.getLogger(__name__)
 
 warnings.filterwarnings('ignore', category=UserWarning, module='docx')
 
+# Page size and margins of the reference document, in inches
+PAGE_SETUP = {
+    'page_width': 8.5,
+    'page_height': 11,
+    'top_margin': 0.25,
+    'bottom_margin': 0.25,
+    'left_margin': 0.25,
+    'right_margin': 0.25,
+}
+
+# Font applied to every paragraph style
+BASE_FONT = 'Times New Roman'
+
+# Paragraph style overrides: sizes and spacing in points, indents in inches. Styles missing
+# from pandoc's reference document are created, based on `base` (default Normal). The Lua
+# filter assigns the custom ones (see FILTER_PATH)
+PARAGRAPH_STYLES = {
+    'Heading 1': {'size': 16, 'bold': True, 'space_before': 36, 'space_after': 18, 'alignment': 'CENTER'},
+    'Heading 2': {'size': 14, 'bold': True, 'space_before': 30, 'space_after': 12},
+    'Heading 3': {'size': 12, 'bold': True, 'space_before': 24, 'space_after': 10},
+    'Normal': {'size': 12, 'alignment': 'JUSTIFY', 'space_before': 12, 'space_after': 12},
+    'List Bullet': {'size': 12, 'left_indent': 0.15, 'first_line_indent': -0.15, 'space_before': 0, 'space_after': 0},
+    'Caption': {'size': 10, 'italic': True, 'alignment': 'CENTER', 'space_before': 6, 'space_after': 12},
+    'Table Caption': {'size': 10, 'italic': False, 'alignment': 'LEFT', 'space_before': 12, 'space_after': 6},
+    'Table Note': {'base': 'Caption', 'alignment': 'LEFT'},
+    'Table Text': {'base': 'Compact', 'size': 10, 'alignment': 'CENTER'},
+    'Table Header': {'base': 'Table Text', 'bold': True},
+}
+
+# The "Table" style pandoc gives every table: centered, fixed layout, single borders
+TABLE_STYLE = {
+    'name': 'Table',
+    'alignment': 'CENTER',
+    'autofit': False,
+    'border': {'val': 'single', 'sz': 4, 'space': 0, 'color': '000000'},
+}
+
+# Lua filter that assigns the custom styles during the pandoc pass
+FILTER_PATH = Path(__file__).resolve().parent / 'filters' / 'academic_format.lua'
+
+# Bump when build_reference_doc changes how the configuration is applied
+REFERENCE_FORMAT_VERSION = 2
+
+DEFAULT_REFERENCE_CACHE_DIR = Path('.cache') / 'docx'
+
+def pandoc_fingerprint() -> str:
+    """
+    Identify the installed pandoc without running it.
+
+    The resolved executable's path, size and modification time change whenever pandoc
+    is upgraded, which is what matters for its default reference.docx.
+    """
+    executable = shutil.which("pandoc")
+    if executable is None:
+        raise FileNotFoundError("pandoc is not installed")
+    executable = os.path.realpath(executable)
+    stat = os.stat(executable)
+    return f"{executable}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def reference_doc_key() -> str:
+    """Hash of the style configuration and the pandoc installation."""
+    config = json.dumps({'page': PAGE_SETUP, 'font': BASE_FONT, 'styles': PARAGRAPH_STYLES, 'table': TABLE_STYLE},
+                        sort_keys=True)
+    return sha256_text('reference.docx', str(REFERENCE_FORMAT_VERSION), config, pandoc_fingerprint())
+
+def build_reference_doc(path: Path):
+    """Write pandoc's default reference.docx to `path` with the configured page setup and styles."""
+    logger.info("Creating reference document with custom styles...")
+
+    # Create default reference doc
+    logger.debug("Generating default reference.docx template")
+    subprocess.run(["pandoc", "-o", str(path), "--print-default-data-file", "reference.docx"], check=True)
+
+    # Configure styles
+    logger.info("Configuring document styles...")
+    doc = Document(path)
+
+    # Set page dimensions and margins
+    logger.debug("Setting page dimensions and margins")
+    for section in doc.sections:
+        for attribute, inches in PAGE_SETUP.items():
+            setattr(section, attribute, Inches(inches))
+
+    # Add the custom styles, in order, so each one's base exists
+    for name, settings in PARAGRAPH_STYLES.items():
+        if name not in doc.styles:
+            style = doc.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+            style.base_style = doc.styles[settings.get('base', 'Normal')]
+            style.quick_style = True
+
+    # Configure styles
+    logger.debug("Configuring paragraph styles")
+    style_count = 0
+    for style in doc.styles:
+        if style.type == WD_STYLE_TYPE.PARAGRAPH and hasattr(style, 'font'):
+            style.font.name = BASE_FONT
+            style_count += 1
+
+            settings = PARAGRAPH_STYLES.get(style.name)
+            if not settings:
+                continue
+            logger.debug(f"Configuring {style.name} style")
+            if 'size' in settings:
+                style.font.size = Pt(settings['size'])
+            if 'bold' in settings:
+                style.font.bold = settings['bold']
+            if 'italic' in settings:
+                style.font.italic = settings['italic']
+            paragraph_format = style.paragraph_format
+            if 'alignment' in settings:
+                paragraph_format.alignment = getattr(WD_ALIGN_PARAGRAPH, settings['alignment'])
+            for attribute in ('space_before', 'space_after'):
+                if attribute in settings:
+                    setattr(paragraph_format, attribute, Pt(settings[attribute]))
+            for attribute in ('left_indent', 'first_line_indent'):
+                if attribute in settings:
+                    setattr(paragraph_format, attribute, Inches(settings[attribute]))
+
+    logger.info(f"Configured {style_count} paragraph styles")
+    configure_table_style(doc)
+    doc.save(path)
+    logger.info("Reference document created successfully")
+
+def configure_table_style(doc: Document):
+    """Give the reference document's table style the configured alignment, layout and borders."""
+    style = doc.styles[TABLE_STYLE['name']].element
+    tblPr = style.find(qn('w:tblPr'))
+    if tblPr is None:
+        tblPr = parse_xml(f'<w:tblPr {nsdecls("w")}/>')
+        style.insert_element_before(tblPr, 'w:trPr', 'w:tcPr', 'w:tblStylePr')
+    tblPr.alignment = getattr(WD_TABLE_ALIGNMENT, TABLE_STYLE['alignment'])
+    tblPr.autofit = TABLE_STYLE['autofit']
+
+    border = ' '.join(f'w:{key}="{value}"' for key, value in TABLE_STYLE['border'].items())
+    borders = parse_xml(f'<w:tblBorders {nsdecls("w")}>'
+                        + ''.join(f'<w:{side} {border}/>' for side in
+                                  ('top', 'left', 'bottom', 'right', 'insideH', 'insideV'))
+                        + '</w:tblBorders>')
+    for existing in tblPr.findall(qn('w:tblBorders')):
+        tblPr.remove(existing)
+    tblPr.insert_element_before(borders, 'w:shd', 'w:tblLayout', 'w:tblCellMar', 'w:tblLook',
+                                'w:tblCaption', 'w:tblDescription', 'w:tblPrChange')
+
+def docx_cache_dir() -> Path:
+    """Directory for the cached reference document and section builds (DOCX_REFERENCE_CACHE_DIR)."""
+    return Path(os.getenv('DOCX_REFERENCE_CACHE_DIR') or DEFAULT_REFERENCE_CACHE_DIR)
+
+def get_reference_doc(cache_dir=None) -> Path:
+    """
+    Path of the configured reference document, built once and reused across runs and documents.
+
+    Cached under DOCX_REFERENCE_CACHE_DIR (default .cache/docx), keyed by reference_doc_key(),
+    so changing the style configuration or upgrading pandoc builds a new one.
+    """
+    cache_dir = Path(cache_dir or docx_cache_dir())
+    path = cache_dir / f"reference-{reference_doc_key()[:16]}.docx"
+    if path.exists():
+        logger.info(f"Using cached reference document: {path}")
+        return path
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Build beside the final name and rename, so concurrent conversions never see a partial file
+    fd, temp_name = tempfile.mkstemp(dir=cache_dir, prefix='.reference-', suffix='.docx')
+    os.close(fd)
+    try:
+        build_reference_doc(Path(temp_name))
+        os.replace(temp_name, path)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    return path
+
 class DocumentConverter:
-    def __init__(self, input_file, output_file, reference_file=None):
+    def __init__(self, input_file, output_file, reference_file=None, incremental=False, workers=None):
         self.input_file = Path(input_file)
         self.output_file = Path(output_file)
         self.reference_file = Path(reference_file) if reference_file else None
+        self.incremental = incremental
+        self.workers = workers
         self.root_dir = self.input_file.parent
         self.media_dir = self.root_dir / "media"
         logger.info(f"Initializing conversion: {self.input_file} → {self.output_file}")
@@ -44,300 +225,87 @@ class DocumentConverter:
             logger.info(f"Using reference file: {self.reference_file}")
 
     def create_reference_doc(self):
-        """Create and configure reference document with proper styles."""
-        logger.info("Creating reference document with custom styles...")
-        
-        # Create default reference doc
-        logger.debug("Generating default reference.docx template")
-        subprocess.run(["pandoc", "-o", str(self.reference_file), "--print-default-data-file", "reference.docx"], check=True)
-
-        # Configure styles
-        logger.info("Configuring document styles...")
-        doc = Document(self.reference_file)
-
-        # Set page dimensions and margins
-        logger.debug("Setting page dimensions and margins")
-        for section in doc.sections:
-            section.page_width = Inches(8.5)
-            section.page_height = Inches(11)
-            section.top_margin = Inches(0.25)
-            section.bottom_margin = Inches(0.25)
-            section.left_margin = Inches(0.25)
-            section.right_margin = Inches(0.25)
-
-        # Configure styles
-        logger.debug("Configuring paragraph styles")
-        style_count = 0
-        for style in doc.styles:
-            if style.type == WD_STYLE_TYPE.PARAGRAPH:
-                if hasattr(style, 'font'):
-                    style.font.name = 'Times New Roman'
-                    style_count += 1
-                    
-                    if style.name == 'Heading 1':
-                        logger.debug("Configuring Heading 1 style")
-                        style.font.size = Pt(16)
-                        style.font.bold = True
-                        style.paragraph_format.space_before = Pt(36)
-                        style.paragraph_format.space_after = Pt(18)
-                        style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    elif style.name == 'Heading 2':
-                        logger.debug("Configuring Heading 2 style")
-                        style.font.size = Pt(14)
-                        style.font.bold = True
-                        style.paragraph_format.space_before = Pt(30)
-                        style.paragraph_format.space_after = Pt(12)
-                    elif style.name == 'Heading 3':
-                        logger.debug("Configuring Heading 3 style")
-                        style.font.size = Pt(12)
-                        style.font.bold = True
-                        style.paragraph_format.space_before = Pt(24)
-                        style.paragraph_format.space_after = Pt(10)
-                    elif style.name == 'Normal':
-                        logger.debug("Configuring Normal style")
-                        style.font.size = Pt(12)
-                        style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                        style.paragraph_format.space_before = Pt(12)
-                        style.paragraph_format.space_after = Pt(12)
-                    elif style.name == 'List Bullet':
-                        logger.debug("Configuring List Bullet style")
-                        style.font.size = Pt(12)
-                        style.paragraph_format.left_indent = Inches(0.15)
-                        style.paragraph_format.first_line_indent = Inches(-0.15)
-                        style.paragraph_format.space_before = Pt(0)
-                        style.paragraph_format.space_after = Pt(0)
-                    elif style.name == 'Caption':
-                        logger.debug("Configuring Caption style")
-                        style.font.size = Pt(10)
-                        style.font.italic = True
-                        style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        style.paragraph_format.space_before = Pt(6)
-                        style.paragraph_format.space_after = Pt(12)
-
-        logger.info(f"Configured {style_count} paragraph styles")
-        doc.save(self.reference_file)
-        logger.info("Reference document created successfully")
+        """Point the conversion at the cached reference document, building it if needed."""
+        self.reference_file = get_reference_doc()
 
     def prepare_environment(self):
-        """Prepare temporary directories and files."""
+        """Check the input and make sure the media directory and reference document exist."""
         logger.info("Preparing environment...")
-        
+
         if not self.input_file.exists():
             logger.error(f"Input file not found: {self.input_file}")
             raise FileNotFoundError(f"Input file not found: {self.input_file}")
-        
+
         # Create media directory if it doesn't exist
         self.media_dir.mkdir(exist_ok=True)
         logger.debug(f"Media directory ready: {self.media_dir}")
-        
-        # Create a temporary directory for processing
-        self.temp_dir = Path(tempfile.mkdtemp())
-        self.temp_file = self.temp_dir / self.input_file.name
-        logger.debug(f"Created temporary directory: {self.temp_dir}")
 
-        # Create reference doc if needed
+        # Use the cached reference doc if none was given
         if not self.reference_file:
-            self.reference_file = self.temp_dir / "reference.docx"
-            logger.info("No reference file provided, creating default")
+            logger.info("No reference file provided, using default")
             self.create_reference_doc()
 
-    def process_markdown(self):
-        """Process markdown file to ensure proper formatting."""
-        logger.info("Processing markdown content...")
-        
-        with open(self.input_file, 'r') as f:
-            content = f.read()
-            logger.debug(f"Read {len(content)} characters from input file")
-
-        # Count and log occurrences of different elements
-        image_count = content.count('<img src=')  
-        table_count = content.count('|---')
-        bullet_count = len([line for line in content.split('\n') if line.strip().startswith(('•', '-', '*'))])
-        
-        logger.info(f"Found in document: {image_count} images, {table_count} tables, {bullet_count} bullet points")
-
-        # Convert bullet points to asterisks
-        content = content.replace('•', '*')
-        content = content.replace('  -', '  *')
-        
-        # Process images to ensure proper rendering
-        lines = content.split('\n')
-        processed_lines = []
-        in_div = False
-        
-        for line in lines:
-            if '<div' in line:
-                in_div = True
-                continue
-            elif '</div>' in line:
-                in_div = False
-                continue
-            elif '<img' in line and 'src=' in line:
-                # Extract image path and alt text
-                src = line[line.find('src="')+5:line.find('" alt=')]
-                alt = line[line.find('alt="')+5:line.rfind('"')]
-                # Convert to markdown image syntax
-                processed_lines.append(f'![{alt}]({src})')
-            else:
-                processed_lines.append(line)
-        
-        content = '\n'.join(processed_lines)
-        
-        with open(self.temp_file, 'w') as f:
-            f.write(content)
-        logger.info("Markdown processing complete")
-
-    def apply_final_formatting(self):
-        """Apply final formatting to the output document."""
-        logger.info("Applying final document formatting...")
-        doc = Document(self.output_file)
-
-        # Track formatting statistics
-        stats = {
-            'bullet_points': 0,
-            'figures': 0,
-            'tables': 0,
-            'table_cells': 0
-        }
-
-        # Process paragraphs
-        logger.info("Processing paragraphs and applying styles...")
-        for paragraph in doc.paragraphs:
-            # Handle bullet points (check for both '-' and '•' symbols)
-            if any(paragraph.text.strip().startswith(sym) for sym in ['-', '•', '*']):
-                stats['bullet_points'] += 1
-                paragraph.paragraph_format.left_indent = Inches(0.15)
-                paragraph.paragraph_format.first_line_indent = Inches(-0.15)
-                paragraph.paragraph_format.space_before = Pt(0)
-                paragraph.paragraph_format.space_after = Pt(0)
-
-            # Handle figure captions
-            elif paragraph.text.strip().startswith('*Figure'):
-                stats['figures'] += 1
-                logger.debug(f"Formatting figure caption: {paragraph.text[:50]}...")
-                paragraph.style = doc.styles['Caption']
-                paragraph.paragraph_format.space_before = Pt(6)
-                paragraph.paragraph_format.space_after = Pt(12)
-                paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                for run in paragraph.runs:
-                    run.font.italic = True
-                    run.font.size = Pt(10)
-
-            # Handle table captions
-            elif paragraph.text.strip().startswith('**Table'):
-                paragraph.style = doc.styles['Caption']
-                paragraph.paragraph_format.space_before = Pt(12)
-                paragraph.paragraph_format.space_after = Pt(6)
-                paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                for run in paragraph.runs:
-                    if run.text.startswith('**') and run.text.endswith('**'):
-                        run.text = run.text[2:-2]  # Remove markdown bold markers
-                        run.font.bold = True
-                        run.font.italic = False
-                    run.font.size = Pt(10)
-
-            # Handle table notes
-            elif paragraph.text.strip().startswith('*Note:'):
-                paragraph.style = doc.styles['Caption']
-                paragraph.paragraph_format.space_before = Pt(6)
-                paragraph.paragraph_format.space_after = Pt(12)
-                paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                for run in paragraph.runs:
-                    run.font.italic = True
-                    run.font.size = Pt(10)
-
-        # Process images
-        logger.info("Processing and resizing images...")
-        for shape in doc.inline_shapes:
-            if shape.width > 0:
-                original_width = shape.width
-                desired_width = Inches(6)
-                aspect_ratio = shape.height / shape.width
-                shape.width = desired_width
-                shape.height = int(desired_width * aspect_ratio)
-                logger.debug(f"Resized image from {original_width} to {desired_width} width")
-
-        # Process tables
-        logger.info("Formatting tables...")
-        for table_idx, table in enumerate(doc.tables, 1):
-            stats['tables'] += 1
-            stats['table_cells'] += len(table.rows) * len(table.columns)
-            logger.debug(f"Processing table {table_idx}: {len(table.rows)}x{len(table.columns)}")
-            
-            table.alignment = WD_TABLE_ALIGNMENT.CENTER
-            table.autofit = False
-            table.allow_autofit = False
-            
-            # Format table
-            table_width = Inches(8)
-            table.width = table_width
-            
-            # Process cells
-            for row_idx, row in enumerate(table.rows):
-                for cell in row.cells:
-                    # Set cell borders
-                    tcPr = cell._tc.get_or_add_tcPr()
-                    tcBorders = parse_xml(f'<w:tcBorders {nsdecls("w")}>'
-                                        '<w:top w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
-                                        '<w:left w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
-                                        '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
-                                        '<w:right w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
-                                        '</w:tcBorders>')
-                    tcPr.append(tcBorders)
-
-                    # Format text
-                    for paragraph in cell.paragraphs:
-                        # Center align all cells
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        
-                        for run in paragraph.runs:
-                            run.font.name = 'Times New Roman'
-                            run.font.size = Pt(10)  # Slightly larger than minimum size
-                            
-                            # Make header row bold
-                            if row_idx == 0:
-                                run.font.bold = True
-
-        # Log formatting statistics
-        logger.info("Formatting statistics:")
-        logger.info(f"- Processed {stats['bullet_points']} bullet points")
-        logger.info(f"- Formatted {stats['figures']} figures")
-        logger.info(f"- Processed {stats['tables']} tables with {stats['table_cells']} cells")
-
-        doc.save(self.output_file)
-        logger.info("Final formatting complete")
+    def resource_path(self):
+        """Directories pandoc resolves images against."""
+        return [
+            ".",
+            str(self.root_dir),
+            str(self.root_dir / "sources_png"),
+            str(self.root_dir / "user_illustrations")
+        ]
+
+    def pandoc_command(self, output_file, input_file=None):
+        """Pandoc command line converting `input_file`, or standard input if None, to `output_file`."""
+        cmd = ["pandoc"]
+        if input_file is not None:
+            cmd.append(str(input_file))
+        cmd += [
+            "-f", "markdown+raw_html+raw_tex+raw_attribute+pipe_tables+grid_tables+multiline_tables+simple_tables",
+            "-t", "docx",
+            "--reference-doc", str(self.reference_file),
+            "--lua-filter", str(FILTER_PATH),
+            "--wrap=preserve",
+            "--standalone",
+            "--resource-path", ":".join(self.resource_path()),
+            "--dpi=300",
+            "--verbose",
+            "-o", str(output_file)
+        ]
+        return cmd
+
+    def convert_section(self, text, output_file):
+        """Convert one section's Markdown to its own DOCX."""
+        subprocess.run(self.pandoc_command(output_file), input=text, capture_output=True, text=True, check=True)
+
+    def section_builder(self):
+        """SectionBuilder whose cache key covers pandoc, the reference document, the filter and the command."""
+        salt = sha256_text(pandoc_fingerprint(), sha256_file(self.reference_file), sha256_file(FILTER_PATH),
+                           json.dumps(self.pandoc_command('-')))
+        return SectionBuilder(self.convert_section, docx_cache_dir() / 'sections', salt,
+                              resource_path=[Path(directory) for directory in self.resource_path()],
+                              workers=self.workers)
+
+    def run_incremental(self):
+        """Rebuild only the `##` sections that changed since the last build and merge them."""
+        logger.info("Running incremental section build...")
+        stats = self.section_builder().build(self.input_file.read_text(encoding='utf-8'), self.output_file)
+        logger.info(f"Built {stats.sections} sections ({stats.converted} converted, {stats.cached} cached) "
+                    f"in {stats.seconds:.2f}s")
 
     def run_conversion(self):
         """Execute the conversion process."""
         try:
             logger.info("Starting document conversion process...")
             self.prepare_environment()
-            self.process_markdown()
-
-            # Build resource path
-            resource_path = [
-                ".",
-                str(self.root_dir),
-                str(self.root_dir / "sources_png"),
-                str(self.root_dir / "user_illustrations")
-            ]
-            logger.info(f"Resource paths configured: {resource_path}")
-
-            # Build pandoc command
-            cmd = [
-                "pandoc",
-                str(self.temp_file),
-                "-f", "markdown+raw_html+raw_tex+raw_attribute+pipe_tables+grid_tables+multiline_tables+simple_tables",
-                "-t", "docx",
-                "--reference-doc", str(self.reference_file),
-                "--wrap=preserve",
-                "--standalone",
-                "--resource-path", ":".join(resource_path),
-                "--dpi=300",
-                "--verbose",
-                "-o", str(self.output_file)
-            ]
-            
+            logger.info(f"Resource paths configured: {self.resource_path()}")
+
+            if self.incremental:
+                self.run_incremental()
+                logger.info(f"Successfully converted {self.input_file} to {self.output_file}")
+                return True
+
+            cmd = self.pandoc_command(self.output_file, self.input_file)
+
             logger.info("Running pandoc conversion...")
             logger.debug(f"Command: {' '.join(cmd)}")
 
@@ -352,9 +320,6 @@ class DocumentConverter:
             if result.stderr:
                 logger.debug(f"Pandoc output: {result.stderr}")
 
-            # Apply final formatting
-            self.apply_final_formatting()
-
             logger.info(f"Successfully converted {self.input_file} to {self.output_file}")
             return True
 
@@ -364,20 +329,15 @@ class DocumentConverter:
         except Exception as e:
             logger.error(f"Unexpected error during conversion: {str(e)}")
             return False
-        finally:
-            self.cleanup()
-
-    def cleanup(self):
-        """Clean up temporary files."""
-        logger.info("Cleaning up temporary files...")
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
-        logger.debug(f"Removed temporary directory: {self.temp_dir}")
 
 def main():
     parser = argparse.ArgumentParser(description="Convert Markdown to DOCX with proper academic formatting")
     parser.add_argument("input_file", help="Input Markdown file")
     parser.add_argument("output_file", help="Output DOCX file")
     parser.add_argument("--reference", help="Reference DOCX file for styles")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Convert only the ## sections changed since the last build and merge them")
+    parser.add_argument("--workers", type=int, help="Sections converted in parallel (default: CPU count)")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     args = parser.parse_args()
 
@@ -391,7 +351,9 @@ def main():
     converter = DocumentConverter(
         input_file=args.input_file,
         output_file=args.output_file,
-        reference_file=args.reference
+        reference_file=args.reference,
+        incremental=args.incremental,
+        workers=args.workers
     )
     
     success = converter.run_conversion()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Convert many Markdown drafts to DOCX at once, or serve conversions over a Unix socket.
+
+convert_to_docx.py converts one file per invocation, paying Python startup, the
+python-docx import and the reference document lookup every time. Here the
+reference document is resolved once and shared, and the drafts are converted
+concurrently by a process pool whose workers stay warm between files.
+
+The server mode keeps that pool alive behind a Unix socket so editor integrations
+get a conversion for the cost of one pandoc run. The protocol is one JSON object
+per line each way:
+
+    request:  {"input": "/abs/draft.md", "output": "/abs/draft.docx", "incremental": true}
+    response: {"ok": true, "input": "...", "output": "...", "seconds": 0.41}
+
+"output" is optional (default: the input with a .docx suffix) and relative paths
+are resolved against the server's working directory.
+
+    python scripts/docx_batch.py convert 'drafts/*.md' -o out/
+    python scripts/docx_batch.py serve &
+    python scripts/docx_batch.py send draft.md --incremental
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+try:
+    from scripts.convert_to_docx import DocumentConverter, docx_cache_dir, get_reference_doc
+except ImportError:
+    from convert_to_docx import DocumentConverter, docx_cache_dir, get_reference_doc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+@dataclass
+class ConversionResult:
+    """Outcome of converting one draft."""
+    input: str
+    output: str
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+
+def default_socket_path() -> Path:
+    """Server socket (DOCX_SERVER_SOCKET, default server.sock in the DOCX cache directory)."""
+    return Path(os.getenv('DOCX_SERVER_SOCKET') or docx_cache_dir() / 'server.sock')
+
+def expand_inputs(patterns: Iterable[str]) -> List[Path]:
+    """Markdown files named by paths, directories (their *.md files) and glob patterns, in order, once each."""
+    paths, seen = [], set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [Path(match) for match in sorted(glob.glob(pattern, recursive=True))]
+        elif Path(pattern).is_dir():
+            matches = sorted(Path(pattern).glob('*.md'))
+        else:
+            matches = [Path(pattern)]
+        for path in matches:
+            key = path.resolve()
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+def output_path(input_file: Path, output_dir: Optional[Path] = None) -> Path:
+    """The DOCX for a draft: beside it, or in `output_dir`."""
+    output = input_file.with_suffix('.docx')
+    return output_dir / output.name if output_dir else output
+
+def convert_file(input_file: str, output_file: str, reference_file: str, incremental: bool = False,
+                 section_workers: Optional[int] = None) -> ConversionResult:
+    """Convert one draft with an already resolved reference document. Runs in a pool worker."""
+    started = time.perf_counter()
+    try:
+        converter = DocumentConverter(input_file, output_file, reference_file=reference_file,
+                                      incremental=incremental, workers=section_workers)
+        ok = converter.run_conversion()
+        error = None if ok else "conversion failed; see the log"
+    except Exception as e:
+        ok, error = False, str(e)
+    return ConversionResult(str(input_file), str(output_file), ok, time.perf_counter() - started, error)
+
+def convert_many(inputs: List[Path], output_dir: Optional[Path] = None, workers: int = DEFAULT_WORKERS,
+                 reference_file: Optional[Path] = None, incremental: bool = False) -> List[ConversionResult]:
+    """
+    Convert drafts concurrently, sharing one reference document.
+
+    Documents are spread over the process pool; each incremental build converts its own
+    sections one at a time so the pool is not oversubscribed.
+
+    Returns:
+        Results in input order
+    """
+    if not inputs:
+        return []
+    reference_file = reference_file or get_reference_doc()
+    if output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(inputs)))) as executor:
+        futures = {
+            executor.submit(convert_file, str(path), str(output_path(path, output_dir)), str(reference_file),
+                            incremental, 1): path
+            for path in inputs
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            logger.info(f"{'Converted' if result.ok else 'Failed'} {result.input} in {result.seconds:.2f}s")
+    return [results[path] for path in inputs]
+
+class ConversionServer:
+    """
+    Converts drafts on request over a Unix socket, with a process pool kept warm between requests.
+
+    Args:
+        socket_path: Where to listen; a stale socket from an earlier run is replaced
+        workers: Conversions run at once
+        reference_file: Reference document (default: the cached one, resolved at startup)
+    """
+
+    def __init__(self, socket_path: Path, workers: int = DEFAULT_WORKERS, reference_file: Optional[Path] = None):
+        self.socket_path = Path(socket_path)
+        self.workers = workers
+        self.reference_file = reference_file
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def _convert(self, request: dict) -> ConversionResult:
+        input_file = Path(request['input'])
+        output_file = Path(request['output']) if request.get('output') else output_path(input_file)
+        loop = asyncio.get_running_loop()
+        # Requests already run in parallel across the pool, so each converts its sections one at a time
+        return await loop.run_in_executor(
+            self._executor, convert_file, str(input_file), str(output_file), str(self.reference_file),
+            bool(request.get('incremental')), 1
+        )
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    result = asdict(await self._convert(request))
+                except (ValueError, KeyError, TypeError) as e:
+                    result = {'ok': False, 'error': f"bad request: {e}"}
+                writer.write(json.dumps(result).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _remove_stale_socket(self):
+        try:
+            mode = self.socket_path.lstat().st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(f"{self.socket_path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            if probe.connect_ex(str(self.socket_path)) == 0:
+                raise RuntimeError(f"A conversion server is already listening on {self.socket_path}")
+        self.socket_path.unlink()
+
+    async def serve_forever(self):
+        self.reference_file = self.reference_file or get_reference_doc()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_socket()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+            os.chmod(self.socket_path, 0o600)
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stop.set)
+            logger.info(f"Serving conversions on {self.socket_path} with {self.workers} workers")
+            async with server:
+                await stop.wait()
+            logger.info("Server stopped")
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+def send(inputs: List[Path], socket_path: Path, output_dir: Optional[Path] = None,
+         incremental: bool = False) -> List[dict]:
+    """Ask a running server to convert drafts, one after another; returns its responses."""
+    responses = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        stream = client.makefile('rwb')
+        for path in inputs:
+            request = {'input': str(path.resolve()), 'incremental': incremental}
+            if output_dir:
+                request['output'] = str(output_path(path, output_dir).resolve())
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("The conversion server closed the connection")
+            responses.append(json.loads(line))
+    return responses
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Convert many Markdown drafts to DOCX, or serve conversions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert drafts with a process pool')
+    convert_parser.add_argument('inputs', nargs='+', help='Markdown files, directories or glob patterns')
+    convert_parser.add_argument('-o', '--output-dir', type=Path, help='Directory for the DOCX files '
+                                '(default: beside each draft)')
+    convert_parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS,
+                                help='Drafts converted at once (default: CPU count)')
+    convert_parser.add_argument('--reference', type=Path, help='Reference DOCX file for styles')
+    convert_parser.add_argument('--incremental', action='store_true',
+                                help='Rebuild only the ## sections changed since the last build')
+
+    serve_parser = subparsers.add_parser('serve', help='Serve conversions over a Unix socket')
+    serve_parser.add_argument('--socket', type=Path, help='Socket path (default DOCX_SERVER_SOCKET or '
+                              '.cache/docx/server.sock)')
+    serve_parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS,
+                              help='Conversions run at once (default: CPU count)')
+    serve_parser.add_argument('--reference', type=Path, help='Reference DOCX file for styles')
+
+    send_parser = subparsers.add_parser('send', help='Convert drafts through a running server')
+    send_parser.add_argument('inputs', nargs='+', help='Markdown files, directories or glob patterns')
+    send_parser.add_argument('--socket', type=Path, help='Socket path (default DOCX_SERVER_SOCKET or '
+                             '.cache/docx/server.sock)')
+    send_parser.add_argument('-o', '--output-dir', type=Path, help='Directory for the DOCX files')
+    send_parser.add_argument('--incremental', action='store_true',
+                             help='Rebuild only the ## sections changed since the last build')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = ConversionServer(args.socket or default_socket_path(), args.workers, args.reference)
+        asyncio.run(server.serve_forever())
+        return
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        logger.error("No Markdown files matched")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    if args.command == 'convert':
+        results = [asdict(result) for result in
+                   convert_many(inputs, args.output_dir, args.workers, args.reference, args.incremental)]
+    else:
+        if args.output_dir:
+            args.output_dir.mkdir(parents=True, exist_ok=True)
+        results = send(inputs, args.socket or default_socket_path(), args.output_dir, args.incremental)
+        for result in results:
+            if not result['ok']:
+                logger.error(f"{result.get('input', '?')}: {result.get('error')}")
+
+    failed = sum(1 for result in results if not result['ok'])
+    logger.info(f"Converted {len(results) - failed} of {len(results)} drafts in {time.perf_counter() - started:.2f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
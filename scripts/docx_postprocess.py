@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Single-pass formatting of a pandoc-generated DOCX at the XML level.
+
+Produces what DocumentConverter's python-docx based formatting used to: bullet
+spacing, caption styles, 6-inch images, centered tables with bordered, 10 pt
+Times New Roman cells and a bold header row. Instead of building python-docx
+proxies for every paragraph, run and cell (and re-deriving the whole cell grid
+for every table row), word/document.xml is parsed once with lxml and walked
+once, and only that part is rewritten; every other part of the package is
+copied through byte for byte.
+
+Elements come from python-docx's oxml parser, so properties are inserted in
+schema order exactly as the object layer would insert them.
+"""
+
+import argparse
+import copy
+import logging
+import os
+import posixpath
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from docx.enum.table import WD_TABLE_ALIGNMENT
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml.simpletypes import ST_HpsMeasure, ST_Merge, ST_SignedTwipsMeasure, ST_TwipsMeasure
+from docx.shared import Inches, Pt
+from docx.styles import BabelFish
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = 'Times New Roman'
+IMAGE_WIDTH = Inches(6)
+TABLE_FONT_SIZE = Pt(10)
+
+# Copied into each table cell; building it once avoids parsing XML per cell
+CELL_BORDERS = parse_xml(f'<w:tcBorders {nsdecls("w")}>'
+                         '<w:top w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+                         '<w:left w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+                         '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+                         '<w:right w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+                         '</w:tcBorders>')
+
+W_P = qn('w:p')
+W_TBL = qn('w:tbl')
+WP_INLINE = qn('wp:inline')
+W_BODY = qn('w:body')
+W_PPR, W_RPR, W_TBLPR, W_TCPR = qn('w:pPr'), qn('w:rPr'), qn('w:tblPr'), qn('w:tcPr')
+W_TR, W_TC, W_R = qn('w:tr'), qn('w:tc'), qn('w:r')
+W_VAL = qn('w:val')
+
+def _schema_order(tags: str) -> Dict[str, int]:
+    return {qn(f'w:{tag}'): i for i, tag in enumerate(tags.split())}
+
+# Child element order of the property elements, as python-docx inserts them
+PPR_ORDER = _schema_order(
+    'pStyle keepNext keepLines pageBreakBefore framePr widowControl numPr suppressLineNumbers pBdr shd tabs '
+    'suppressAutoHyphens kinsoku wordWrap overflowPunct topLinePunct autoSpaceDE autoSpaceDN bidi '
+    'adjustRightInd snapToGrid spacing ind contextualSpacing mirrorIndents suppressOverlap jc textDirection '
+    'textAlignment textboxTightWrap outlineLvl divId cnfStyle rPr sectPr pPrChange'
+)
+RPR_ORDER = _schema_order(
+    'rStyle rFonts b bCs i iCs caps smallCaps strike dstrike outline shadow emboss imprint noProof snapToGrid '
+    'vanish webHidden color spacing w kern position sz szCs highlight u effect bdr shd fitText vertAlign rtl cs '
+    'em lang eastAsianLayout specVanish oMath'
+)
+TBLPR_ORDER = _schema_order(
+    'tblStyle tblpPr tblOverlap bidiVisual tblStyleRowBandSize tblStyleColBandSize tblW jc tblCellSpacing '
+    'tblInd tblBorders shd tblLayout tblCellMar tblLook tblCaption tblDescription tblPrChange'
+)
+
+# Attribute values of the fixed formatting, converted once
+BULLET_INDENT = ST_SignedTwipsMeasure.convert_to_xml(Inches(0.15))
+ZERO_SPACING = ST_TwipsMeasure.convert_to_xml(Pt(0))
+TABLE_FONT_SIZE_VAL = ST_HpsMeasure.convert_to_xml(TABLE_FONT_SIZE)
+
+def _properties(element, tag: str):
+    """The properties child (pPr, rPr, tcPr, tblPr) of an element; it always comes first."""
+    child = element.find(tag)
+    if child is None:
+        child = element.makeelement(tag, {})
+        element.insert(0, child)
+    return child
+
+def _child(parent, tag: str, order: Dict[str, int]):
+    """Child `tag` of a properties element, added in schema order if missing."""
+    child = parent.find(tag)
+    if child is None:
+        child = parent.makeelement(tag, {})
+        rank = order[tag]
+        for i, sibling in enumerate(parent):
+            if order.get(sibling.tag, -1) > rank:
+                parent.insert(i, child)
+                break
+        else:
+            parent.append(child)
+    return child
+
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+def _relationship_target(package: zipfile.ZipFile, rels_name: str, rel_type: str) -> Optional[str]:
+    """Zip member name of the first relationship of `rel_type` in a .rels part."""
+    try:
+        rels = etree.fromstring(package.read(rels_name))
+    except KeyError:
+        return None
+    base = posixpath.dirname(posixpath.dirname(rels_name))
+    for rel in rels.iter(f'{{{RELS_NS}}}Relationship'):
+        if rel.get('Type') == rel_type and rel.get('TargetMode') != 'External':
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base, target))
+    return None
+
+def _rels_name(part_name: str) -> str:
+    return posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+
+class _StyleIds:
+    """Paragraph style ids by UI name, read from the styles part on first use."""
+
+    def __init__(self, package: zipfile.ZipFile, document_name: str):
+        self._package = package
+        self._document_name = document_name
+        self._styles = None
+
+    def __getitem__(self, name: str) -> str:
+        if self._styles is None:
+            styles_name = _relationship_target(self._package, _rels_name(self._document_name), RT.STYLES)
+            if styles_name is None:
+                raise KeyError(f"no style with name '{name}'")
+            self._styles = parse_xml(self._package.read(styles_name))
+        style = self._styles.get_by_name(BabelFish.ui2internal(name))
+        if style is None:
+            raise KeyError(f"no style with name '{name}'")
+        return style.styleId
+
+def _format_paragraph(p, style_ids: _StyleIds, stats: Dict[str, int]):
+    """Bullet, figure caption, table caption and table note rules for a body paragraph."""
+    text = p.text.strip()
+    # The checks run in this order, so anything starting with '*' gets bullet spacing
+    if any(text.startswith(symbol) for symbol in ('-', '•', '*')):
+        stats['bullet_points'] += 1
+        pPr = _properties(p, W_PPR)
+        ind = _child(pPr, qn('w:ind'), PPR_ORDER)
+        ind.set(qn('w:left'), BULLET_INDENT)
+        ind.attrib.pop(qn('w:firstLine'), None)
+        ind.attrib.pop(qn('w:hanging'), None)
+        ind.set(qn('w:hanging'), BULLET_INDENT)
+        spacing = _child(pPr, qn('w:spacing'), PPR_ORDER)
+        spacing.set(qn('w:before'), ZERO_SPACING)
+        spacing.set(qn('w:after'), ZERO_SPACING)
+    elif text.startswith('*Figure'):
+        stats['figures'] += 1
+        _set_caption(p, style_ids, Pt(6), Pt(12), WD_ALIGN_PARAGRAPH.CENTER)
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            rPr._set_bool_val('i', True)
+            rPr.sz_val = Pt(10)
+    elif text.startswith('**Table'):
+        _set_caption(p, style_ids, Pt(12), Pt(6), WD_ALIGN_PARAGRAPH.LEFT)
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            run_text = r.text
+            if run_text.startswith('**') and run_text.endswith('**'):
+                r.text = run_text[2:-2]
+                rPr._set_bool_val('b', True)
+                rPr._set_bool_val('i', False)
+            rPr.sz_val = Pt(10)
+    elif text.startswith('*Note:'):
+        _set_caption(p, style_ids, Pt(6), Pt(12), WD_ALIGN_PARAGRAPH.LEFT)
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            rPr._set_bool_val('i', True)
+            rPr.sz_val = Pt(10)
+
+def _set_caption(p, style_ids: _StyleIds, space_before, space_after, alignment):
+    p.style = style_ids['Caption']
+    pPr = p.get_or_add_pPr()
+    pPr.spacing_before = space_before
+    pPr.spacing_after = space_after
+    pPr.jc_val = alignment
+
+def _format_image(inline, stats: Dict[str, int]):
+    """Scale an inline image to 6 inches wide, keeping its aspect ratio."""
+    extent = inline.extent
+    if extent.cx <= 0:
+        return
+    stats['images'] += 1
+    aspect_ratio = extent.cy / extent.cx
+    cx, cy = IMAGE_WIDTH, int(IMAGE_WIDTH * aspect_ratio)
+    extent.cx, extent.cy = cx, cy
+    pic = inline.graphic.graphicData.pic
+    if pic is not None:
+        pic.spPr.cx, pic.spPr.cy = cx, cy
+
+def _format_table(tbl, stats: Dict[str, int]):
+    """Center the table, fix its layout, and border and style every cell."""
+    stats['tables'] += 1
+    tblPr = _properties(tbl, W_TBLPR)
+    jc = tblPr.find(qn('w:jc'))
+    if jc is not None:
+        tblPr.remove(jc)
+    _child(tblPr, qn('w:jc'), TBLPR_ORDER).set(W_VAL, WD_TABLE_ALIGNMENT.CENTER.xml_value)
+    _child(tblPr, qn('w:tblLayout'), TBLPR_ORDER).set(qn('w:type'), 'fixed')
+
+    w_jc, w_rfonts, w_sz, w_b = qn('w:jc'), qn('w:rFonts'), qn('w:sz'), qn('w:b')
+    w_ascii, w_hansi = qn('w:ascii'), qn('w:hAnsi')
+    for row_idx, tr in enumerate(tbl.iterchildren(W_TR)):
+        for tc in tr.iterchildren(W_TC):
+            tcPr = _properties(tc, W_TCPR)
+            grid_span = tcPr.find(qn('w:gridSpan'))
+            stats['table_cells'] += int(grid_span.get(W_VAL, 1)) if grid_span is not None else 1
+            # A vertically merged cell is formatted once, through its first row
+            v_merge = tcPr.find(qn('w:vMerge'))
+            if v_merge is not None and v_merge.get(W_VAL, ST_Merge.CONTINUE) == ST_Merge.CONTINUE:
+                continue
+            tcPr.append(copy.deepcopy(CELL_BORDERS))
+            for p in tc.iterchildren(W_P):
+                _child(_properties(p, W_PPR), w_jc, PPR_ORDER).set(W_VAL, WD_ALIGN_PARAGRAPH.CENTER.xml_value)
+                for r in p.iterchildren(W_R):
+                    rPr = _properties(r, W_RPR)
+                    fonts = _child(rPr, w_rfonts, RPR_ORDER)
+                    fonts.set(w_ascii, FONT_NAME)
+                    fonts.set(w_hansi, FONT_NAME)
+                    _child(rPr, w_sz, RPR_ORDER).set(W_VAL, TABLE_FONT_SIZE_VAL)
+                    if row_idx == 0:
+                        _child(rPr, w_b, RPR_ORDER).attrib.pop(W_VAL, None)
+
+def format_document_xml(document, style_ids: _StyleIds) -> Dict[str, int]:
+    """Apply every formatting rule to a parsed document part in one traversal. Returns counts."""
+    stats = {'bullet_points': 0, 'figures': 0, 'images': 0, 'tables': 0, 'table_cells': 0}
+    body = document.find(W_BODY)
+    if body is None:
+        return stats
+
+    # Paragraph and table rules apply to top-level blocks; images anywhere in the body
+    for element in list(body.iter(W_P, W_TBL, WP_INLINE)):
+        if element.tag == WP_INLINE:
+            _format_image(element, stats)
+        elif element.getparent() is not body:
+            continue
+        elif element.tag == W_P:
+            _format_paragraph(element, style_ids, stats)
+        else:
+            _format_table(element, stats)
+    return stats
+
+def format_docx(path: Union[str, Path], output_path: Optional[Union[str, Path]] = None) -> Dict[str, int]:
+    """
+    Format a DOCX in place, or into `output_path`.
+
+    Returns:
+        Counts of bullet points, figure captions, images, tables and table cells
+    """
+    path = Path(path)
+    output_path = Path(output_path or path)
+    with zipfile.ZipFile(path) as package:
+        document_name = _relationship_target(package, '_rels/.rels', RT.OFFICE_DOCUMENT) or 'word/document.xml'
+        document = parse_xml(package.read(document_name))
+        stats = format_document_xml(document, _StyleIds(package, document_name))
+
+        # Write next to the target and rename, so a failure never leaves a truncated file
+        fd, temp_name = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.stem}-", suffix='.docx')
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(temp_name, 'w', zipfile.ZIP_DEFLATED) as out:
+                for info in package.infolist():
+                    if info.filename == document_name:
+                        out.writestr(info, serialize_part_xml(document))
+                    else:
+                        out.writestr(info, package.read(info.filename))
+            os.replace(temp_name, output_path)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+    return stats
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Apply the academic formatting rules to a pandoc DOCX')
+    parser.add_argument('input', help='DOCX produced by pandoc')
+    parser.add_argument('-o', '--output', help='Output file (default: format in place)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = format_docx(args.input, args.output)
+    logger.info(f"Formatted {args.output or args.input} in {time.perf_counter() - started:.2f}s: "
+                + ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in stats.items()))
+
+if __name__ == "__main__":
+    main()
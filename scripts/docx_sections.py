@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Incremental, section-level DOCX builds for long drafts.
+
+The draft is split at its `##` headings (as in template_draft.md) and each
+section is converted to its own DOCX by pandoc. Section outputs are cached by
+a hash of the section's text, the images it references and the conversion
+settings, so after an edit only the changed sections go through pandoc again,
+in parallel. The final document is assembled by merging the section bodies
+into the first section's package at the OOXML level, renumbering what must be
+unique across the document: relationship ids and media parts, list numbering,
+footnotes, comments, bookmark ids and names, and drawing ids.
+
+The merge expects pandoc's DOCX layout (word/document.xml with numbering,
+footnotes and comments parts), which every section shares because they are
+all built with the same reference document.
+"""
+
+import copy
+import logging
+import os
+import posixpath
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from lxml import etree
+
+try:
+    from scripts.hashing import sha256_text
+except ImportError:
+    from hashing import sha256_text
+
+logger = logging.getLogger(__name__)
+
+# Bump when splitting or conversion changes what a cached section contains
+SECTION_FORMAT_VERSION = 1
+
+# Cached sections not used for this long are removed
+SECTION_CACHE_MAX_AGE = 30 * 24 * 3600
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+WP_NS = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+
+def _w(tag: str) -> str:
+    return f'{{{W_NS}}}{tag}'
+
+W_BODY, W_SECTPR, W_VAL, W_ID = _w('body'), _w('sectPr'), _w('val'), _w('id')
+W_NUMID, W_NUM, W_ABSTRACTNUM = _w('numId'), _w('num'), _w('abstractNum')
+W_ABSTRACTNUMID, W_NUMIDATTR = _w('abstractNumId'), _w('numId')
+W_STYLE, W_STYLEID = _w('style'), _w('styleId')
+W_BOOKMARKSTART, W_NAME = _w('bookmarkStart'), _w('name')
+BOOKMARK_TAGS = {W_BOOKMARKSTART, _w('bookmarkEnd')}
+R_ATTRIBUTES = [f'{{{R_NS}}}{name}' for name in ('embed', 'link', 'id')]
+WP_DOCPR = f'{{{WP_NS}}}docPr'
+
+DOCUMENT_PART = 'word/document.xml'
+NUMBERING_PART = 'word/numbering.xml'
+STYLES_PART = 'word/styles.xml'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+
+# Note-like parts: (part, element tag, tags that refer to an element by w:id)
+NOTE_PARTS = [
+    ('word/footnotes.xml', _w('footnote'), {_w('footnoteReference')}),
+    ('word/endnotes.xml', _w('endnote'), {_w('endnoteReference')}),
+    ('word/comments.xml', _w('comment'), {_w('commentRangeStart'), _w('commentRangeEnd'),
+                                          _w('commentReference')}),
+]
+
+FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+SECTION_HEADING = re.compile(r'^## ')
+
+# Footnote ([^id]: ...) and link reference ([label]: url) definitions, with indented continuation lines
+DEFINITION = re.compile(r'^ {0,3}\[(\^?[^\]\n]+)\]:.*(?:\n(?:(?: {4}|\t).*|[ \t]*(?=\n(?: {4}|\t))))*',
+                        re.MULTILINE)
+
+# Identifier pandoc gives a repeated heading: the first one's identifier plus -N
+REPEATED_ID = re.compile(r'(.+)-(\d+)')
+
+IMAGE_REFERENCE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)|<img\b[^>]*\bsrc="([^"]+)"')
+
+@dataclass
+class BuildStats:
+    """Outcome of one incremental build."""
+    sections: int
+    converted: int
+    cached: int
+    seconds: float
+
+def split_sections(markdown: str) -> List[str]:
+    """
+    Split a draft at its `##` headings, ignoring ones inside fenced code.
+
+    Text before the first `##` heading (title, authors) is its own section.
+    Joining the sections gives back the draft.
+    """
+    sections, current, fence = [], [], None
+    for line in markdown.splitlines(keepends=True):
+        match = FENCE.match(line)
+        if fence:
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                fence = None
+        elif match:
+            fence = match.group(1)
+        elif SECTION_HEADING.match(line) and current:
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+def with_definitions(sections: List[str]) -> List[str]:
+    """
+    Give each section the footnote and link definitions it uses from other sections.
+
+    A footnote or reference link may be defined far from where it is used; converted on its
+    own, the section would lose it.
+    """
+    definitions: Dict[str, str] = {}
+    for section in sections:
+        for match in DEFINITION.finditer(section):
+            definitions.setdefault(match.group(1).lower(), match.group(0))
+    if not definitions:
+        return sections
+
+    completed = []
+    for section in sections:
+        own = {match.group(1).lower() for match in DEFINITION.finditer(section)}
+        text = DEFINITION.sub('', section).lower()
+        used = [definition for label, definition in definitions.items()
+                if label not in own and f'[{label}]' in text]
+        completed.append(section.rstrip('\n') + '\n\n' + '\n\n'.join(used) + '\n' if used else section)
+    return completed
+
+def image_fingerprints(text: str, resource_path: Sequence[Path]) -> List[str]:
+    """Path, size and modification time of the local images a section references."""
+    fingerprints = []
+    for match in IMAGE_REFERENCE.finditer(text):
+        reference = match.group(1) or match.group(2)
+        if '://' in reference:
+            continue
+        for directory in resource_path:
+            path = Path(directory) / reference
+            if path.is_file():
+                stat = path.stat()
+                fingerprints.append(f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}")
+                break
+        else:
+            fingerprints.append(f"{reference}:missing")
+    return fingerprints
+
+class SectionBuilder:
+    """
+    Builds a DOCX from a draft section by section, reusing cached section outputs.
+
+    Args:
+        convert: Converts Markdown text to a DOCX at the given path (runs pandoc)
+        cache_dir: Directory for converted sections
+        salt: Identifies everything besides the text that affects the output: pandoc,
+              the reference document, the filter and the command line
+        resource_path: Directories images are resolved against
+        workers: Sections converted at once (default: CPU count)
+    """
+
+    def __init__(self, convert: Callable[[str, Path], None], cache_dir: Union[str, Path], salt: str,
+                 resource_path: Sequence[Path] = (), workers: Optional[int] = None):
+        self.convert = convert
+        self.cache_dir = Path(cache_dir)
+        self.salt = salt
+        self.resource_path = [Path(directory) for directory in resource_path]
+        self.workers = workers or os.cpu_count() or 1
+
+    def section_key(self, text: str) -> str:
+        return sha256_text(f'section:{SECTION_FORMAT_VERSION}', self.salt, text,
+                           *image_fingerprints(text, self.resource_path))
+
+    def _convert(self, text: str, path: Path):
+        # Convert beside the final name and rename, so an interrupted build never leaves a partial section
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, prefix='.section-', suffix='.docx')
+        os.close(fd)
+        try:
+            self.convert(text, Path(temp_name))
+            os.replace(temp_name, path)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+    def build(self, markdown: str, output_path: Union[str, Path]) -> BuildStats:
+        """Convert the changed sections of `markdown` and assemble the document at `output_path`."""
+        started = time.perf_counter()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        sections = with_definitions(split_sections(markdown))
+        if not sections:
+            raise ValueError("Nothing to convert: the draft is empty")
+
+        paths = [self.cache_dir / f"{self.section_key(text)}.docx" for text in sections]
+        pending = {}
+        for text, path in zip(sections, paths):
+            if path.exists():
+                os.utime(path)
+            else:
+                pending.setdefault(path, text)
+        logger.info(f"{len(sections)} sections, {len(pending)} to convert")
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as executor:
+                for future in [executor.submit(self._convert, text, path) for path, text in pending.items()]:
+                    future.result()
+
+        merge_docx(paths, output_path)
+        self.prune()
+        return BuildStats(len(sections), len(pending), len(sections) - len(pending),
+                          time.perf_counter() - started)
+
+    def prune(self, max_age: float = SECTION_CACHE_MAX_AGE):
+        """Remove cached sections unused for `max_age` seconds."""
+        cutoff = time.time() - max_age
+        for path in self.cache_dir.glob('*.docx'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+def _serialize(element) -> bytes:
+    return etree.tostring(element, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def _rels_name(part_name: str) -> str:
+    return posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+
+def _max_int(values, default: int = 0) -> int:
+    numbers = [int(value) for value in values if value is not None and value.lstrip('-').isdigit()]
+    return max(numbers, default=default)
+
+class _MergedDocument:
+    """The first section's package, with later sections' bodies appended to it."""
+
+    def __init__(self, package: zipfile.ZipFile):
+        self.infos = package.infolist()
+        self.files: Dict[str, bytes] = {info.filename: package.read(info.filename) for info in self.infos}
+        self.parts: Dict[str, etree._Element] = {}
+
+        body = self.part(DOCUMENT_PART).find(W_BODY)
+        self.body = body
+        self.sect_pr = body[-1] if len(body) and body[-1].tag == W_SECTPR else None
+
+        document = self.part(DOCUMENT_PART)
+        self.next_bookmark = _max_int(e.get(W_ID) for e in document.iter(*BOOKMARK_TAGS)) + 1
+        self.bookmark_names = set()
+        self.bookmark_repeats: Dict[str, int] = {}
+        self._number_bookmarks(list(document.iter(W_BOOKMARKSTART)))
+        self.next_drawing = _max_int(e.get('id') for e in document.iter(f'{{{WP_NS}}}*', '{*}cNvPr')) + 1
+        numbering = self.part(NUMBERING_PART)
+        self.next_abstract_num = _max_int(e.get(W_ABSTRACTNUMID) for e in numbering.iter(W_ABSTRACTNUM)) + 1
+        self.next_num = _max_int(e.get(W_NUMIDATTR) for e in numbering.iter(W_NUM)) + 1
+        self.next_note = {}
+        for part_name, tag, _ in NOTE_PARTS:
+            notes = self.part(part_name)
+            if notes is not None:
+                self.next_note[part_name] = _max_int((e.get(W_ID) for e in notes.iter(tag)), 0) + 1
+        self.style_ids = {style.get(W_STYLEID) for style in self.part(STYLES_PART).iter(W_STYLE)}
+
+    def part(self, name: str):
+        """Parsed XML of a part, or None if the package has no such part."""
+        if name not in self.parts:
+            if name not in self.files:
+                return None
+            self.parts[name] = etree.fromstring(self.files[name])
+        return self.parts[name]
+
+    def _rels(self, part_name: str):
+        rels_name = _rels_name(part_name)
+        rels = self.part(rels_name)
+        if rels is None:
+            rels = etree.Element(f'{{{RELS_NS}}}Relationships', nsmap={None: RELS_NS})
+            self.parts[rels_name] = rels
+            self.files[rels_name] = b''
+        return rels
+
+    def _add_content_type(self, part_name: str, content_type: str):
+        types = self.part(CONTENT_TYPES_PART)
+        override = etree.SubElement(types, f'{{{CT_NS}}}Override')
+        override.set('PartName', '/' + part_name)
+        override.set('ContentType', content_type)
+
+    def _copy_relationships(self, package: zipfile.ZipFile, part_name: str, elements, section: int):
+        """Copy the relationships `elements` use from the section's part to ours, renaming r:ids."""
+        try:
+            source = etree.fromstring(package.read(_rels_name(part_name)))
+        except KeyError:
+            return
+        source_rels = {rel.get('Id'): rel for rel in source}
+        rels = self._rels(part_name)
+        next_id = _max_int(rel.get('Id', '')[3:] for rel in rels) + 1
+        renamed = {}
+        source_types = None
+
+        for element in elements:
+            for attribute in R_ATTRIBUTES:
+                old_id = element.get(attribute)
+                if old_id is None or old_id not in source_rels:
+                    continue
+                if old_id not in renamed:
+                    rel = copy.deepcopy(source_rels[old_id])
+                    rel.set('Id', f'rId{next_id}')
+                    next_id += 1
+                    if rel.get('TargetMode') != 'External':
+                        source_name = posixpath.normpath(posixpath.join(posixpath.dirname(part_name),
+                                                                        rel.get('Target')))
+                        target = posixpath.join(posixpath.dirname(rel.get('Target')),
+                                                f"s{section}-{posixpath.basename(rel.get('Target'))}")
+                        new_name = posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+                        self.files[new_name] = package.read(source_name)
+                        rel.set('Target', target)
+                        if source_types is None:
+                            source_types = {o.get('PartName'): o.get('ContentType') for o in
+                                            etree.fromstring(package.read(CONTENT_TYPES_PART))}
+                        if '/' + source_name in source_types:
+                            self._add_content_type(new_name, source_types['/' + source_name])
+                    rels.append(rel)
+                    renamed[old_id] = rel.get('Id')
+                element.set(attribute, renamed[old_id])
+
+    def _merge_numbering(self, package: zipfile.ZipFile, elements):
+        """Copy the list definitions `elements` use, under new ids."""
+        used = {numId.get(W_VAL) for numId in elements if numId.tag == W_NUMID}
+        if not used:
+            return
+        source = etree.fromstring(package.read(NUMBERING_PART))
+        numbering = self.part(NUMBERING_PART)
+        abstracts = {e.get(W_ABSTRACTNUMID): e for e in source.iter(W_ABSTRACTNUM)}
+        new_nums, new_abstracts = {}, {}
+        for num in source.iter(W_NUM):
+            old_id = num.get(W_NUMIDATTR)
+            if old_id not in used:
+                continue
+            num = copy.deepcopy(num)
+            abstract_ref = num.find(W_ABSTRACTNUMID)
+            old_abstract = abstract_ref.get(W_VAL)
+            if old_abstract not in new_abstracts and old_abstract in abstracts:
+                abstract = copy.deepcopy(abstracts[old_abstract])
+                abstract.set(W_ABSTRACTNUMID, str(self.next_abstract_num))
+                new_abstracts[old_abstract] = str(self.next_abstract_num)
+                self.next_abstract_num += 1
+                # Every abstractNum comes before the first num
+                first_num = numbering.find(W_NUM)
+                if first_num is not None:
+                    first_num.addprevious(abstract)
+                else:
+                    numbering.append(abstract)
+            abstract_ref.set(W_VAL, new_abstracts.get(old_abstract, old_abstract))
+            num.set(W_NUMIDATTR, str(self.next_num))
+            new_nums[old_id] = str(self.next_num)
+            self.next_num += 1
+            numbering.append(num)
+        for numId in elements:
+            if numId.tag == W_NUMID and numId.get(W_VAL) in new_nums:
+                numId.set(W_VAL, new_nums[numId.get(W_VAL)])
+
+    def _merge_notes(self, package: zipfile.ZipFile, elements, section: int) -> List:
+        """Copy the footnotes and comments `elements` refer to, under new ids; returns the copies."""
+        copied = []
+        for part_name, tag, reference_tags in NOTE_PARTS:
+            references = [e for e in elements if e.tag in reference_tags]
+            if not references:
+                continue
+            notes = self.part(part_name)
+            if notes is None:
+                raise ValueError(f"Cannot merge {part_name}: the first section has no such part")
+            source = {note.get(W_ID): note for note in etree.fromstring(package.read(part_name)).iter(tag)}
+            renamed = {}
+            for reference in references:
+                old_id = reference.get(W_ID)
+                if old_id not in renamed and old_id in source:
+                    note = copy.deepcopy(source[old_id])
+                    note.set(W_ID, str(self.next_note[part_name]))
+                    renamed[old_id] = str(self.next_note[part_name])
+                    self.next_note[part_name] += 1
+                    note_elements = list(note.iter())
+                    self._copy_relationships(package, part_name, note_elements, section)
+                    self._merge_numbering(package, note_elements)
+                    notes.append(note)
+                    copied.append(note)
+                if old_id in renamed:
+                    reference.set(W_ID, renamed[old_id])
+        return copied
+
+    def _merge_styles(self, package: zipfile.ZipFile):
+        """Add styles the section defines and the first one does not."""
+        styles = self.part(STYLES_PART)
+        for style in etree.fromstring(package.read(STYLES_PART)).iter(W_STYLE):
+            if style.get(W_STYLEID) not in self.style_ids:
+                styles.append(copy.deepcopy(style))
+                self.style_ids.add(style.get(W_STYLEID))
+
+    def _number_bookmarks(self, starts: List):
+        """
+        Rename a section's bookmarks the way a full build numbers repeated identifiers.
+
+        Each section is converted alone, so pandoc gives a heading repeated across sections
+        the same identifier, and numbers repeats within a section from -1 again. A full build
+        names them `methods`, `methods-1`, `methods-2`... through the whole document. Links keep
+        their anchors: as in a full build, `#methods` refers to the first such heading.
+        """
+        section_names = {start.get(W_NAME) for start in starts}
+        for start in starts:
+            name = start.get(W_NAME)
+            repeat = REPEATED_ID.fullmatch(name)
+            base = repeat.group(1) if repeat and repeat.group(1) in section_names else name
+            count = self.bookmark_repeats.get(base, 0)
+            unique = base if count == 0 else f"{base}-{count}"
+            while unique in self.bookmark_names:
+                count += 1
+                unique = f"{base}-{count}"
+            self.bookmark_repeats[base] = count + 1
+            self.bookmark_names.add(unique)
+            start.set(W_NAME, unique)
+
+    def append(self, package: zipfile.ZipFile, section: int):
+        """Append a section's body, renumbering everything that must be unique."""
+        body = etree.fromstring(package.read(DOCUMENT_PART)).find(W_BODY)
+        blocks = [child for child in body if child.tag != W_SECTPR]
+        elements = [element for block in blocks for element in block.iter()]
+
+        self._copy_relationships(package, DOCUMENT_PART, elements, section)
+        self._merge_numbering(package, elements)
+        notes = self._merge_notes(package, elements, section)
+        self._merge_styles(package)
+
+        self._number_bookmarks([element for element in elements if element.tag == W_BOOKMARKSTART])
+        bookmark_offset = self.next_bookmark
+        for element in elements + [e for note in notes for e in note.iter()]:
+            if element.tag in BOOKMARK_TAGS:
+                new_id = bookmark_offset + int(element.get(W_ID))
+                element.set(W_ID, str(new_id))
+                self.next_bookmark = max(self.next_bookmark, new_id + 1)
+            elif element.tag == WP_DOCPR or (element.tag.endswith('}cNvPr') and element.get('id')):
+                element.set('id', str(self.next_drawing))
+                self.next_drawing += 1
+
+        for block in blocks:
+            if self.sect_pr is not None:
+                self.sect_pr.addprevious(block)
+            else:
+                self.body.append(block)
+
+    def write(self, output_path: Path):
+        fd, temp_name = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.stem}-", suffix='.docx')
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(temp_name, 'w', zipfile.ZIP_DEFLATED) as out:
+                infos = {info.filename: info for info in self.infos}
+                for name, data in self.files.items():
+                    if name in self.parts:
+                        data = _serialize(self.parts[name])
+                    out.writestr(infos.get(name, name), data)
+            os.replace(temp_name, output_path)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+def merge_docx(paths: Sequence[Union[str, Path]], output_path: Union[str, Path]):
+    """Concatenate the bodies of pandoc DOCX files into one document at `output_path`."""
+    output_path = Path(output_path)
+    with zipfile.ZipFile(paths[0]) as first:
+        merged = _MergedDocument(first)
+    for section, path in enumerate(paths[1:], start=1):
+        with zipfile.ZipFile(path) as package:
+            merged.append(package, section)
+    merged.write(output_path)
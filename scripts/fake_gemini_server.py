@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Gemini Files, generateContent and batch REST endpoints.
+
+Point the async analyzer at it with GEMINI_API_BASE_URL=http://127.0.0.1:<port>
+to exercise uploads, PROCESSING polling, generation, batch jobs and 429
+handling without network access or API quota.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, Optional
+
+from aiohttp import web
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<analysis>
+  <title>Fake Analysis of {display_name}</title>
+  <authors>Doe, Jane; Roe, Richard</authors>
+  <publication_year>2024</publication_year>
+  <abstract>Generated by the local fake Gemini server.</abstract>
+  <methodology>Randomized controlled trial</methodology>
+  <limitations>Not a real analysis.</limitations>
+  <research_gap>None.</research_gap>
+</analysis>"""
+
+class FakeGeminiServer:
+    """In-memory stand-in for the Gemini REST API."""
+
+    def __init__(self, processing_seconds: float = 0.0, latency: float = 0.0,
+                 rate_limit_every: int = 0, retry_delay: float = 1.0,
+                 response_template: str = DEFAULT_RESPONSE, batch_seconds: float = 0.0):
+        """
+        Initialize the fake server.
+
+        Args:
+            processing_seconds: How long uploaded files stay in PROCESSING
+            latency: Artificial delay added to every generateContent call
+            rate_limit_every: Answer every Nth generateContent call with a 429 (0 disables)
+            retry_delay: Retry hint sent with simulated 429s
+            response_template: Model output; `{display_name}` is filled in from the file
+            batch_seconds: How long batch jobs stay RUNNING before their results are available
+        """
+        self.processing_seconds = processing_seconds
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_delay = retry_delay
+        self.response_template = response_template
+        self.batch_seconds = batch_seconds
+
+        self.files: Dict[str, Dict] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.generate_calls = 0
+        self.upload_count = 0
+        self.batch_requests = 0
+        self._ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        """Build the aiohttp application."""
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/upload/v1beta/files', self.start_upload)
+        app.router.add_post('/upload/v1beta/files/session/{upload_id}', self.finish_upload)
+        app.router.add_get('/v1beta/files/{file_id}', self.get_file)
+        app.router.add_delete('/v1beta/files/{file_id}', self.delete_file)
+        app.router.add_post('/v1beta/models/{model}:generateContent', self.generate_content)
+        app.router.add_post('/v1beta/models/{model}:batchGenerateContent', self.create_batch)
+        app.router.add_get('/v1beta/batches/{batch_id}', self.get_batch)
+        return app
+
+    def _file_json(self, name: str) -> Dict:
+        record = self.files[name]
+        if record['state'] == 'PROCESSING' and time.monotonic() >= record['ready_at']:
+            record['state'] = 'ACTIVE'
+        return {
+            'name': name,
+            'displayName': record['display_name'],
+            'mimeType': record['mime_type'],
+            'sizeBytes': str(record['size']),
+            'uri': f"fake://{name}",
+            'state': record['state'],
+        }
+
+    async def start_upload(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        metadata = body.get('file', {})
+        upload_id = str(next(self._ids))
+        self.uploads[upload_id] = {
+            'name': metadata.get('name') or f"files/upload-{upload_id}",
+            'display_name': metadata.get('display_name', ''),
+            'mime_type': request.headers.get('X-Goog-Upload-Header-Content-Type', 'application/pdf'),
+        }
+        upload_url = f"{request.url.origin()}/upload/v1beta/files/session/{upload_id}"
+        return web.json_response({}, headers={'X-Goog-Upload-URL': upload_url})
+
+    async def finish_upload(self, request: web.Request) -> web.Response:
+        pending = self.uploads.pop(request.match_info['upload_id'], None)
+        if pending is None:
+            return web.json_response({'error': {'code': 404, 'message': 'Unknown upload'}}, status=404)
+        data = await request.read()
+        self.upload_count += 1
+        self.files[pending['name']] = {
+            'display_name': pending['display_name'],
+            'mime_type': pending['mime_type'],
+            'size': len(data),
+            'state': 'PROCESSING' if self.processing_seconds else 'ACTIVE',
+            'ready_at': time.monotonic() + self.processing_seconds,
+        }
+        return web.json_response({'file': self._file_json(pending['name'])})
+
+    async def get_file(self, request: web.Request) -> web.Response:
+        name = f"files/{request.match_info['file_id']}"
+        if name not in self.files:
+            return web.json_response({'error': {'code': 404, 'message': f"{name} not found"}}, status=404)
+        return web.json_response(self._file_json(name))
+
+    async def delete_file(self, request: web.Request) -> web.Response:
+        self.files.pop(f"files/{request.match_info['file_id']}", None)
+        return web.json_response({})
+
+    async def generate_content(self, request: web.Request) -> web.Response:
+        self.generate_calls += 1
+        if self.rate_limit_every and self.generate_calls % self.rate_limit_every == 0:
+            return web.json_response({'error': {
+                'code': 429,
+                'message': 'Resource has been exhausted (e.g. check quota).',
+                'status': 'RESOURCE_EXHAUSTED',
+                'details': [{
+                    '@type': 'type.googleapis.com/google.rpc.RetryInfo',
+                    'retryDelay': f"{self.retry_delay}s",
+                }],
+            }}, status=429)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return web.json_response(self._respond(await request.json()))
+
+    def _respond(self, body: Dict) -> Dict:
+        """Fake generateContent response for a request body."""
+        display_name = 'document'
+        text_chars = file_parts = 0
+        for part in body.get('contents', [{}])[0].get('parts', []):
+            file_data = part.get('fileData')
+            if file_data:
+                file_parts += 1
+                name = file_data.get('fileUri', '').replace('fake://', '')
+                if name in self.files:
+                    display_name = self.files[name]['display_name']
+            text_chars += len(part.get('text', ''))
+
+        text = self.response_template.format(display_name=display_name)
+        return {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}],
+            'usageMetadata': {'promptTokenCount': 258 * file_parts + text_chars // 4, 'candidatesTokenCount': len(text) // 4},
+        }
+
+    def _batch_json(self, name: str) -> Dict:
+        record = self.batches[name]
+        operation = {'name': name, 'metadata': {
+            '@type': 'type.googleapis.com/google.ai.generativelanguage.v1beta.GenerateContentBatch',
+            'model': record['model'],
+            'displayName': record['display_name'],
+            'state': 'BATCH_STATE_RUNNING',
+        }}
+        if time.monotonic() < record['ready_at']:
+            return operation
+
+        operation['metadata']['state'] = 'BATCH_STATE_SUCCEEDED'
+        operation['done'] = True
+        operation['response'] = {
+            '@type': 'type.googleapis.com/google.ai.generativelanguage.v1beta.GenerateContentBatchOutput',
+            'inlinedResponses': {'inlinedResponses': [
+                {'response': self._respond(item.get('request', {})), 'metadata': item.get('metadata', {})}
+                for item in record['requests']
+            ]},
+        }
+        return operation
+
+    async def create_batch(self, request: web.Request) -> web.Response:
+        batch = (await request.json()).get('batch', {})
+        requests = batch.get('input_config', {}).get('requests', {}).get('requests', [])
+        name = f"batches/{next(self._ids)}"
+        self.batch_requests += len(requests)
+        self.batches[name] = {
+            'model': f"models/{request.match_info['model']}",
+            'display_name': batch.get('display_name', ''),
+            'requests': requests,
+            'ready_at': time.monotonic() + self.batch_seconds,
+        }
+        return web.json_response(self._batch_json(name))
+
+    async def get_batch(self, request: web.Request) -> web.Response:
+        name = f"batches/{request.match_info['batch_id']}"
+        if name not in self.batches:
+            return web.json_response({'error': {'code': 404, 'message': f"{name} not found"}}, status=404)
+        return web.json_response(self._batch_json(name))
+
+async def start_fake_server(server: Optional[FakeGeminiServer] = None, host: str = '127.0.0.1',
+                            port: int = 0):
+    """Start a fake server in the running loop. Returns (server, runner, base_url)."""
+    server = server or FakeGeminiServer()
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return server, runner, f"http://{host}:{bound_port}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Gemini API server')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind')
+    parser.add_argument('--processing-seconds', type=float, default=2.0, help='Seconds files stay PROCESSING')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds added to each generateContent call')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Return a 429 every N generate calls')
+    parser.add_argument('--batch-seconds', type=float, default=30.0, help='Seconds batch jobs stay RUNNING')
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        processing_seconds=args.processing_seconds,
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        batch_seconds=args.batch_seconds
+    )
+    logger.info(f"Fake Gemini server on http://{args.host}:{args.port}")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+--[[
+academic_format.lua - academic formatting for the DOCX writer.
+
+Moves the rules that used to be applied by munging the Markdown beforehand and
+editing the DOCX afterwards into the pandoc pass, as custom styles defined in
+the reference document (see PARAGRAPH_STYLES in convert_to_docx.py):
+
+  * HTML <img> tags become images; one alone in a paragraph becomes a figure,
+    as if it had been written ![alt](src)
+  * lines starting with "•" become bullet lists
+  * every image is scaled to IMAGE_WIDTH, keeping its aspect ratio
+  * bullet list items, and paragraphs starting with "-", "*" or "•" as
+    text, get "List Bullet"
+  * *Figure ...* paragraphs get "Caption", **Table ...** gets "Table Caption"
+    and *Note: ...* gets "Table Note"
+  * table cells get "Table Text", and the header row "Table Header"; borders,
+    centering and layout come from the reference document's "Table" style
+]]
+
+PANDOC_VERSION:must_be_at_least '2.17'
+
+local IMAGE_WIDTH = '6in'
+local BULLET = '•'
+
+-- The DOCX writer gives Plain blocks its own "Compact" style, so they become
+-- paragraphs to take the custom one
+local function styled(style, blocks)
+  blocks = pandoc.Blocks(blocks):walk({
+    Plain = function(plain) return pandoc.Para(plain.content) end,
+  })
+  return pandoc.Div(blocks, pandoc.Attr('', {}, {['custom-style'] = style}))
+end
+
+-- HTML images ---------------------------------------------------------------
+
+local function html_image(el)
+  if el.t ~= 'RawInline' or not el.format:match('html') or not el.text:match('^<img') then
+    return nil
+  end
+  local src = el.text:match('src="([^"]*)"')
+  if not src then
+    return nil
+  end
+  return src, el.text:match('alt="([^"]*)"') or ''
+end
+
+local html_images = {
+  Para = function(para)
+    -- An image on its own line is a figure, captioned with its alt text
+    if #para.content == 1 then
+      local src, alt = html_image(para.content[1])
+      if src then
+        return pandoc.read('![' .. alt .. '](' .. src .. ')', 'markdown').blocks
+      end
+    end
+  end,
+  RawInline = function(el)
+    local src, alt = html_image(el)
+    if src then
+      return pandoc.Image({pandoc.Str(alt)}, src)
+    end
+  end,
+}
+
+-- "•" bullets ---------------------------------------------------------------
+
+local function split_lines(inlines)
+  local lines, current = {}, pandoc.List()
+  for _, el in ipairs(inlines) do
+    if el.t == 'SoftBreak' or el.t == 'LineBreak' then
+      lines[#lines + 1] = current
+      current = pandoc.List()
+    else
+      current:insert(el)
+    end
+  end
+  lines[#lines + 1] = current
+  return lines
+end
+
+-- The line without its leading bullet, or nil if it does not start with one
+local function bullet_item(line)
+  local first = line[1]
+  if not first or first.t ~= 'Str' or first.text:sub(1, #BULLET) ~= BULLET then
+    return nil
+  end
+  local item = pandoc.List()
+  local rest = first.text:sub(#BULLET + 1)
+  if rest ~= '' then
+    item:insert(pandoc.Str(rest))
+  end
+  for i = 2, #line do
+    if #item > 0 or line[i].t ~= 'Space' then
+      item:insert(line[i])
+    end
+  end
+  return item
+end
+
+local bullet_lists = {
+  Para = function(para)
+    local lines = split_lines(para.content)
+    local has_bullets = false
+    for _, line in ipairs(lines) do
+      if bullet_item(line) then
+        has_bullets = true
+        break
+      end
+    end
+    if not has_bullets then
+      return nil
+    end
+
+    -- Text before the first bullet stays a paragraph; lines after a bullet continue it
+    local blocks, text, items = pandoc.List(), pandoc.List(), pandoc.List()
+    for _, line in ipairs(lines) do
+      local item = bullet_item(line)
+      if item then
+        if #text > 0 then
+          blocks:insert(pandoc.Para(text))
+          text = pandoc.List()
+        end
+        items:insert({pandoc.Plain(item)})
+      elseif #items > 0 then
+        local last = items[#items][1]
+        last.content:insert(pandoc.SoftBreak())
+        last.content:extend(line)
+      else
+        if #text > 0 then
+          text:insert(pandoc.SoftBreak())
+        end
+        text:extend(line)
+      end
+    end
+    blocks:insert(pandoc.BulletList(items))
+    return blocks
+  end,
+}
+
+-- Image size ----------------------------------------------------------------
+
+local image_size = {
+  Image = function(img)
+    img.attributes.width = IMAGE_WIDTH
+    img.attributes.height = nil
+    return img
+  end,
+}
+
+-- Paragraph and table styles ------------------------------------------------
+
+local function starts_with(inline, t, prefix)
+  return inline and inline.t == t and pandoc.utils.stringify(inline):sub(1, #prefix) == prefix
+end
+
+local function paragraph_style(para)
+  local text = pandoc.utils.stringify(para)
+  local first = para.content[1]
+  if text:match('^[%-%*]') or text:sub(1, #BULLET) == BULLET then
+    return 'List Bullet'
+  elseif starts_with(first, 'Emph', 'Figure') then
+    return 'Caption'
+  elseif starts_with(first, 'Strong', 'Table') then
+    return 'Table Caption'
+  elseif starts_with(first, 'Emph', 'Note:') then
+    return 'Table Note'
+  end
+end
+
+-- Rows with each cell's contents wrapped in `style`. Assigned back level by level,
+-- since nested table elements may be copies
+local function style_rows(rows, style)
+  local styled_rows = pandoc.List()
+  for _, row in ipairs(rows) do
+    local cells = pandoc.List()
+    for _, cell in ipairs(row.cells) do
+      cell.contents = {styled(style, cell.contents)}
+      cells:insert(cell)
+    end
+    row.cells = cells
+    styled_rows:insert(row)
+  end
+  return styled_rows
+end
+
+local styles = {
+  traverse = 'topdown',
+
+  Para = function(para)
+    local style = paragraph_style(para)
+    if style then
+      return styled(style, {para}), false
+    end
+  end,
+
+  BulletList = function(list)
+    return styled('List Bullet', {list}), false
+  end,
+
+  Table = function(tbl)
+    local head = tbl.head
+    local header_done = #head.rows > 0
+    head.rows = style_rows(head.rows, 'Table Header')
+    tbl.head = head
+
+    local bodies = pandoc.List()
+    for _, body in ipairs(tbl.bodies) do
+      body.head = style_rows(body.head, 'Table Text')
+      local rows = pandoc.List(body.body)
+      if not header_done and #rows > 0 then
+        -- Without a header, the first row is set as one
+        local styled_rows = style_rows({rows[1]}, 'Table Header')
+        styled_rows:extend(style_rows({table.unpack(rows, 2)}, 'Table Text'))
+        body.body = styled_rows
+        header_done = true
+      else
+        body.body = style_rows(rows, 'Table Text')
+      end
+      bodies:insert(body)
+    end
+    tbl.bodies = bodies
+
+    local foot = tbl.foot
+    foot.rows = style_rows(foot.rows, 'Table Text')
+    tbl.foot = foot
+    -- Cell paragraphs keep the table styles
+    return tbl, false
+  end,
+}
+
+return {html_images, bullet_lists, image_size, styles}
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Non-blocking Gemini client for the Files, generateContent and batch REST endpoints.
+
+google-generativeai only offers blocking `upload_file`/`get_file`, and its file
+service always talks to the public discovery URL. This client does resumable
+uploads, file-state polling and generation over aiohttp instead, against a
+configurable base URL so a local fake server (see fake_gemini_server.py) can
+stand in for the real API.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+class GeminiAPIError(Exception):
+    """Error response from the Gemini REST API."""
+
+    def __init__(self, code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.retry_after = retry_after
+
+@dataclass
+class RemoteFile:
+    """A file stored in the Gemini Files API."""
+    name: str
+    uri: str
+    state: str
+    mime_type: str = "application/pdf"
+    expiration_time: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'RemoteFile':
+        return cls(
+            name=data.get('name', ''),
+            uri=data.get('uri', ''),
+            state=data.get('state', 'STATE_UNSPECIFIED'),
+            mime_type=data.get('mimeType', 'application/pdf'),
+            expiration_time=data.get('expirationTime')
+        )
+
+@dataclass
+class GenerateResult:
+    """Text and token usage from a generateContent call."""
+    text: str
+    prompt_token_count: Optional[int] = None
+
+# Batch states after which a job's results no longer change
+BATCH_DONE_STATES = ('BATCH_STATE_SUCCEEDED', 'BATCH_STATE_FAILED', 'BATCH_STATE_CANCELLED', 'BATCH_STATE_EXPIRED')
+
+@dataclass
+class BatchJob:
+    """A batch generateContent job and, once finished, its results by request key."""
+    name: str
+    state: str
+    results: Dict[str, Union[GenerateResult, GeminiAPIError]] = field(default_factory=dict)
+
+    @property
+    def done(self) -> bool:
+        return self.state in BATCH_DONE_STATES
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'BatchJob':
+        # Batches come back wrapped in a long-running operation
+        metadata = data.get('metadata', {})
+        state = metadata.get('state') or data.get('state', 'BATCH_STATE_UNSPECIFIED')
+        output = data.get('response') or metadata.get('output') or {}
+        inlined = output.get('inlinedResponses', {})
+        if isinstance(inlined, dict):
+            inlined = inlined.get('inlinedResponses', [])
+
+        results: Dict[str, Union[GenerateResult, GeminiAPIError]] = {}
+        for item in inlined:
+            key = item.get('metadata', {}).get('key', '')
+            if 'error' in item:
+                error = item['error']
+                results[key] = GeminiAPIError(error.get('code', 500), error.get('message', 'unknown error'))
+                continue
+            try:
+                results[key] = parse_generate_response(item.get('response', {}))
+            except GeminiAPIError as e:
+                results[key] = e
+        return cls(name=data.get('name', ''), state=state, results=results)
+
+class AsyncGeminiClient:
+    """Async REST client for Gemini file uploads and content generation."""
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, timeout: float = 600):
+        """Initialize the client. `base_url` defaults to GEMINI_API_BASE_URL or the public API."""
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv('GEMINI_API_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _check(self, response: aiohttp.ClientResponse) -> Dict[str, Any]:
+        """Return the JSON body, raising GeminiAPIError on error statuses."""
+        if response.status < 400:
+            return await response.json(content_type=None)
+
+        body = await response.text()
+        retry_after = None
+        if response.headers.get('Retry-After'):
+            try:
+                retry_after = float(response.headers['Retry-After'])
+            except ValueError:
+                pass
+        try:
+            error = json.loads(body).get('error', {})
+            message = error.get('message', body)
+            for detail in error.get('details', []):
+                delay = detail.get('retryDelay')
+                if delay and delay.endswith('s'):
+                    retry_after = float(delay[:-1])
+        except (ValueError, AttributeError):
+            message = body
+        raise GeminiAPIError(response.status, message, retry_after)
+
+    async def upload_file(self, path: Path, name: Optional[str] = None,
+                          mime_type: str = "application/pdf") -> RemoteFile:
+        """Upload a file with the resumable upload protocol, streaming it from disk in chunks."""
+        metadata: Dict[str, Any] = {'display_name': Path(path).name}
+        if name:
+            metadata['name'] = name if name.startswith('files/') else f"files/{name}"
+
+        session = self._get_session()
+        with open(path, 'rb') as f:
+            start_headers = {
+                'X-Goog-Upload-Protocol': 'resumable',
+                'X-Goog-Upload-Command': 'start',
+                'X-Goog-Upload-Header-Content-Length': str(os.fstat(f.fileno()).st_size),
+                'X-Goog-Upload-Header-Content-Type': mime_type,
+            }
+            async with session.post(f"{self.base_url}/upload/v1beta/files", params={'key': self.api_key},
+                                    headers=start_headers, json={'file': metadata}) as response:
+                await self._check(response)
+                upload_url = response.headers['X-Goog-Upload-URL']
+
+            upload_headers = {
+                'X-Goog-Upload-Offset': '0',
+                'X-Goog-Upload-Command': 'upload, finalize',
+            }
+            async with session.post(upload_url, headers=upload_headers, data=f) as response:
+                result = await self._check(response)
+        return RemoteFile.from_json(result.get('file', result))
+
+    async def get_file(self, name: str) -> RemoteFile:
+        """Fetch a file's metadata and state."""
+        if not name.startswith('files/'):
+            name = f"files/{name}"
+        async with self._get_session().get(f"{self.base_url}/v1beta/{name}",
+                                           params={'key': self.api_key}) as response:
+            return RemoteFile.from_json(await self._check(response))
+
+    async def wait_for_active(self, remote_file: RemoteFile, poll_interval: float = 10) -> RemoteFile:
+        """Poll without blocking the event loop until the file leaves PROCESSING."""
+        while remote_file.state == "PROCESSING":
+            logger.info("Processing...")
+            await asyncio.sleep(poll_interval)
+            remote_file = await self.get_file(remote_file.name)
+        return remote_file
+
+    async def generate_content(self, model: str, parts: List[Dict[str, Any]],
+                               system_instruction: Optional[List[str]] = None) -> GenerateResult:
+        """Call generateContent with the given user parts."""
+        body = generate_request(parts, system_instruction)
+        async with self._get_session().post(f"{self.base_url}/v1beta/models/{model}:generateContent",
+                                            params={'key': self.api_key}, json=body) as response:
+            result = await self._check(response)
+        return parse_generate_response(result)
+
+    async def create_batch(self, model: str, requests: List[Tuple[str, Dict[str, Any]]],
+                           display_name: str = '') -> BatchJob:
+        """
+        Submit (key, request body) pairs as one inline batch job.
+
+        Batch jobs run within 24 hours at a reduced price and outside the per-minute
+        rate limits; the key comes back with each result.
+        """
+        body = {'batch': {
+            'display_name': display_name,
+            'input_config': {'requests': {'requests': [
+                {'request': request, 'metadata': {'key': key}} for key, request in requests
+            ]}},
+        }}
+        async with self._get_session().post(f"{self.base_url}/v1beta/models/{model}:batchGenerateContent",
+                                            params={'key': self.api_key}, json=body) as response:
+            return BatchJob.from_json(await self._check(response))
+
+    async def get_batch(self, name: str) -> BatchJob:
+        """Fetch a batch job's state, and its results once it has finished."""
+        if not name.startswith('batches/'):
+            name = f"batches/{name}"
+        async with self._get_session().get(f"{self.base_url}/v1beta/{name}",
+                                           params={'key': self.api_key}) as response:
+            return BatchJob.from_json(await self._check(response))
+
+def generate_request(parts: List[Dict[str, Any]],
+                     system_instruction: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build a generateContent request body."""
+    body: Dict[str, Any] = {'contents': [{'role': 'user', 'parts': parts}]}
+    if system_instruction:
+        body['systemInstruction'] = {'parts': [{'text': text} for text in system_instruction]}
+    return body
+
+def parse_generate_response(result: Dict[str, Any]) -> GenerateResult:
+    """Extract the text and token usage from a generateContent response."""
+    candidates = result.get('candidates') or []
+    if not candidates:
+        raise GeminiAPIError(500, f"No candidates in response: {result.get('promptFeedback', result)}")
+    text = ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
+    usage = result.get('usageMetadata', {})
+    return GenerateResult(text=text, prompt_token_count=usage.get('promptTokenCount'))
+
+def file_part(remote_file: RemoteFile) -> Dict[str, Any]:
+    """Build a content part referencing an uploaded file."""
+    return {'fileData': {'mimeType': remote_file.mime_type, 'fileUri': remote_file.uri}}
+
+def text_part(text: str) -> Dict[str, Any]:
+    """Build a plain text content part."""
+    return {'text': text}
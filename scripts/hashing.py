@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""Content hashing helpers shared by the caches and registries."""
+
+import hashlib
+from pathlib import Path
+from typing import Union
+
+CHUNK_SIZE = 1024 * 1024
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """Return the hex SHA-256 digest of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def sha256_text(*parts: str) -> str:
+    """Return the hex SHA-256 digest of several strings, unambiguously delimited."""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode('utf-8')
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
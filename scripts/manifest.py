@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Persistent processing manifest.
+
+Records, per source PDF, its size, mtime and content hash plus the state,
+output path and timing of each stage (analysis, Markdown, PNG). Status checks
+and reruns read this one indexed table instead of globbing the output
+directories for every file.
+
+Builds are incremental: a stage is outdated when it has not succeeded, when the
+PDF's content hash differs from the one its output was built from, or when the
+converter settings fingerprint changed. Size and mtime are checked first so
+unchanged PDFs are never re-hashed.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+try:
+    from scripts.hashing import sha256_file
+except ImportError:
+    from hashing import sha256_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = Path('.cache') / 'manifest.sqlite'
+
+STAGES = ('analysis', 'markdown', 'png')
+
+# Names per IN (...) lookup; SQLite allows 999 variables by default in older builds
+QUERY_CHUNK_SIZE = 500
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+@dataclass
+class StageRecord:
+    """State of one stage for one file."""
+    stage: str
+    status: str
+    output_path: Optional[str]
+    input_hash: Optional[str]
+    settings_hash: Optional[str]
+    started: Optional[float]
+    finished: Optional[float]
+    duration: Optional[float]
+    error: Optional[str]
+
+@dataclass
+class FileRecord:
+    """Fingerprint of a source PDF as last seen."""
+    name: str
+    size: int
+    mtime: float
+    input_hash: str
+    duplicate_of: Optional[str] = None
+    # Estimated text similarity to `duplicate_of` (1.0 for identical files)
+    similarity: Optional[float] = None
+
+class ProcessingManifest:
+    """Transactional SQLite record of per-file, per-stage processing state."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Initialize the manifest. Defaults to MANIFEST_PATH or .cache/manifest.sqlite."""
+        self.path = Path(path or os.getenv('MANIFEST_PATH') or DEFAULT_MANIFEST_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    input_hash TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    duplicate_of TEXT
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS stages (
+                    name TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    output_path TEXT,
+                    input_hash TEXT,
+                    settings_hash TEXT,
+                    started REAL,
+                    finished REAL,
+                    duration REAL,
+                    error TEXT,
+                    PRIMARY KEY (name, stage)
+                )
+            """)
+            # Manifests created before incremental builds lack these columns
+            self._add_column('files', 'duplicate_of', 'TEXT')
+            self._add_column('files', 'similarity', 'REAL')
+            self._add_column('stages', 'settings_hash', 'TEXT')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files (input_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_stages_status ON stages (stage, status)")
+
+    def _add_column(self, table: str, column: str, declaration: str):
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def is_empty(self) -> bool:
+        """True if nothing has been recorded yet."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM stages LIMIT 1").fetchone() is None
+
+    def touch_file(self, pdf_path: Path) -> FileRecord:
+        """
+        Record a PDF's fingerprint, hashing it only if size or mtime changed.
+
+        Returns the current record.
+        """
+        stat = pdf_path.stat()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, input_hash, duplicate_of, similarity FROM files WHERE name = ?", (pdf_path.name,)
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return FileRecord(pdf_path.name, *row)
+
+        input_hash = sha256_file(pdf_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (name, size, mtime, input_hash, updated) VALUES (?, ?, ?, ?, ?)",
+                (pdf_path.name, stat.st_size, stat.st_mtime, input_hash, time.time())
+            )
+        return FileRecord(pdf_path.name, stat.st_size, stat.st_mtime, input_hash)
+
+    def get_file(self, name: str) -> Optional[FileRecord]:
+        """Return the last recorded fingerprint of a PDF."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, size, mtime, input_hash, duplicate_of, similarity FROM files WHERE name = ?", (name,)
+            ).fetchone()
+        return FileRecord(*row) if row else None
+
+    def files_with_hashes(self, input_hashes: Iterable[str]) -> List[FileRecord]:
+        """Records of the files whose current content has one of the given hashes."""
+        input_hashes = list(input_hashes)
+        if not input_hashes:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, size, mtime, input_hash, duplicate_of, similarity FROM files "
+                f"WHERE input_hash IN ({', '.join('?' * len(input_hashes))})", input_hashes
+            ).fetchall()
+        return [FileRecord(*row) for row in rows]
+
+    def record_stage(self, name: str, stage: str, status: str, output_path: Optional[Union[str, Path]] = None,
+                     input_hash: Optional[str] = None, settings_hash: Optional[str] = None,
+                     started: Optional[float] = None, duration: Optional[float] = None,
+                     error: Optional[str] = None):
+        """
+        Record the outcome of a stage for a file.
+
+        `input_hash` defaults to the file's current fingerprint; `settings_hash` is the
+        converter's settings fingerprint the output was built with.
+        """
+        finished = time.time()
+        if started is None and duration is not None:
+            started = finished - duration
+        with self._lock, self._conn:
+            if input_hash is None:
+                row = self._conn.execute("SELECT input_hash FROM files WHERE name = ?", (name,)).fetchone()
+                input_hash = row[0] if row else None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages "
+                "(name, stage, status, output_path, input_hash, settings_hash, started, finished, duration, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, stage, status, str(output_path) if output_path else None, input_hash,
+                 settings_hash, started, finished, duration, error)
+            )
+
+    def rename(self, old_name: str, new_name: str):
+        """Move all records of a file to its new name (e.g. after analysis renamed it)."""
+        if old_name == new_name:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE name = ?", (new_name,))
+            self._conn.execute("DELETE FROM stages WHERE name = ?", (new_name,))
+            self._conn.execute("UPDATE files SET name = ? WHERE name = ?", (new_name, old_name))
+            self._conn.execute("UPDATE stages SET name = ? WHERE name = ?", (new_name, old_name))
+
+    def stage_records(self, name: str) -> Dict[str, StageRecord]:
+        """All stage records of one file, keyed by stage."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, output_path, input_hash, settings_hash, started, finished, duration, error "
+                "FROM stages WHERE name = ?", (name,)
+            ).fetchall()
+        return {row[0]: StageRecord(*row) for row in rows}
+
+    def status_map(self) -> Dict[str, Dict[str, str]]:
+        """Stage statuses for every file, in a single query: {name: {stage: status}}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, stage, status FROM stages").fetchall()
+        statuses: Dict[str, Dict[str, str]] = {}
+        for name, stage, status in rows:
+            statuses.setdefault(name, {})[stage] = status
+        return statuses
+
+    def outdated_stages(self, names: Iterable[str], settings: Dict[str, str]) -> Dict[str, Set[str]]:
+        """
+        Stages that must (re)run for each of the named files.
+
+        A stage is outdated unless it succeeded for the file's current content hash
+        and with the given settings fingerprint. Outputs adopted from disk carry no
+        fingerprint and are trusted until the PDF itself changes.
+        """
+        names = list(names)
+        rows = []
+        with self._lock:
+            # Look up only the requested files, by primary key, in chunks below SQLite's variable limit
+            for start in range(0, len(names), QUERY_CHUNK_SIZE):
+                chunk = names[start:start + QUERY_CHUNK_SIZE]
+                rows += self._conn.execute(
+                    "SELECT s.name, s.stage, s.status, s.input_hash, s.settings_hash, f.input_hash "
+                    "FROM stages s LEFT JOIN files f ON f.name = s.name "
+                    f"WHERE s.name IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        current: Dict[str, Set[str]] = {}
+        for name, stage, status, input_hash, settings_hash, file_hash in rows:
+            if (status == STATUS_DONE and input_hash is not None and input_hash == file_hash
+                    and settings_hash in (None, settings.get(stage))):
+                current.setdefault(name, set()).add(stage)
+        return {name: set(STAGES) - current.get(name, set()) for name in names}
+
+    def find_duplicate(self, name: str, input_hash: str) -> Optional[str]:
+        """Name of another, already analyzed file with the same content, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT f.name FROM files f JOIN stages s ON s.name = f.name "
+                "WHERE f.input_hash = ? AND f.name != ? AND f.duplicate_of IS NULL "
+                "AND s.stage = 'analysis' AND s.status = ? ORDER BY f.updated LIMIT 1",
+                (input_hash, name, STATUS_DONE)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_duplicate(self, name: str, original: Optional[str], similarity: Optional[float] = None):
+        """Record (or clear, with None) that a file is a copy or near-copy of another one."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET duplicate_of = ?, similarity = ? WHERE name = ?",
+                (original, similarity if original else None, name)
+            )
+
+    def duplicates(self) -> Dict[str, Tuple[str, Optional[float]]]:
+        """All known duplicates: {name: (original name, similarity)}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, duplicate_of, similarity FROM files WHERE duplicate_of IS NOT NULL"
+            ).fetchall()
+        return {name: (original, similarity) for name, original, similarity in rows}
+
+    def forget(self, names: Iterable[str]):
+        """Drop all records for the given files."""
+        with self._lock, self._conn:
+            for name in names:
+                self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                self._conn.execute("DELETE FROM stages WHERE name = ?", (name,))
+
+    def import_from_disk(self, pdf_files: List[Path], analysis_dir: Path, markdown_dir: Path, png_dir: Path) -> int:
+        """
+        Seed the manifest from outputs already on disk, one glob pass per file.
+
+        Used once to adopt existing output directories (or with --rescan to resync
+        after outputs were changed by hand). Returns the number of files imported.
+        """
+        for pdf_path in pdf_files:
+            stem = pdf_path.stem
+            analysis = analysis_dir / f"{stem}_analysis.xml"
+            if not analysis.exists():
+                analysis = next(analysis_dir.glob(f"{stem}*_analysis.xml"), None)
+            markdown = markdown_dir / f"{stem}.md"
+            png = png_dir / stem
+            outputs = {
+                'analysis': analysis,
+                'markdown': markdown if markdown.exists() else None,
+                'png': png if png.is_dir() and any(png.iterdir()) else None,
+            }
+            self.touch_file(pdf_path)
+            with self._lock, self._conn:
+                # Outputs still on disk keep the settings they were built with, so a later
+                # settings change still rebuilds them; only unrecorded outputs get None
+                settings = dict(self._conn.execute(
+                    "SELECT stage, settings_hash FROM stages WHERE name = ? AND status = ?",
+                    (pdf_path.name, STATUS_DONE)
+                ).fetchall())
+                self._conn.execute("DELETE FROM stages WHERE name = ?", (pdf_path.name,))
+            for stage, output in outputs.items():
+                if output is not None:
+                    self.record_stage(pdf_path.name, stage, STATUS_DONE, output_path=output,
+                                      settings_hash=settings.get(stage))
+        logger.info(f"Imported {len(pdf_files)} files into the processing manifest")
+        return len(pdf_files)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for incoming PDFs with MinHash and LSH.
+
+A preprint, the publisher's version and a renamed copy of the same paper have
+different bytes but mostly the same text. Each PDF's extracted text is reduced
+to a MinHash signature over word 5-shingles; the signature is split into bands
+and every band is hashed into an SQLite table. Papers sharing any band bucket
+are candidates, and their signatures are compared to estimate the Jaccard
+similarity of their text.
+
+Signatures are keyed by the PDF's content hash, so each file is read once. All
+state lives on disk; a lookup touches one bucket per band, so memory use does
+not grow with the corpus.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import fitz  # PyMuPDF
+import numpy as np
+
+try:
+    from scripts.hashing import sha256_file
+except ImportError:
+    from hashing import sha256_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path('.cache') / 'near_duplicates.sqlite'
+
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a bucket,
+# pairs below ~0.5 almost never do
+BANDS = 16
+SHINGLE_WORDS = 5
+DEFAULT_THRESHOLD = 0.7
+
+# Only the first pages are read; enough to tell papers apart, cheap for long books
+MAX_PAGES = 30
+# Texts with fewer shingles (scans, cover pages) are too short to compare reliably
+MIN_SHINGLES = 50
+
+# Fixed multiply-shift hash family, so signatures stay comparable across runs
+_RNG = np.random.default_rng(0x5EED)
+_PERM_A = _RNG.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _RNG.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+@dataclass
+class Signature:
+    """MinHash signature of a PDF's text (None if it has too little text)."""
+    input_hash: str
+    values: Optional[np.ndarray]
+    shingles: int
+
+def text_shingles(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """32-bit hashes of the distinct k-word shingles of a text, ignoring case and punctuation."""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < k:
+        return np.zeros(0, dtype=np.uint64)
+    shingles = {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+
+def minhash(shingles: np.ndarray, block: int = 4096) -> np.ndarray:
+    """MinHash signature (NUM_PERM 32-bit values) of a set of shingle hashes."""
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(shingles), block):
+        x = shingles[start:start + block, None]
+        # Multiply-shift hashing; uint64 arithmetic wraps modulo 2**64 by design
+        hashed = (x * _PERM_A + _PERM_B) >> np.uint64(32)
+        signature = np.minimum(signature, hashed.min(axis=0))
+    return signature.astype(np.uint32)
+
+def extract_text(pdf_path: Union[str, Path], max_pages: int = MAX_PAGES) -> str:
+    """Plain text of the first pages of a PDF."""
+    with fitz.open(pdf_path) as doc:
+        return '\n'.join(doc[i].get_text() for i in range(min(max_pages, len(doc))))
+
+def compute_signature(pdf_path: Union[str, Path], input_hash: Optional[str] = None) -> Signature:
+    """Signature of a PDF; runs in worker processes, so it only takes and returns picklable values."""
+    input_hash = input_hash or sha256_file(pdf_path)
+    shingles = text_shingles(extract_text(pdf_path))
+    if len(shingles) < MIN_SHINGLES:
+        return Signature(input_hash, None, len(shingles))
+    return Signature(input_hash, minhash(shingles), len(shingles))
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+def band_keys(values: np.ndarray, bands: int = BANDS) -> List[int]:
+    """One signed 64-bit bucket key per band."""
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+        for band in np.split(values, bands)
+    ]
+
+class NearDuplicateIndex:
+    """SQLite-backed MinHash LSH index keyed by PDF content hash."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Open or create the index.
+
+        Args:
+            path: Database path; defaults to NEAR_DUPLICATE_INDEX_PATH or .cache/near_duplicates.sqlite
+            threshold: Minimum estimated similarity for a pair to count as near-duplicates
+        """
+        self.path = Path(path or os.getenv('NEAR_DUPLICATE_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Everything here can be recomputed from the PDFs
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    id INTEGER PRIMARY KEY,
+                    input_hash TEXT NOT NULL UNIQUE,
+                    signature BLOB,
+                    shingles INTEGER NOT NULL,
+                    added REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    signature_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, bucket, signature_id)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_signature ON bands (signature_id)")
+
+    def has(self, input_hash: str) -> bool:
+        """True if a signature for this content is stored."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM signatures WHERE input_hash = ?", (input_hash,)
+            ).fetchone() is not None
+
+    def get(self, input_hash: str) -> Optional[Signature]:
+        """Stored signature for this content, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT signature, shingles FROM signatures WHERE input_hash = ?", (input_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        values = np.frombuffer(row[0], dtype=np.uint32) if row[0] is not None else None
+        return Signature(input_hash, values, row[1])
+
+    def add(self, signature: Signature):
+        """Store a signature and its band buckets (a no-op if the content is already known)."""
+        blob = signature.values.astype(np.uint32).tobytes() if signature.values is not None else None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO signatures (input_hash, signature, shingles, added) VALUES (?, ?, ?, ?)",
+                (signature.input_hash, blob, signature.shingles, time.time())
+            )
+            if cursor.rowcount and signature.values is not None:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO bands (band, bucket, signature_id) VALUES (?, ?, ?)",
+                    [(band, key, cursor.lastrowid) for band, key in enumerate(band_keys(signature.values))]
+                )
+
+    def ensure(self, files: Sequence[Tuple[Path, str]], workers: Optional[int] = None) -> int:
+        """
+        Compute and store signatures for (path, content hash) pairs not seen before.
+
+        Text extraction runs in a process pool when there is more than one file. Each
+        signature is stored as soon as it arrives, so an interrupted run keeps its progress.
+        Returns the number of signatures added.
+        """
+        missing = [(path, input_hash) for path, input_hash in files if not self.has(input_hash)]
+        if not missing:
+            return 0
+        started = time.perf_counter()
+        if len(missing) == 1:
+            signature = _safe_signature(str(missing[0][0]), missing[0][1])
+            if signature is not None:
+                self.add(signature)
+        else:
+            workers = workers or min(len(missing), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for signature in pool.map(_safe_signature, [str(p) for p, _ in missing],
+                                          [h for _, h in missing], chunksize=8):
+                    if signature is not None:
+                        self.add(signature)
+        logger.info(f"Computed {len(missing)} text signatures in {time.perf_counter() - started:.1f}s")
+        return len(missing)
+
+    def candidates(self, input_hash: str) -> List[Tuple[str, float]]:
+        """
+        Other stored contents whose estimated similarity to `input_hash` meets the threshold.
+
+        Returns (content hash, similarity) pairs, most similar first.
+        """
+        signature = self.get(input_hash)
+        if signature is None or signature.values is None:
+            return []
+        keys = band_keys(signature.values)
+        with self._lock:
+            ids = set()
+            for band, key in enumerate(keys):
+                ids.update(row[0] for row in self._conn.execute(
+                    "SELECT signature_id FROM bands WHERE band = ? AND bucket = ?", (band, key)
+                ))
+            rows = self._conn.execute(
+                f"SELECT input_hash, signature FROM signatures WHERE id IN ({', '.join('?' * len(ids))})",
+                list(ids)
+            ).fetchall() if ids else []
+
+        matches = []
+        for other_hash, blob in rows:
+            if other_hash == input_hash:
+                continue
+            score = similarity(signature.values, np.frombuffer(blob, dtype=np.uint32))
+            if score >= self.threshold:
+                matches.append((other_hash, score))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Drop signatures of contents no longer present. Returns the number removed."""
+        keep = set(keep)
+        with self._lock, self._conn:
+            stale = [(id_,) for id_, input_hash in self._conn.execute("SELECT id, input_hash FROM signatures")
+                     if input_hash not in keep]
+            self._conn.executemany("DELETE FROM bands WHERE signature_id = ?", stale)
+            self._conn.executemany("DELETE FROM signatures WHERE id = ?", stale)
+        return len(stale)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def _safe_signature(path: str, input_hash: str) -> Optional[Signature]:
+    try:
+        return compute_signature(path, input_hash)
+    except Exception as e:
+        logger.warning(f"Could not read text of {Path(path).name}: {e}")
+        return None
+
+def find_near_duplicates(pdf_dir: Union[str, Path], threshold: float = DEFAULT_THRESHOLD) -> Dict[str, List[Tuple[str, float]]]:
+    """Group the PDFs in a directory by near-duplicate content: {name: [(other name, similarity)]}."""
+    pdf_files = sorted(Path(pdf_dir).glob('*.pdf'))
+    hashes = {path.name: sha256_file(path) for path in pdf_files}
+    names_by_hash: Dict[str, List[str]] = {}
+    for name, input_hash in hashes.items():
+        names_by_hash.setdefault(input_hash, []).append(name)
+
+    index = NearDuplicateIndex(threshold=threshold)
+    try:
+        index.ensure([(path, hashes[path.name]) for path in pdf_files])
+        groups = {}
+        for name, input_hash in hashes.items():
+            matches = [(other, 1.0) for other in names_by_hash[input_hash] if other != name]
+            for other_hash, score in index.candidates(input_hash):
+                matches += [(other, score) for other in names_by_hash.get(other_hash, [])]
+            if matches:
+                groups[name] = matches
+        return groups
+    finally:
+        index.close()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='List near-duplicate PDFs')
+    parser.add_argument('-d', '--pdf-dir', default='sources_pdf', help='PDF directory')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Minimum estimated text similarity (0-1)')
+    args = parser.parse_args()
+
+    groups = find_near_duplicates(args.pdf_dir, args.threshold)
+    if not groups:
+        print("No near-duplicates found")
+    for name, matches in sorted(groups.items()):
+        print(name)
+        for other, score in matches:
+            print(f"   {score:.0%}  {other}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Compact, section-trimmed paper text for text-mode analysis.
+
+Instead of uploading the whole PDF (fonts, figures and all), the analyzer can
+send the text PyMuPDF already extracts. Sections are located by their headings
+and kept in order of how much the analysis needs them: the front matter (title,
+authors, year), abstract, methods, results and limitations first, then the
+discussion, conclusion and introduction. References, acknowledgements and
+appendices are dropped. Whatever is kept must fit a per-paper token budget.
+
+Scanned or image-only PDFs have little or no extractable text; for those
+extract_paper_text returns None and the caller uploads the PDF instead.
+"""
+
+import argparse
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+try:
+    from scripts.pdf_document import PDFDocumentSession
+except ImportError:
+    from pdf_document import PDFDocumentSession
+
+# Rough characters per token for English prose
+CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGET = 12_000
+
+# A PDF counts as text-based when most pages carry a reasonable amount of text
+MIN_CHARS_PER_PAGE = 200
+MIN_TEXT_PAGE_FRACTION = 0.6
+
+# Section name -> heading words that introduce it
+SECTION_HEADINGS = {
+    'abstract': r'abstract|summary',
+    'introduction': r'introduction|background',
+    'methods': r'methods?|methodology|materials and methods|study design|research design|design and methods',
+    'results': r'results|findings|results and discussion',
+    'discussion': r'discussion|general discussion',
+    'limitations': r'limitations?|strengths and limitations|limitations and future (?:work|research)',
+    'conclusion': r'conclusions?|concluding remarks|implications',
+    'references': r'references|bibliography|works cited|literature cited',
+    'acknowledgements': r'acknowledge?ments?|funding|conflicts? of interest|declarations?',
+    'appendix': r'appendix|appendices|supplementary (?:material|information)',
+}
+
+DROPPED_SECTIONS = {'references', 'acknowledgements', 'appendix'}
+
+# Kept in this order of priority, each with its share of the budget; leftover budget
+# from short sections goes to the next ones in the same order
+SECTION_SHARES = [
+    ('front', 0.10),
+    ('abstract', 0.10),
+    ('methods', 0.22),
+    ('results', 0.22),
+    ('limitations', 0.10),
+    ('discussion', 0.12),
+    ('conclusion', 0.07),
+    ('introduction', 0.07),
+]
+
+HEADING = re.compile(
+    r'^[ \t]*(?:(?:\d+(?:\.\d+)*|[IVX]+)\.?[ \t]+)?(' + '|'.join(SECTION_HEADINGS.values()) + r')[ \t]*[:.]?[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+@dataclass
+class Section:
+    """A contiguous run of text under one heading."""
+    name: str
+    text: str
+
+@dataclass
+class PaperText:
+    """Trimmed text ready to send inline."""
+    text: str
+    tokens: int
+    pages: int
+    sections: List[str] = field(default_factory=list)
+    truncated: bool = False
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def classify_heading(heading: str) -> str:
+    """Section name for a heading matched by HEADING."""
+    heading = ' '.join(heading.lower().split())
+    for name, pattern in SECTION_HEADINGS.items():
+        if re.fullmatch(pattern, heading):
+            return name
+    return 'front'
+
+def split_sections(text: str) -> List[Section]:
+    """Split text at recognized section headings; text before the first one is 'front'."""
+    sections = []
+    position, name = 0, 'front'
+    for match in HEADING.finditer(text):
+        sections.append(Section(name, text[position:match.start()].strip()))
+        name, position = classify_heading(match.group(1)), match.end()
+    sections.append(Section(name, text[position:].strip()))
+    return [section for section in sections if section.text]
+
+def trim(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens at a sentence or word boundary."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind('. '), cut.rfind('\n'))
+    if boundary > limit * 0.7:
+        cut = cut[:boundary + 1]
+    else:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + ' […]'
+
+def is_text_based(page_texts: Sequence[str]) -> bool:
+    """True if enough pages carry real text; scanned and image-only PDFs do not."""
+    if not page_texts:
+        return False
+    with_text = sum(1 for text in page_texts if len(text.strip()) >= MIN_CHARS_PER_PAGE)
+    return with_text / len(page_texts) >= MIN_TEXT_PAGE_FRACTION
+
+def select_sections(sections: List[Section], budget: int) -> Tuple[List[Section], bool]:
+    """Pick and trim sections to fit the token budget, keeping document order."""
+    by_name: Dict[str, List[int]] = {}
+    for i, section in enumerate(sections):
+        by_name.setdefault(section.name, []).append(i)
+
+    allowance = {i: 0 for i in range(len(sections))}
+    remaining = budget
+    # First pass: each section's share; second pass: hand out whatever is left
+    for use_share in (True, False):
+        for name, share in SECTION_SHARES:
+            for i in by_name.get(name, []):
+                needed = estimate_tokens(sections[i].text) - allowance[i]
+                if needed <= 0 or remaining <= 0:
+                    continue
+                grant = min(needed, remaining, int(budget * share) if use_share else remaining)
+                allowance[i] += grant
+                remaining -= grant
+
+    selected, truncated = [], False
+    for i, section in enumerate(sections):
+        if section.name in DROPPED_SECTIONS:
+            continue
+        if not allowance[i]:
+            truncated = True
+            continue
+        text = trim(section.text, allowance[i])
+        truncated = truncated or text != section.text
+        selected.append(Section(section.name, text))
+    return selected, truncated
+
+def extract_paper_text(page_texts: Sequence[str], budget: int = DEFAULT_TOKEN_BUDGET) -> Optional[PaperText]:
+    """
+    Build the inline text for a paper from its page texts.
+
+    Args:
+        page_texts: Extracted text of each page
+        budget: Maximum tokens to send
+
+    Returns:
+        The trimmed text, or None if the PDF looks scanned and should be uploaded instead
+    """
+    if not is_text_based(page_texts):
+        return None
+
+    full_text = '\n'.join(page_texts)
+    sections = split_sections(full_text)
+    if estimate_tokens(full_text) <= budget and not any(s.name in DROPPED_SECTIONS for s in sections):
+        return PaperText(full_text, estimate_tokens(full_text), len(page_texts), [s.name for s in sections])
+
+    selected, truncated = select_sections(sections, budget)
+    parts = [section.text if section.name == 'front' else f"[{section.name.title()}]\n{section.text}"
+             for section in selected]
+    text = '\n\n'.join(parts)
+    return PaperText(text, estimate_tokens(text), len(page_texts), [s.name for s in selected], truncated)
+
+def session_paper_text(session: PDFDocumentSession, budget: int = DEFAULT_TOKEN_BUDGET) -> Optional[PaperText]:
+    """
+    extract_paper_text for an open document session.
+
+    The page text stays cached in the session, so process_single_pdf's Markdown
+    conversion reuses it; pipeline workers convert in their own process and re-read it.
+    """
+    return extract_paper_text([session.page_text(i) for i in range(session.page_count)], budget)
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the trimmed text text-mode analysis would send')
+    parser.add_argument('pdf', help='PDF file')
+    parser.add_argument('-b', '--budget', type=int, default=DEFAULT_TOKEN_BUDGET, help='Token budget')
+    args = parser.parse_args()
+
+    with fitz.open(args.pdf) as doc:
+        page_texts = [page.get_text() for page in doc]
+    paper = extract_paper_text(page_texts, args.budget)
+    if paper is None:
+        print(f"{args.pdf}: little extractable text (scanned?); would upload the PDF")
+        return
+    print(paper.text)
+    print(f"\n--- {paper.tokens} tokens from {paper.pages} pages; sections: {', '.join(paper.sections)}"
+          f"{' (trimmed)' if paper.truncated else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,27 @@ from typing import Dict, Optional, Tuple
 import re
 import unicodedata
 import argparse
+import fitz
+import asyncio
+
+try:
+    from scripts.rate_limiter import GeminiRateLimiter, is_rate_limit_error
+    from scripts.gemini_async import AsyncGeminiClient, RemoteFile, file_part, text_part
+    from scripts.analysis_cache import AnalysisCache
+    from scripts.hashing import sha256_file, sha256_text
+    from scripts.upload_registry import UploadRegistry, parse_expiration
+    from scripts.pdf_document import PDFDocumentSession
+    from scripts.analysis_index import AnalysisIndex
+    from scripts.paper_text import DEFAULT_TOKEN_BUDGET, PaperText, extract_paper_text, session_paper_text
+except ImportError:
+    from rate_limiter import GeminiRateLimiter, is_rate_limit_error
+    from gemini_async import AsyncGeminiClient, RemoteFile, file_part, text_part
+    from analysis_cache import AnalysisCache
+    from hashing import sha256_file, sha256_text
+    from upload_registry import UploadRegistry, parse_expiration
+    from pdf_document import PDFDocumentSession
+    from analysis_index import AnalysisIndex
+    from paper_text import DEFAULT_TOKEN_BUDGET, PaperText, extract_paper_text, session_paper_text
 
 # Configure logging
 logging.basicConfig(
@@ -21,13 +42,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Gemini bills each PDF page as a fixed number of input tokens
+TOKENS_PER_PDF_PAGE = 258
+PROMPT_TOKEN_OVERHEAD = 1000
+
+SYSTEM_INSTRUCTION = [
+    "You are an expert research assistant analyzing academic papers.",
+    "Extract the following information in XML format:",
+    "1. Title",
+    "2. Authors (in format: 'Last1, First1; Last2, First2')",
+    "3. Publication year",
+    "4. Abstract",
+    "5. Key findings/contributions",
+    "6. Methodology",
+    "7. Results",
+    "8. Limitations",
+    "9. Research gap",
+    "10. Thematic analysis",
+    "Format the response as a valid XML document with these fields as elements."
+]
+
+ANALYSIS_PROMPT = """Please analyze this academic paper and extract the requested information in XML format.
+                Format your response as a valid XML document with root element <analysis> containing the specified fields as child elements.
+                Use clear, descriptive text and preserve any important formatting or structure in the content.
+                Ensure all XML tags are properly closed and nested."""
+
+# 'pdf' uploads the file; 'text' sends extracted text inline and uploads only scanned PDFs
+ANALYSIS_MODES = ('pdf', 'text')
+
+TEXT_ANALYSIS_PROMPT = """The text below was extracted from an academic paper. Long papers are trimmed to their
+                front matter, abstract, methods, results, limitations and conclusions; markers such as [Methods]
+                show where each part starts.
+                """ + ANALYSIS_PROMPT
+
 class PDFAnalyzer:
     """Analyze PDFs using Google's Gemini API and rename based on analysis."""
 
-    def __init__(self, api_key: str):
-        """Initialize the analyzer with API key."""
+    def __init__(self, api_key: str, rate_limiter: Optional[GeminiRateLimiter] = None,
+                 max_rate_limit_retries: int = 5, max_async_concurrency: int = 32,
+                 cache: Optional[AnalysisCache] = None, uploads: Optional[UploadRegistry] = None,
+                 analysis_index: Optional[AnalysisIndex] = None, analysis_mode: Optional[str] = None,
+                 text_token_budget: Optional[int] = None):
+        """
+        Initialize the analyzer with API key, a (possibly shared) rate limiter, the analysis cache
+        and upload registry. Saved analyses are also added to `analysis_index` when given.
+
+        `analysis_mode` ('pdf' or 'text', default GEMINI_ANALYSIS_MODE or 'pdf') selects whether
+        papers are uploaded or sent as extracted text of at most `text_token_budget` tokens
+        (default GEMINI_TEXT_TOKEN_BUDGET).
+        """
         self.source_dir = Path('sources_pdf')
         self.analysis_dir = Path('sources_analysis')
+        self.rate_limiter = rate_limiter or GeminiRateLimiter.from_env()
+        self.cache = cache or AnalysisCache()
+        self.uploads = uploads or UploadRegistry()
+        self.analysis_index = analysis_index
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.analysis_mode = analysis_mode or os.getenv('GEMINI_ANALYSIS_MODE', 'pdf')
+        if self.analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode '{self.analysis_mode}'; expected one of {ANALYSIS_MODES}")
+        self.text_token_budget = text_token_budget or int(os.getenv('GEMINI_TEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET))
+
+        # Async path: bounded number of uploads/generations in flight at once
+        self.max_async_concurrency = max_async_concurrency
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_client: Optional[AsyncGeminiClient] = None
 
         # Configure Gemini
         self.api_key = api_key
@@ -39,26 +118,21 @@ class PDFAnalyzer:
         # Initialize model with system instructions
         self.model = genai.GenerativeModel(
             model_name=self.model_name,
-            system_instruction=[
-                "You are an expert research assistant analyzing academic papers.",
-                "Extract the following information in XML format:",
-                "1. Title",
-                "2. Authors (in format: 'Last1, First1; Last2, First2')",
-                "3. Publication year",
-                "4. Abstract",
-                "5. Key findings/contributions",
-                "6. Methodology",
-                "7. Results",
-                "8. Limitations",
-                "9. Research gap",
-                "10. Thematic analysis",
-                "Format the response as a valid XML document with these fields as elements."
-            ]
+            system_instruction=SYSTEM_INSTRUCTION
         )
 
         # Create analysis directory if it doesn't exist
         self.analysis_dir.mkdir(parents=True, exist_ok=True)
 
+    def settings_fingerprint(self) -> str:
+        """
+        Hash of everything besides the PDF that shapes the analysis output.
+
+        The analysis mode is left out on purpose, so switching to text mode applies to new
+        papers instead of re-analyzing the whole corpus.
+        """
+        return sha256_text('analysis', self.model_name, '\n'.join(SYSTEM_INSTRUCTION), ANALYSIS_PROMPT)
+
     def sanitize_filename(self, text: str) -> str:
         """Convert text to a valid filename component."""
         # Convert to ASCII and remove invalid chars
@@ -137,8 +211,13 @@ class PDFAnalyzer:
             logger.error(f"Error creating filename from analysis: {e}")
             return original_name
 
-    def generate_upload_name(self, original_name: str) -> str:
+    def generate_upload_name(self, original_name: str, content_hash: Optional[str] = None) -> str:
         """Generate a unique name for file upload that meets Gemini API requirements."""
+        # Content-addressed names stay stable across renames and reruns, so
+        # an existing upload can be found again (max 40 chars)
+        if content_hash:
+            return f"pdf-{content_hash[:36]}"
+
         # Remove extension and special characters
         base_name = self.sanitize_filename(original_name.rsplit('.', 1)[0])
 
@@ -164,6 +243,34 @@ class PDFAnalyzer:
 
         return result
 
+    def estimate_tokens(self, pdf_path: Path, session: Optional[PDFDocumentSession] = None) -> int:
+        """Estimate the input tokens a PDF will cost, for the tokens-per-minute budget."""
+        try:
+            if session is not None:
+                return session.page_count * TOKENS_PER_PDF_PAGE + PROMPT_TOKEN_OVERHEAD
+            with fitz.open(pdf_path) as doc:
+                return len(doc) * TOKENS_PER_PDF_PAGE + PROMPT_TOKEN_OVERHEAD
+        except Exception:
+            # Rough fallback: ~1 token per 100 bytes of PDF
+            return pdf_path.stat().st_size // 100 + PROMPT_TOKEN_OVERHEAD
+
+    def generate_with_rate_limit(self, contents, estimated_tokens: int):
+        """Call generate_content within the RPM/TPM budgets, retrying on 429s."""
+        for attempt in range(self.max_rate_limit_retries):
+            try:
+                with self.rate_limiter.request(estimated_tokens) as permit:
+                    response = self.model.generate_content(contents, request_options={"timeout": 600})
+                    usage = getattr(response, 'usage_metadata', None)
+                    if usage is not None and getattr(usage, 'prompt_token_count', None):
+                        permit.actual_tokens = usage.prompt_token_count
+                    return response
+            except Exception as e:
+                # The limiter has already paused and cut concurrency, so just try again
+                if is_rate_limit_error(e) and attempt < self.max_rate_limit_retries - 1:
+                    logger.warning(f"Rate limited (attempt {attempt + 1}/{self.max_rate_limit_retries}), retrying...")
+                    continue
+                raise
+
     def clean_json_response(self, text: str) -> str:
         """Clean and extract valid JSON from Gemini's response."""
         try:
@@ -349,114 +456,329 @@ class PDFAnalyzer:
             raw.text = text[:1000]  # Limit raw text to first 1000 chars
             return ET.tostring(root, encoding='unicode', method='xml')
 
-    def analyze_single_pdf(self, pdf_path: Path) -> Optional[Tuple[str, str]]:
-        """Analyze a single PDF using Gemini API and rename it. Returns (analysis_result, new_filename)."""
-        try:
-            logger.info(f"Analyzing {pdf_path.name}...")
+    def cache_lookup(self, pdf_path: Path, session: Optional[PDFDocumentSession] = None) -> Tuple[str, str, Optional[str]]:
+        """Hash the PDF and look up a previous response. Returns (pdf_hash, cache_key, cached_response)."""
+        pdf_hash = session.sha256 if session is not None else sha256_file(pdf_path)
+        cache_key = self.cache.make_key(pdf_hash, SYSTEM_INSTRUCTION, ANALYSIS_PROMPT, self.model_name)
+        return pdf_hash, cache_key, self.cache.get(cache_key)
 
-            # Generate a unique name for the file (under 40 chars)
-            file_name = self.generate_upload_name(pdf_path.stem)
-            logger.info(f"Using upload name: {file_name}")
+    def text_cache_key(self, pdf_hash: str) -> str:
+        """Cache key of a text-mode analysis, which depends on the token budget as well."""
+        return self.cache.make_key(pdf_hash, SYSTEM_INSTRUCTION,
+                                   f"{TEXT_ANALYSIS_PROMPT}\n[budget {self.text_token_budget}]", self.model_name)
 
-            # Upload file to Gemini
-            try:
-                pdf_file = genai.get_file(f"files/{file_name}")
-                logger.info(f"File already exists: {pdf_file.uri}")
-            except:
-                logger.info(f"Uploading file...")
-                pdf_file = genai.upload_file(path=str(pdf_path), name=file_name, resumable=True)
-                logger.info(f"Completed upload: {pdf_file.uri}")
-
-            # Wait for processing
-            while pdf_file.state.name == "PROCESSING":
-                logger.info("Processing...")
-                time.sleep(10)
-                pdf_file = genai.get_file(pdf_file.name)
-
-            if pdf_file.state.name == "FAILED":
-                raise ValueError(f"File processing failed: {pdf_file.state.name}")
-
-            # Generate analysis
-            logger.info("Generating analysis...")
-            response = self.model.generate_content(
-                [pdf_file, """Please analyze this academic paper and extract the requested information in XML format.
-                Format your response as a valid XML document with root element <analysis> containing the specified fields as child elements.
-                Use clear, descriptive text and preserve any important formatting or structure in the content.
-                Ensure all XML tags are properly closed and nested."""],
-                request_options={"timeout": 600}
-            )
+    def prepare_text(self, pdf_path: Path, session: Optional[PDFDocumentSession] = None) -> Optional[PaperText]:
+        """
+        Trimmed text to send inline in text mode.
 
-            # Clean and format XML response
-            analysis_result = self.clean_xml_response(response.text)
+        Returns None in PDF mode, and for scanned or image-only PDFs, which are uploaded instead.
+        """
+        if self.analysis_mode != 'text':
+            return None
+        if session is not None:
+            paper = session_paper_text(session, self.text_token_budget)
+        else:
+            with fitz.open(pdf_path) as doc:
+                paper = extract_paper_text([page.get_text() for page in doc], self.text_token_budget)
+        if paper is None:
+            logger.info(f"{pdf_path.name} has little extractable text; uploading the PDF instead")
+        else:
+            logger.info(f"Sending {paper.tokens} tokens of text from {paper.pages} pages "
+                        f"({', '.join(paper.sections)}{', trimmed' if paper.truncated else ''})")
+        return paper
 
-            # Pretty print the XML
+    def cache_store(self, pdf_hash: str, cache_key: str, response_text: str, analysis_result: str):
+        """Cache a response, unless it could not be turned into a usable analysis."""
+        try:
+            if ET.fromstring(analysis_result).find('error') is not None:
+                return
+        except ET.ParseError:
+            return
+        self.cache.put(cache_key, response_text, pdf_sha256=pdf_hash, model_name=self.model_name)
+
+    @staticmethod
+    def claim_name(pdf_path: Path, new_path: Path) -> bool:
+        """Move pdf_path to new_path unless new_path exists; the check and the move are one atomic step."""
+        try:
+            os.link(pdf_path, new_path)
+        except FileExistsError:
+            return False
+        except OSError:
+            # No hard links on this filesystem: reserve the name, then move over the reservation
             try:
-                parsed = minidom.parseString(analysis_result)
-                analysis_result = parsed.toprettyxml(indent="  ")
-                # Remove empty lines while preserving whitespace
-                analysis_result = '\n'.join(line for line in analysis_result.split('\n') if line.strip())
-            except Exception as e:
-                logger.error(f"Error pretty printing XML: {e}")
+                os.close(os.open(new_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                return False
+            os.replace(pdf_path, new_path)
+            return True
+        pdf_path.unlink()
+        return True
+
+    def save_analysis(self, pdf_path: Path, response_text: str) -> Tuple[str, str]:
+        """Clean the model's response, rename the PDF from it and save the analysis XML."""
+        # Clean and format XML response
+        analysis_result = self.clean_xml_response(response_text)
+
+        # Pretty print the XML
+        try:
+            parsed = minidom.parseString(analysis_result)
+            analysis_result = parsed.toprettyxml(indent="  ")
+            # Remove empty lines while preserving whitespace
+            analysis_result = '\n'.join(line for line in analysis_result.split('\n') if line.strip())
+        except Exception as e:
+            logger.error(f"Error pretty printing XML: {e}")
+
+        # Extract title and authors for filename from XML
+        try:
+            root = ET.fromstring(analysis_result)
+            title = root.find('title').text if root.find('title') is not None else ""
+            authors = root.find('authors').text if root.find('authors') is not None else ""
+            year = root.find('publication_year').text if root.find('publication_year') is not None else ""
 
-            # Extract title and authors for filename from XML
+            # Generate filename components
+            components = []
+            if authors:
+                first_author = self.extract_first_author_lastname(authors)
+                if first_author:
+                    components.append(self.sanitize_filename(first_author))
+
+            if title:
+                title_words = [w for w in re.findall(r'\w+', title.lower())
+                             if len(w) > 3 and w not in {'with', 'using', 'from', 'through', 'based'}]
+                if title_words:
+                    components.append('_'.join(title_words[:3]))
+
+            if year and re.match(r'\d{4}', year):
+                components.append(year)
+
+            new_name = '_'.join(components) + '.pdf' if components else pdf_path.name
+        except Exception as e:
+            logger.error(f"Error extracting filename components from XML: {e}")
+            new_name = pdf_path.name
+
+        # Generate new filename based on JSON response
+        new_path = pdf_path.parent / new_name
+
+        # Rename the PDF file, never overwriting an existing one: analyses are saved
+        # concurrently, so the free name is claimed atomically rather than checked first
+        stem = new_name.rsplit('.', 1)[0]
+        counter = 1
+        while new_path != pdf_path and not self.claim_name(pdf_path, new_path):
+            new_path = pdf_path.parent / f"{stem}_{counter}.pdf"
+            counter += 1
+        if new_path != pdf_path:
+            logger.info(f"Renamed file to: {new_path.name}")
+
+        # Save analysis with matching name
+        analysis_filename = new_path.stem + "_analysis.xml"
+        output_path = self.analysis_dir / analysis_filename
+
+        # Save XML analysis
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(analysis_result)
+
+        logger.info(f"Analysis saved to {output_path}")
+        if self.analysis_index:
             try:
-                root = ET.fromstring(analysis_result)
-                title = root.find('title').text if root.find('title') is not None else ""
-                authors = root.find('authors').text if root.find('authors') is not None else ""
-                year = root.find('publication_year').text if root.find('publication_year') is not None else ""
-
-                # Generate filename components
-                components = []
-                if authors:
-                    first_author = self.extract_first_author_lastname(authors)
-                    if first_author:
-                        components.append(self.sanitize_filename(first_author))
-
-                if title:
-                    title_words = [w for w in re.findall(r'\w+', title.lower())
-                                 if len(w) > 3 and w not in {'with', 'using', 'from', 'through', 'based'}]
-                    if title_words:
-                        components.append('_'.join(title_words[:3]))
-
-                if year and re.match(r'\d{4}', year):
-                    components.append(year)
-
-                new_name = '_'.join(components) + '.pdf' if components else pdf_path.name
+                self.analysis_index.index_file(output_path, force=True)
             except Exception as e:
-                logger.error(f"Error extracting filename components from XML: {e}")
-                new_name = pdf_path.name
+                logger.warning(f"Could not index {output_path.name}: {e}")
 
-            # Generate new filename based on JSON response
-            new_path = pdf_path.parent / new_name
+        return analysis_result, new_path.name
 
-            # Ensure we don't overwrite existing files
-            counter = 1
-            while new_path.exists() and new_path != pdf_path:
-                stem = new_name.rsplit('.', 1)[0]
-                new_path = pdf_path.parent / f"{stem}_{counter}.pdf"
-                counter += 1
+    def ensure_uploaded(self, pdf_path: Path, pdf_hash: str, session: Optional[PDFDocumentSession] = None):
+        """Return a Gemini file reference for the PDF, uploading and waiting for processing only when needed."""
+        record = self.uploads.get_active(pdf_hash)
+        if record:
+            logger.info(f"Reusing uploaded file: {record.uri}")
+            return genai.protos.FileData(mime_type=record.mime_type, file_uri=record.uri)
 
-            # Rename the PDF file
-            if new_path != pdf_path:
-                pdf_path.rename(new_path)
-                logger.info(f"Renamed file to: {new_path.name}")
+        file_name = self.generate_upload_name(pdf_path.stem, pdf_hash)
+        logger.info(f"Using upload name: {file_name}")
+        try:
+            pdf_file = genai.get_file(f"files/{file_name}")
+            logger.info(f"File already exists: {pdf_file.uri}")
+        except Exception:
+            logger.info(f"Uploading file...")
+            pdf_file = genai.upload_file(path=str(pdf_path), name=file_name, resumable=True)
+            logger.info(f"Completed upload: {pdf_file.uri}")
+
+        # Wait for processing
+        while pdf_file.state.name == "PROCESSING":
+            logger.info("Processing...")
+            time.sleep(10)
+            pdf_file = genai.get_file(pdf_file.name)
+
+        if pdf_file.state.name == "FAILED":
+            raise ValueError(f"File processing failed: {pdf_file.state.name}")
+
+        self.uploads.register(
+            pdf_hash, pdf_file.name, pdf_file.uri, pdf_file.state.name,
+            mime_type=pdf_file.mime_type, expires_at=parse_expiration(pdf_file.expiration_time)
+        )
+        return pdf_file
 
-            # Save analysis with matching name
-            analysis_filename = new_path.stem + "_analysis.xml"
-            output_path = self.analysis_dir / analysis_filename
+    def analyze_single_pdf(self, pdf_path: Path, session: Optional[PDFDocumentSession] = None) -> Optional[Tuple[str, str]]:
+        """
+        Analyze a single PDF using Gemini API and rename it. Returns (analysis_result, new_filename).
 
-            # Save XML analysis
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(analysis_result)
+        An open document session, if given, supplies the hash and page count without
+        parsing the file again.
+        """
+        try:
+            logger.info(f"Analyzing {pdf_path.name}...")
 
-            logger.info(f"Analysis saved to {output_path}")
+            # Reuse a previous analysis of identical content
+            pdf_hash, cache_key, cached = self.cache_lookup(pdf_path, session)
+            if cached is not None:
+                logger.info(f"Using cached analysis for {pdf_path.name}")
+                return self.save_analysis(pdf_path, cached)
+
+            paper = self.prepare_text(pdf_path, session)
+            if paper is not None:
+                cache_key = self.text_cache_key(pdf_hash)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Using cached text analysis for {pdf_path.name}")
+                    return self.save_analysis(pdf_path, cached)
+
+                logger.info("Generating analysis from text...")
+                response = self.generate_with_rate_limit([TEXT_ANALYSIS_PROMPT, paper.text],
+                                                         paper.tokens + PROMPT_TOKEN_OVERHEAD)
+            else:
+                # Upload file to Gemini, unless a live copy is already registered
+                pdf_file = self.ensure_uploaded(pdf_path, pdf_hash, session)
+
+                # Generate analysis
+                logger.info("Generating analysis...")
+                try:
+                    response = self.generate_with_rate_limit([pdf_file, ANALYSIS_PROMPT],
+                                                             self.estimate_tokens(pdf_path, session))
+                except Exception as e:
+                    # The remote copy may have been deleted; upload afresh next time
+                    if not is_rate_limit_error(e):
+                        self.uploads.invalidate(pdf_hash)
+                    raise
 
-            return analysis_result, new_path.name
+            result = self.save_analysis(pdf_path, response.text)
+            self.cache_store(pdf_hash, cache_key, response.text, result[0])
+            return result
 
         except Exception as e:
             logger.error(f"Error analyzing {pdf_path.name}: {e}")
             return None
 
+    def get_async_client(self) -> AsyncGeminiClient:
+        """Return the shared async REST client, creating it on first use."""
+        if self._async_client is None:
+            self._async_client = AsyncGeminiClient(self.api_key)
+        return self._async_client
+
+    async def close_async(self):
+        """Close the async client's HTTP session."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    async def generate_with_rate_limit_async(self, parts, estimated_tokens: int):
+        """Async counterpart of generate_with_rate_limit."""
+        client = self.get_async_client()
+        for attempt in range(self.max_rate_limit_retries):
+            try:
+                async with self.rate_limiter.request(estimated_tokens) as permit:
+                    result = await client.generate_content(self.model_name, parts, SYSTEM_INSTRUCTION)
+                    if result.prompt_token_count:
+                        permit.actual_tokens = result.prompt_token_count
+                    return result
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < self.max_rate_limit_retries - 1:
+                    logger.warning(f"Rate limited (attempt {attempt + 1}/{self.max_rate_limit_retries}), retrying...")
+                    continue
+                raise
+
+    async def ensure_uploaded_async(self, pdf_path: Path, pdf_hash: str,
+                                    session: Optional[PDFDocumentSession] = None) -> RemoteFile:
+        """Async counterpart of ensure_uploaded."""
+        record = await asyncio.to_thread(self.uploads.get_active, pdf_hash)
+        if record:
+            logger.info(f"Reusing uploaded file: {record.uri}")
+            return RemoteFile(name=record.remote_name, uri=record.uri, state=record.state,
+                              mime_type=record.mime_type)
+
+        client = self.get_async_client()
+        file_name = self.generate_upload_name(pdf_path.stem, pdf_hash)
+        try:
+            pdf_file = await client.get_file(file_name)
+            logger.info(f"File already exists: {pdf_file.uri}")
+        except Exception:
+            logger.info("Uploading file...")
+            pdf_file = await client.upload_file(pdf_path, name=file_name)
+            logger.info(f"Completed upload: {pdf_file.uri}")
+
+        # Wait for processing
+        pdf_file = await client.wait_for_active(pdf_file)
+        if pdf_file.state == "FAILED":
+            raise ValueError(f"File processing failed: {pdf_file.state}")
+
+        await asyncio.to_thread(
+            self.uploads.register, pdf_hash, pdf_file.name, pdf_file.uri, pdf_file.state,
+            pdf_file.mime_type, parse_expiration(pdf_file.expiration_time)
+        )
+        return pdf_file
+
+    async def analyze_single_pdf_async(self, pdf_path: Path,
+                                       session: Optional[PDFDocumentSession] = None) -> Optional[Tuple[str, str]]:
+        """Analyze a single PDF without blocking the event loop. Returns (analysis_result, new_filename)."""
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_async_concurrency)
+
+        async with self._async_semaphore:
+            try:
+                logger.info(f"Analyzing {pdf_path.name}...")
+
+                # Reuse a previous analysis of identical content
+                pdf_hash, cache_key, cached = await asyncio.to_thread(self.cache_lookup, pdf_path, session)
+                if cached is not None:
+                    logger.info(f"Using cached analysis for {pdf_path.name}")
+                    return await asyncio.to_thread(self.save_analysis, pdf_path, cached)
+
+                paper = await asyncio.to_thread(self.prepare_text, pdf_path, session)
+                if paper is not None:
+                    cache_key = self.text_cache_key(pdf_hash)
+                    cached = await asyncio.to_thread(self.cache.get, cache_key)
+                    if cached is not None:
+                        logger.info(f"Using cached text analysis for {pdf_path.name}")
+                        return await asyncio.to_thread(self.save_analysis, pdf_path, cached)
+
+                    logger.info("Generating analysis from text...")
+                    result = await self.generate_with_rate_limit_async(
+                        [text_part(TEXT_ANALYSIS_PROMPT), text_part(paper.text)], paper.tokens + PROMPT_TOKEN_OVERHEAD
+                    )
+                else:
+                    # Upload file to Gemini, unless a live copy is already registered
+                    pdf_file = await self.ensure_uploaded_async(pdf_path, pdf_hash, session)
+
+                    # Generate analysis
+                    logger.info("Generating analysis...")
+                    estimated_tokens = await asyncio.to_thread(self.estimate_tokens, pdf_path, session)
+                    try:
+                        result = await self.generate_with_rate_limit_async(
+                            [file_part(pdf_file), text_part(ANALYSIS_PROMPT)], estimated_tokens
+                        )
+                    except Exception as e:
+                        # The remote copy may have been deleted; upload afresh next time
+                        if not is_rate_limit_error(e):
+                            await asyncio.to_thread(self.uploads.invalidate, pdf_hash)
+                        raise
+
+                analysis = await asyncio.to_thread(self.save_analysis, pdf_path, result.text)
+                await asyncio.to_thread(self.cache_store, pdf_hash, cache_key, result.text, analysis[0])
+                return analysis
+
+            except Exception as e:
+                logger.error(f"Error analyzing {pdf_path.name}: {e}")
+                return None
+
     def analyze_all(self):
         """Analyze all PDFs in the source directory."""
         pdf_files = list(self.source_dir.glob('*.pdf'))
@@ -466,26 +788,14 @@ class PDFAnalyzer:
 
         logger.info(f"Found {len(pdf_files)} PDF files to analyze")
 
-        for i, pdf_path in enumerate(pdf_files):
+        # Pacing and 429 back-off are handled by the shared rate limiter
+        for pdf_path in pdf_files:
             if pdf_path.name != '.gitkeep':  # Skip .gitkeep file
                 try:
-                    # Add delay between files to avoid rate limiting
-                    if i > 0:
-                        delay = 15  # 15 seconds delay between files
-                        logger.info(f"Waiting {delay} seconds before processing next file...")
-                        time.sleep(delay)
-
                     self.analyze_single_pdf(pdf_path)
                 except Exception as e:
-                    if "429" in str(e) or "quota" in str(e).lower():
-                        wait_time = 300  # 5 minutes if we hit quota limit
-                        logger.warning(f"Hit API quota limit. Waiting {wait_time} seconds before retrying...")
-                        time.sleep(wait_time)
-                        # Retry this file
-                        self.analyze_single_pdf(pdf_path)
-                    else:
-                        logger.error(f"Error processing {pdf_path.name}: {e}")
-                        continue
+                    logger.error(f"Error processing {pdf_path.name}: {e}")
+                    continue
 
     def analyze_specific(self, pdf_name: str):
         """Analyze a specific PDF file."""
@@ -502,6 +812,8 @@ def main():
     parser = argparse.ArgumentParser(description='Analyze and rename PDF files using Gemini API')
     parser.add_argument('--file', '-f', help='Specific PDF file to analyze (must be in sources_pdf/)')
     parser.add_argument('--list', '-l', action='store_true', help='List available PDF files')
+    parser.add_argument('--mode', choices=ANALYSIS_MODES,
+                        help="'text' sends extracted text instead of uploading (scanned PDFs are still uploaded)")
     args = parser.parse_args()
 
     # Load environment variables
@@ -513,7 +825,7 @@ def main():
         print("Error: GEMINI_API_KEY environment variable is not set. Please check your .env file.")
         return
 
-    analyzer = PDFAnalyzer(api_key)
+    analyzer = PDFAnalyzer(api_key, analysis_mode=args.mode)
 
     if args.list:
         # List available PDFs
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Shared, single-open PDF document session.
+
+Parses a PDF once, then hands the same document, page text and content hash
+to every stage (analysis, Markdown, PNG) before releasing everything
+deterministically on close. The document is opened from its path, so MuPDF
+loads objects on demand and memory stays flat even for very large volumes;
+the bytes are only ever read in chunks, for hashing and upload.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import fitz
+
+try:
+    from scripts.hashing import sha256_file
+except ImportError:
+    from hashing import sha256_file
+
+logger = logging.getLogger(__name__)
+
+class PDFDocumentSession:
+    """Open a PDF once and share its parsed document, content hash and page text between converters."""
+
+    def __init__(self, path: Union[str, Path]):
+        """Initialize the session. Nothing is read until first use."""
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"PDF file not found: {self.path}")
+        self._doc: Optional[fitz.Document] = None
+        self._sha256: Optional[str] = None
+        self._page_text: Dict[int, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 of the PDF bytes, read in chunks."""
+        if self._sha256 is None:
+            self._sha256 = sha256_file(self.path)
+        return self._sha256
+
+    @property
+    def doc(self) -> fitz.Document:
+        """
+        The parsed document, opened from the file.
+
+        The open handle survives the file being renamed (update `path` afterwards
+        so a session opened later finds it).
+        """
+        if self._doc is None:
+            self._doc = fitz.open(self.path)
+        return self._doc
+
+    @property
+    def page_count(self) -> int:
+        return len(self.doc)
+
+    def page_text(self, page_index: int, cache: bool = True) -> str:
+        """Plain text of a page (0-based). Cached for other stages unless `cache` is False."""
+        if page_index in self._page_text:
+            return self._page_text[page_index]
+        text = self.doc[page_index].get_text()
+        if cache:
+            self._page_text[page_index] = text
+        return text
+
+    def close(self):
+        """Release the parsed document and cached text."""
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+        self._page_text.clear()
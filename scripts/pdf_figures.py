@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Figure-region detection and extraction for PDF pages.
+
+Embedded raster images are written out as stored in the PDF (no re-encoding
+for JPEG/PNG streams). Vector figures are located by clustering the page's
+drawing paths, together with any image blocks they overlap, and only those
+clips are rendered. Pages that hold nothing but text produce no output.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Set
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Stored image formats that are written out byte for byte
+PASSTHROUGH_FORMATS = {'png', 'jpeg', 'jpg'}
+
+@dataclass
+class FigureRegion:
+    """A cluster of drawings and/or images on a page."""
+    rect: fitz.Rect
+    drawings: int = 0
+    image_xrefs: Set[int] = field(default_factory=set)
+
+    @property
+    def is_vector(self) -> bool:
+        return self.drawings > 0
+
+def _merge_regions(regions: List[FigureRegion], gap: float) -> List[FigureRegion]:
+    """Merge regions whose rectangles touch once inflated by `gap`, until none do."""
+    merged = True
+    while merged:
+        merged = False
+        result: List[FigureRegion] = []
+        for region in regions:
+            grown = fitz.Rect(region.rect) + (-gap, -gap, gap, gap)
+            for other in result:
+                if grown.intersects(other.rect):
+                    other.rect |= region.rect
+                    other.drawings += region.drawings
+                    other.image_xrefs |= region.image_xrefs
+                    merged = True
+                    break
+            else:
+                result.append(region)
+        regions = result
+    return regions
+
+def find_figure_regions(page: fitz.Page, min_size: float = 48, gap: float = 8,
+                        max_page_fraction: float = 0.9, margin: float = 6) -> List[FigureRegion]:
+    """
+    Locate figure bounding boxes on a page.
+
+    Args:
+        page: Page to inspect
+        min_size: Minimum width and height in points; drops rules, underlines and icons
+        gap: Distance in points within which drawings belong to the same figure
+        max_page_fraction: Drawings covering more of the page are treated as backgrounds
+        margin: Padding added around each region so nearby axis labels are kept
+
+    Returns:
+        Regions in reading order (top to bottom, left to right)
+    """
+    page_rect = page.rect
+    page_area = page_rect.get_area()
+    regions = []
+
+    for drawing in page.get_drawings():
+        rect = fitz.Rect(drawing['rect'])
+        if rect.width == 0 and rect.height == 0:
+            continue
+        # Give horizontal/vertical lines some thickness so they can be merged
+        if rect.width < 1:
+            rect.x0, rect.x1 = rect.x0 - 0.5, rect.x1 + 0.5
+        if rect.height < 1:
+            rect.y0, rect.y1 = rect.y0 - 0.5, rect.y1 + 0.5
+        if rect.get_area() > max_page_fraction * page_area:
+            continue
+        regions.append(FigureRegion(rect, drawings=1))
+
+    for info in page.get_image_info(xrefs=True):
+        rect = fitz.Rect(info['bbox']) & page_rect
+        if rect.is_empty:
+            continue
+        xrefs = {info['xref']} if info.get('xref') else set()
+        regions.append(FigureRegion(rect, image_xrefs=xrefs))
+
+    figures = []
+    for region in _merge_regions(regions, gap):
+        if region.rect.width < min_size or region.rect.height < min_size:
+            continue
+        region.rect = (region.rect + (-margin, -margin, margin, margin)) & page_rect
+        figures.append(region)
+    figures.sort(key=lambda region: (round(region.rect.y0), region.rect.x0))
+    return figures
+
+def extract_embedded_image(doc: fitz.Document, xref: int, output_stem: Path) -> Path:
+    """
+    Write an embedded image to `output_stem` plus a suitable extension.
+
+    JPEG and PNG streams without a soft mask are copied unchanged; anything else
+    (JPX, JBIG2, CMYK, images with transparency masks) is converted to PNG.
+    """
+    info = doc.extract_image(xref)
+    extension = info.get('ext', 'png')
+    if extension in PASSTHROUGH_FORMATS and not info.get('smask'):
+        output_path = output_stem.with_suffix(f".{extension}")
+        output_path.write_bytes(info['image'])
+        return output_path
+
+    pix = fitz.Pixmap(doc, xref)
+    if pix.colorspace and pix.colorspace.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if info.get('smask'):
+        pix = fitz.Pixmap(pix, fitz.Pixmap(doc, info['smask']))
+    output_path = output_stem.with_suffix('.png')
+    pix.save(str(output_path))
+    return output_path
+
+def first_image_pages(doc: fitz.Document) -> Dict[int, int]:
+    """Index of the first page each embedded image appears on, by xref. Reads page resources only."""
+    first_pages: Dict[int, int] = {}
+    for page in doc:
+        for image in page.get_images():
+            first_pages.setdefault(image[0], page.number)
+    return first_pages
+
+def extract_page_images(doc: fitz.Document, page: fitz.Page, output_dir: Path, seen_xrefs: Set[int],
+                        min_pixels: int = 64) -> List[Path]:
+    """
+    Write the embedded raster images of a page, skipping small ones and images already written.
+
+    Args:
+        doc: Document owning the page
+        page: Page whose images are extracted
+        output_dir: Directory to write into
+        seen_xrefs: Image xrefs already extracted (updated in place); shared images such as
+            logos repeated on every page are written once. When pages are split across
+            workers, seed it from first_image_pages with the images of earlier pages.
+        min_pixels: Minimum width and height in pixels
+
+    Returns:
+        Paths of the files written
+    """
+    written = []
+    for image in page.get_images(full=True):
+        xref, width, height = image[0], image[2], image[3]
+        if xref in seen_xrefs or width < min_pixels or height < min_pixels:
+            continue
+        seen_xrefs.add(xref)
+        try:
+            written.append(extract_embedded_image(doc, xref, output_dir / f"page_{page.number + 1:03d}_img_{xref}"))
+        except Exception as e:
+            logger.warning(f"Could not extract image {xref} on page {page.number + 1}: {e}")
+    return written
@@ -3,9 +3,23 @@
 import fitz
 from pathlib import Path
 import logging
-from typing import Optional, Union
+import os
+import sys
+import tempfile
+from typing import Iterator, Optional, Union
 from dataclasses import dataclass
 
+try:
+    from scripts.pdf_document import PDFDocumentSession
+    from scripts.hashing import sha256_text
+    from scripts.search_index import SearchIndex
+    from scripts.semantic_index import SemanticIndex
+except ImportError:
+    from pdf_document import PDFDocumentSession
+    from hashing import sha256_text
+    from search_index import SearchIndex
+    from semantic_index import SemanticIndex
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -13,27 +27,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PAGE_SEPARATOR = "\n---\n"
+
 @dataclass
 class ConversionResult:
-    """Result of a PDF to Markdown conversion."""
-    text_content: str
+    """Result of a PDF to Markdown conversion. `text_content` is None for streamed conversions."""
+    text_content: Optional[str]
     page_count: int
     source_path: Path
 
 class PDFToMarkdown:
     """Convert PDF files to Markdown format."""
 
-    def __init__(self):
-        """Initialize the converter."""
+    def __init__(self, index: Optional[SearchIndex] = None, semantic_index: Optional[SemanticIndex] = None):
+        """Initialize the converter, optionally indexing every file it writes for full-text and semantic search."""
         self.logger = logger
+        self.index = index
+        self.semantic_index = semantic_index
+
+    def index_output(self, output_path: Path):
+        """Add a freshly written Markdown file to the configured indexes. Indexing errors are only logged."""
+        for index in (self.index, self.semantic_index):
+            if index:
+                try:
+                    index.index_file(output_path, force=True)
+                except Exception as e:
+                    self.logger.warning(f"Could not index {output_path.name}: {e}")
+
+    def settings_fingerprint(self) -> str:
+        """Hash of the converter settings that shape the Markdown output."""
+        return sha256_text('markdown', PAGE_SEPARATOR, fitz.VersionBind)
+
+    def iter_pages(self, input_path: Union[str, Path],
+                   session: Optional[PDFDocumentSession] = None) -> Iterator[str]:
+        """
+        Yield the markdown for each non-empty page, one page at a time.
+
+        Args:
+            input_path: Path to the PDF file
+            session: Optional open document session shared with other stages
 
-    def convert(self, input_path: Union[str, Path], output_path: Optional[Union[str, Path]] = None) -> ConversionResult:
+        Yields:
+            A "## Page N" section per page that contains text
+        """
+        owned = session is None
+        if owned:
+            session = PDFDocumentSession(input_path)
+        try:
+            for page_index in range(session.page_count):
+                # Only keep page text around when other stages share the session
+                text = session.page_text(page_index, cache=not owned)
+                if text.strip():
+                    yield f"## Page {page_index + 1}\n\n{text}\n"
+        finally:
+            if owned:
+                session.close()
+
+    def convert(self, input_path: Union[str, Path], output_path: Optional[Union[str, Path]] = None,
+                stream: bool = False, session: Optional[PDFDocumentSession] = None) -> ConversionResult:
         """
         Convert a PDF file to markdown format.
 
         Args:
             input_path: Path to the PDF file
             output_path: Optional path to save the markdown file. If not provided, only returns the content.
+            stream: Write pages to the output file as they are extracted instead of building the
+                whole document in memory. Requires output_path; the result has no text_content.
+            session: Optional open document session shared with other stages
 
         Returns:
             ConversionResult object containing the converted text and metadata
@@ -41,22 +101,29 @@ class PDFToMarkdown:
         input_path = Path(input_path)
         if not input_path.exists():
             raise FileNotFoundError(f"PDF file not found: {input_path}")
+        if stream and not output_path:
+            raise ValueError("Streaming conversion requires an output path")
 
         self.logger.info(f"Processing PDF: {input_path.name}")
 
-        # Open the PDF
-        doc = fitz.open(input_path)
-        total_pages = len(doc)
+        if session is not None:
+            total_pages = session.page_count
+        else:
+            with fitz.open(input_path) as doc:
+                total_pages = len(doc)
         self.logger.info(f"Total pages: {total_pages}")
 
-        # Convert content
-        content = []
-        for page_num, page in enumerate(doc, 1):
-            text = page.get_text()
-            if text.strip():
-                content.append(f"## Page {page_num}\n\n{text}\n")
+        if stream:
+            self.write_pages(self.iter_pages(input_path, session), Path(output_path))
+            self.index_output(Path(output_path))
+            return ConversionResult(
+                text_content=None,
+                page_count=total_pages,
+                source_path=input_path
+            )
 
-        markdown_content = "\n---\n".join(content)
+        # Convert content
+        markdown_content = PAGE_SEPARATOR.join(self.iter_pages(input_path, session))
 
         # Save to file if output path is provided
         if output_path:
@@ -64,6 +131,7 @@ class PDFToMarkdown:
             output_path.parent.mkdir(parents=True, exist_ok=True)
             output_path.write_text(markdown_content, encoding='utf-8')
             self.logger.info(f"Saved markdown to: {output_path}")
+            self.index_output(output_path)
 
         return ConversionResult(
             text_content=markdown_content,
@@ -71,17 +139,40 @@ class PDFToMarkdown:
             source_path=input_path
         )
 
+    def write_pages(self, pages: Iterator[str], output_path: Path):
+        """Write pages incrementally to a temp file, then atomically move it into place."""
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for i, page in enumerate(pages):
+                    if i:
+                        f.write(PAGE_SEPARATOR)
+                    f.write(page)
+            os.replace(temp_name, output_path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+        self.logger.info(f"Saved markdown to: {output_path}")
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Convert PDF to Markdown')
     parser.add_argument('input_path', type=str, help='Path to the PDF file')
     parser.add_argument('-o', '--output', type=str, help='Output markdown file path')
+    parser.add_argument('--stream', action='store_true', help='Write pages incrementally to keep memory flat')
 
     args = parser.parse_args()
 
     converter = PDFToMarkdown()
     try:
-        result = converter.convert(args.input_path, args.output)
+        if args.stream and not args.output:
+            # Stream straight to stdout, one page at a time
+            for i, page in enumerate(converter.iter_pages(args.input_path)):
+                sys.stdout.write(PAGE_SEPARATOR + page if i else page)
+            sys.stdout.write("\n")
+            return
+        result = converter.convert(args.input_path, args.output, stream=args.stream)
         if not args.output:
             print(result.text_content)
     except Exception as e:
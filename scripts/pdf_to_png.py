@@ -2,9 +2,23 @@
 
 import fitz  # PyMuPDF
 from pathlib import Path
+import json
 import logging
-from typing import Optional, Union
-from dataclasses import dataclass
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from dataclasses import dataclass, field
+
+try:
+    from scripts.pdf_document import PDFDocumentSession
+    from scripts.hashing import sha256_text
+    from scripts.pdf_figures import extract_page_images, find_figure_regions, first_image_pages
+except ImportError:
+    from pdf_document import PDFDocumentSession
+    from hashing import sha256_text
+    from pdf_figures import extract_page_images, find_figure_regions, first_image_pages
 
 # Configure logging
 logging.basicConfig(
@@ -13,27 +27,232 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+IMAGE_FORMATS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """How pages are rasterized and encoded."""
+    name: str
+    dpi: int = 300
+    grayscale: bool = False
+    alpha: bool = False
+    format: str = 'png'
+    # JPEG/WebP quality (1-100); ignored for PNG
+    quality: int = 90
+    # Widths in pixels of downscaled copies made from the same render
+    thumbnails: Tuple[int, ...] = ()
+    # Extract embedded images and render only vector figure regions instead of whole pages
+    figures_only: bool = False
+
+    def __post_init__(self):
+        if self.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {self.format}")
+        if self.alpha and self.format == 'jpeg':
+            raise ValueError("JPEG output cannot carry an alpha channel")
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_FORMATS[self.format]
+
+    def fingerprint(self) -> str:
+        """Hash of every setting that changes the rendered files."""
+        return sha256_text(self.name, str(self.dpi), str(self.grayscale), str(self.alpha), self.format,
+                           str(self.quality), ','.join(map(str, self.thumbnails)), str(self.figures_only))
+
+RENDER_PROFILES: Dict[str, RenderProfile] = {
+    # Lossless 300 DPI pages, as used for docx embedding
+    'full': RenderProfile('full'),
+    # Readable on screen, a fraction of the size, with small previews
+    'preview': RenderProfile('preview', dpi=150, format='jpeg', quality=85, thumbnails=(320,)),
+    # Cheapest option for bulk runs
+    'bulk': RenderProfile('bulk', dpi=96, grayscale=True, format='jpeg', quality=70),
+    # Figure previews only
+    'thumbnails': RenderProfile('thumbnails', dpi=72, format='jpeg', quality=80, thumbnails=(160,)),
+    # Embedded images as stored plus 200 DPI clips of vector figures; text-only pages are skipped
+    'figures': RenderProfile('figures', dpi=200, figures_only=True),
+}
+
+DEFAULT_PROFILE = 'full'
+
+FIGURE_INDEX = 'figures.json'
+
+@dataclass
+class RenderStats:
+    """Work done rendering a range of pages."""
+    pages: int = 0
+    files: int = 0
+    bytes_written: int = 0
+    render_seconds: float = 0.0
+    write_seconds: float = 0.0
+    # Entries for figures.json when extracting figures only
+    figures: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __add__(self, other: 'RenderStats') -> 'RenderStats':
+        return RenderStats(
+            self.pages + other.pages,
+            self.files + other.files,
+            self.bytes_written + other.bytes_written,
+            self.render_seconds + other.render_seconds,
+            self.write_seconds + other.write_seconds,
+            self.figures + other.figures
+        )
+
 @dataclass
 class ConversionResult:
     """Result of a PDF to PNG conversion."""
     page_count: int
     source_path: Path
     output_directory: Path
+    profile: str = DEFAULT_PROFILE
+    stats: RenderStats = field(default_factory=RenderStats)
+
+def get_profile(profile: Union[str, RenderProfile]) -> RenderProfile:
+    """Look up a render profile by name."""
+    if isinstance(profile, RenderProfile):
+        return profile
+    try:
+        return RENDER_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown render profile '{profile}'. Choose from: {', '.join(RENDER_PROFILES)}")
+
+def save_image(pix: fitz.Pixmap, path: Path, profile: RenderProfile) -> int:
+    """Encode a pixmap in the profile's format. Returns the bytes written."""
+    if profile.format == 'png':
+        pix.save(str(path))
+    elif profile.format == 'jpeg':
+        pix.save(str(path), jpg_quality=profile.quality)
+    else:
+        try:
+            pix.pil_save(str(path), format='WEBP', quality=profile.quality)
+        except ImportError:
+            raise ImportError("WebP output requires Pillow. Install it with 'pip install Pillow'")
+    return path.stat().st_size
+
+def write_pixmap(pix: fitz.Pixmap, output_dir: Path, filename: str, profile: RenderProfile,
+                 stats: RenderStats) -> Path:
+    """Save a rendered pixmap and its thumbnails (in thumbnails_<width>/), updating `stats`."""
+    output_path = output_dir / filename
+    stats.bytes_written += save_image(pix, output_path, profile)
+    stats.files += 1
+    for width in profile.thumbnails:
+        if width >= pix.width:
+            continue
+        thumbnail_dir = output_dir / f"thumbnails_{width}"
+        thumbnail_dir.mkdir(exist_ok=True)
+        thumbnail = fitz.Pixmap(pix, width, round(pix.height * width / pix.width), None)
+        stats.bytes_written += save_image(thumbnail, thumbnail_dir / filename, profile)
+        stats.files += 1
+    return output_path
+
+def render_figures(doc: fitz.Document, page_num: int, output_dir: Path, profile: RenderProfile,
+                   stats: RenderStats, seen_xrefs: Set[int]):
+    """Write a page's embedded images as stored and render clips of its vector figures."""
+    page = doc[page_num]
+    colorspace = fitz.csGRAY if profile.grayscale else fitz.csRGB
+
+    started = time.perf_counter()
+    regions = find_figure_regions(page)
+    for path in extract_page_images(doc, page, output_dir, seen_xrefs):
+        stats.bytes_written += path.stat().st_size
+        stats.files += 1
+        stats.figures.append({'page': page_num + 1, 'kind': 'image', 'file': path.name})
+    stats.write_seconds += time.perf_counter() - started
+
+    vector_regions = [region for region in regions if region.is_vector]
+    for index, region in enumerate(vector_regions, 1):
+        started = time.perf_counter()
+        pix = page.get_pixmap(dpi=profile.dpi, colorspace=colorspace, alpha=profile.alpha, clip=region.rect)
+        rendered = time.perf_counter()
+        stats.render_seconds += rendered - started
+
+        output_path = write_pixmap(pix, output_dir, f"page_{page_num + 1:03d}_fig_{index}.{profile.extension}",
+                                   profile, stats)
+        stats.write_seconds += time.perf_counter() - rendered
+        stats.figures.append({
+            'page': page_num + 1,
+            'kind': 'vector',
+            'file': output_path.name,
+            'bbox': [round(value, 1) for value in region.rect],
+        })
+        logger.info(f"Saved figure {index} of page {page_num + 1} to {output_path}")
+
+def render_pages(doc: fitz.Document, output_dir: Path, start: int, end: int,
+                 profile: Union[str, RenderProfile] = DEFAULT_PROFILE,
+                 seen_xrefs: Optional[Set[int]] = None) -> RenderStats:
+    """
+    Render pages [start, end) of an open document.
+
+    Each page is rasterized once; thumbnails are scaled down from that pixmap and
+    written to thumbnails_<width>/ next to the pages. Figure-only profiles write
+    embedded images and figure clips instead of whole pages, skipping images in
+    `seen_xrefs` (those already written for earlier pages).
+    """
+    profile = get_profile(profile)
+    colorspace = fitz.csGRAY if profile.grayscale else fitz.csRGB
+    stats = RenderStats()
+    seen_xrefs = set(seen_xrefs or ())
+    for page_num in range(start, end):
+        if profile.figures_only:
+            render_figures(doc, page_num, output_dir, profile, stats, seen_xrefs)
+            stats.pages += 1
+            continue
+
+        started = time.perf_counter()
+        pix = doc[page_num].get_pixmap(dpi=profile.dpi, colorspace=colorspace, alpha=profile.alpha)
+        rendered = time.perf_counter()
+        stats.render_seconds += rendered - started
+
+        output_path = write_pixmap(pix, output_dir, f"page_{page_num + 1:03d}.{profile.extension}", profile, stats)
+        stats.write_seconds += time.perf_counter() - rendered
+        stats.pages += 1
+        logger.info(f"Saved page {page_num + 1} to {output_path}")
+    return stats
+
+def render_page_range(input_path: str, output_dir: str, start: int, end: int,
+                      profile: Union[str, RenderProfile] = DEFAULT_PROFILE,
+                      seen_xrefs: Optional[Set[int]] = None) -> RenderStats:
+    """Process-pool entry point: open the PDF in this worker and render pages [start, end)."""
+    with fitz.open(input_path) as doc:
+        return render_pages(doc, Path(output_dir), start, end, profile, seen_xrefs)
+
+def split_page_ranges(total_pages: int, workers: int, chunk_size: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Split pages into contiguous [start, end) chunks, two per worker by default for load balancing."""
+    if not chunk_size:
+        chunk_size = max(1, math.ceil(total_pages / (workers * 2)))
+    return [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
 
 class PDFToPNG:
-    """Convert PDF files to PNG images."""
+    """Convert PDF files to PNG (or JPEG/WebP) images."""
+
+    def __init__(self, workers: int = 1, chunk_size: Optional[int] = None,
+                 profile: Union[str, RenderProfile] = DEFAULT_PROFILE):
+        """
+        Initialize the converter.
 
-    def __init__(self):
-        """Initialize the converter."""
+        Args:
+            workers: Number of processes rendering pages in parallel (1 renders in-process)
+            chunk_size: Pages per task handed to a worker. Defaults to an even split.
+            profile: Render profile name (see RENDER_PROFILES) or a RenderProfile
+        """
         self.logger = logger
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.profile = get_profile(profile)
 
-    def convert(self, input_path: Union[str, Path], output_dir: Optional[Union[str, Path]] = None) -> ConversionResult:
+    def settings_fingerprint(self) -> str:
+        """Hash of the render settings that shape the output (not the worker layout)."""
+        return sha256_text('png', self.profile.fingerprint(), fitz.VersionBind)
+
+    def convert(self, input_path: Union[str, Path], output_dir: Optional[Union[str, Path]] = None,
+                session: Optional[PDFDocumentSession] = None) -> ConversionResult:
         """
         Convert a PDF file to PNG images.
 
         Args:
             input_path: Path to the PDF file
             output_dir: Optional path to save PNG files. If not provided, uses sources_png/pdf_name/
+            session: Optional open document session shared with other stages. Used for
+                in-process rendering; parallel workers always open their own copy.
 
         Returns:
             ConversionResult object containing conversion metadata
@@ -51,23 +270,58 @@ class PDFToPNG:
 
         self.logger.info(f"Processing PDF: {input_path.name}")
 
-        # Open the PDF
-        doc = fitz.open(input_path)
-        total_pages = len(doc)
+        # Count pages
+        if session is not None:
+            total_pages = session.page_count
+        else:
+            with fitz.open(input_path) as doc:
+                total_pages = len(doc)
         self.logger.info(f"Total pages: {total_pages}")
 
-        # Convert each page
-        for page_num in range(total_pages):
-            page = doc[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))  # 300 DPI
-            output_path = output_dir / f"page_{page_num + 1:03d}.png"
-            pix.save(str(output_path))
-            self.logger.info(f"Saved page {page_num + 1} to {output_path}")
+        # Convert each page, splitting page ranges across processes if configured
+        workers = min(self.workers, total_pages)
+        if workers <= 1 and session is not None:
+            stats = render_pages(session.doc, output_dir, 0, total_pages, self.profile)
+        elif workers <= 1:
+            stats = render_page_range(str(input_path), str(output_dir), 0, total_pages, self.profile)
+        else:
+            ranges = split_page_ranges(total_pages, workers, self.chunk_size)
+            self.logger.info(f"Rendering {len(ranges)} page ranges with {workers} workers")
+            # Each range skips images that first appear before it, so shared images are written once
+            first_pages: Dict[int, int] = {}
+            if self.profile.figures_only:
+                if session is not None:
+                    first_pages = first_image_pages(session.doc)
+                else:
+                    with fitz.open(input_path) as doc:
+                        first_pages = first_image_pages(doc)
+            stats = RenderStats()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(render_page_range, str(input_path), str(output_dir), start, end, self.profile,
+                                    {xref for xref, page in first_pages.items() if page < start})
+                    for start, end in ranges
+                ]
+                for future in futures:
+                    stats += future.result()
+
+        if self.profile.figures_only:
+            # Also marks text-only documents as processed
+            stats.figures.sort(key=lambda figure: (figure['page'], figure['file']))
+            (output_dir / FIGURE_INDEX).write_text(json.dumps(stats.figures, indent=2), encoding='utf-8')
+
+        # Times are summed over workers, i.e. CPU time rather than wall time when parallel
+        self.logger.info(
+            f"Profile '{self.profile.name}': {stats.files} files, {stats.bytes_written / 1024 / 1024:.1f} MB written, "
+            f"render {stats.render_seconds:.2f}s, encode+write {stats.write_seconds:.2f}s"
+        )
 
         return ConversionResult(
             page_count=total_pages,
             source_path=input_path,
-            output_directory=output_dir
+            output_directory=output_dir,
+            profile=self.profile.name,
+            stats=stats
         )
 
 def main():
@@ -75,10 +329,15 @@ def main():
     parser = argparse.ArgumentParser(description='Convert PDF to PNG images')
     parser.add_argument('input_path', type=str, help='Path to the PDF file')
     parser.add_argument('-o', '--output', type=str, help='Output directory for PNG files')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help=f'Processes rendering pages in parallel (up to {os.cpu_count()} cores)')
+    parser.add_argument('--chunk-size', type=int, help='Pages per worker task')
+    parser.add_argument('-p', '--profile', choices=sorted(RENDER_PROFILES), default=DEFAULT_PROFILE,
+                        help='Render profile (DPI, colorspace, format, thumbnails)')
 
     args = parser.parse_args()
 
-    converter = PDFToPNG()
+    converter = PDFToPNG(workers=args.workers, chunk_size=args.chunk_size, profile=args.profile)
     try:
         result = converter.convert(args.input_path, args.output)
         logger.info(f"Successfully converted {result.page_count} pages to {result.output_directory}")
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Staged, concurrent PDF processing pipeline.
+
+Each stage (analysis, Markdown, PNG) has its own bounded queue and worker pool so
+files flow through the stages independently. Local conversions run in a process
+pool across all cores, while Gemini analysis is throttled on its own by the analyzer's rate limiter.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from scripts.pdf_document import PDFDocumentSession
+from scripts.manifest import ProcessingManifest, STATUS_DONE, STATUS_FAILED
+from scripts.search_index import SearchIndex
+from scripts.semantic_index import SemanticIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_WORKERS = os.cpu_count() or 1
+
+@dataclass
+class PipelineConfig:
+    """Concurrency settings for each pipeline stage."""
+    # Upper bound on uploads/generations in flight; the analyzer's rate limiter
+    # decides how many generate calls actually run at once
+    analysis_workers: int = 32
+    markdown_workers: int = DEFAULT_LOCAL_WORKERS
+    png_workers: int = DEFAULT_LOCAL_WORKERS
+    # Processes rendering pages of a single PDF in parallel (for long documents)
+    png_page_workers: int = 1
+    # Named render profile from scripts.pdf_to_png.RENDER_PROFILES
+    png_profile: str = 'full'
+    queue_size: int = 32
+    max_retries: int = 3
+
+@dataclass
+class PDFJob:
+    """A PDF and the stages it still needs."""
+    pdf_path: Path
+    needs_analysis: bool = True
+    needs_markdown: bool = True
+    needs_png: bool = True
+
+@dataclass
+class StageResult:
+    """Outcome of a single stage for a single file."""
+    stage: str
+    pdf_name: str
+    success: bool
+    duration: float
+    error: Optional[str] = None
+
+def shorten_filename(pdf_path: Path, max_length: int = 100) -> Path:
+    """Truncate very long PDF names before upload, returning the (possibly new) path."""
+    clean_name = pdf_path.name
+    if len(clean_name) <= max_length:
+        return pdf_path
+
+    clean_name = clean_name[:90] + "..." + pdf_path.suffix
+    new_path = pdf_path.parent / clean_name
+    try:
+        pdf_path.rename(new_path)
+        logger.info(f"Renamed long filename to: {clean_name}")
+        return new_path
+    except Exception as e:
+        logger.warning(f"Could not rename file: {e}")
+        return pdf_path
+
+def output_exists(path: Path) -> bool:
+    """True if a stage output file, or a non-empty output directory, exists."""
+    if path.is_dir():
+        return any(path.iterdir())
+    return path.exists()
+
+def remove_output(path: Path):
+    """Delete a stage output file or directory."""
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+def reconcile_outputs(manifest: ProcessingManifest, name: str, expected: Dict[str, Path],
+                      settings: Dict[str, str]) -> Set[str]:
+    """
+    Line up recorded outputs with the paths a file's stages should now write to.
+
+    Analysis may rename a PDF, leaving earlier outputs under the old stem. Outputs
+    that are still current are moved to their new path; outdated ones are deleted so
+    they cannot be mistaken for fresh results. Returns the stages that must run.
+    """
+    records = manifest.stage_records(name)
+    outdated = manifest.outdated_stages([name], settings)[name]
+    for stage, path in expected.items():
+        record = records.get(stage)
+        if record is None or not record.output_path or Path(record.output_path) == path:
+            continue
+        previous = Path(record.output_path)
+        if not previous.exists():
+            continue
+        if stage in outdated:
+            logger.info(f"Removing outdated {stage} output {previous}")
+            remove_output(previous)
+        else:
+            logger.info(f"Moving current {stage} output {previous} -> {path}")
+            remove_output(path)
+            previous.rename(path)
+            manifest.record_stage(name, stage, STATUS_DONE, output_path=path,
+                                  settings_hash=record.settings_hash, duration=record.duration)
+
+    # Outputs deleted by hand are rebuilt as well
+    return outdated | {stage for stage, path in expected.items() if not output_exists(path)}
+
+def convert_markdown(pdf_path: str, output_path: str) -> int:
+    """Process-pool entry point for the Markdown stage. Returns the page count."""
+    from scripts.pdf_to_markdown import PDFToMarkdown
+    result = PDFToMarkdown().convert(pdf_path, output_path, stream=True)
+    return result.page_count
+
+def convert_png(pdf_path: str, output_dir: str, page_workers: int = 1, profile: str = 'full') -> int:
+    """Process-pool entry point for the PNG stage. Returns the page count."""
+    from scripts.pdf_to_png import PDFToPNG
+    result = PDFToPNG(workers=page_workers, profile=profile).convert(pdf_path, output_dir)
+    return result.page_count
+
+class ProcessingPipeline:
+    """Run analysis, Markdown and PNG stages concurrently across many PDFs."""
+
+    def __init__(self, analyzer, markdown_dir: Path, png_dir: Path,
+                 config: Optional[PipelineConfig] = None, manifest: Optional[ProcessingManifest] = None,
+                 settings: Optional[Dict[str, str]] = None, search_index: Optional[SearchIndex] = None,
+                 semantic_index: Optional[SemanticIndex] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            analyzer: PDFAnalyzer used for the analysis stage
+            markdown_dir: Directory for Markdown output
+            png_dir: Directory for per-PDF PNG folders
+            config: Concurrency settings
+            manifest: Optional manifest to record stage outcomes in
+            settings: Converter settings fingerprint per stage, recorded with each output
+            search_index: Optional full-text index updated as Markdown files are written
+            semantic_index: Optional passage embedding index updated as Markdown files are written
+        """
+        self.analyzer = analyzer
+        self.markdown_dir = Path(markdown_dir)
+        self.png_dir = Path(png_dir)
+        self.config = config or PipelineConfig()
+        self.manifest = manifest
+        self.settings = settings or {}
+        self.search_index = search_index
+        self.semantic_index = semantic_index
+        self.results: List[StageResult] = []
+
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def start(self):
+        """Create the stage queues, the process pool and the worker tasks."""
+        config = self.config
+        self._queues = {
+            'analysis': asyncio.Queue(maxsize=config.queue_size),
+            'markdown': asyncio.Queue(maxsize=config.queue_size),
+            'png': asyncio.Queue(maxsize=config.queue_size),
+        }
+        self._executor = ProcessPoolExecutor(
+            max_workers=max(1, min(DEFAULT_LOCAL_WORKERS, config.markdown_workers + config.png_workers))
+        )
+
+        stages = [
+            ('analysis', config.analysis_workers, self._analysis_worker),
+            ('markdown', config.markdown_workers, self._markdown_worker),
+            ('png', config.png_workers, self._png_worker),
+        ]
+        for stage, count, worker in stages:
+            for i in range(max(1, count)):
+                self._workers.append(asyncio.create_task(worker(), name=f"{stage}-worker-{i}"))
+
+        logger.info(
+            f"Pipeline started: {config.analysis_workers} analysis, "
+            f"{config.markdown_workers} markdown, {config.png_workers} png workers"
+        )
+
+    async def submit(self, job: PDFJob):
+        """Queue a job at the first stage it needs. Blocks while that queue is full."""
+        if self.manifest:
+            await asyncio.to_thread(self.manifest.touch_file, job.pdf_path)
+        if job.needs_analysis:
+            await self._queues['analysis'].put(job)
+        else:
+            await self._dispatch_local(job)
+
+    async def join(self):
+        """Wait until every queued job has passed through all stages, then shut down."""
+        # Analysis feeds the local stages, so it must drain first
+        for stage in ('analysis', 'markdown', 'png'):
+            await self._queues[stage].join()
+        await self.close()
+
+    async def close(self):
+        """Cancel the worker tasks and release the process pool."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, jobs: List[PDFJob]) -> List[StageResult]:
+        """Process a batch of jobs to completion and return the per-stage results."""
+        await self.start()
+        try:
+            for job in jobs:
+                await self.submit(job)
+            await self.join()
+        finally:
+            if self._workers:
+                await self.close()
+        return self.results
+
+    async def finish_analysis(self, job: PDFJob, new_name: str, duration: float = 0.0):
+        """
+        Record a completed analysis and queue the local stages still needed under the new name.
+
+        Used by the analysis workers and for analyses that arrive from batch jobs.
+        """
+        old_name = job.pdf_path.name
+        job.pdf_path = job.pdf_path.parent / new_name
+        stem = job.pdf_path.stem
+        expected = {
+            'analysis': self.analyzer.analysis_dir / f"{stem}_analysis.xml",
+            'markdown': self.markdown_dir / f"{stem}.md",
+            'png': self.png_dir / stem,
+        }
+
+        # The rename may point at outputs that already exist
+        if self.manifest:
+            await asyncio.to_thread(self.manifest.rename, old_name, new_name)
+            outdated = await asyncio.to_thread(
+                reconcile_outputs, self.manifest, new_name, expected, self.settings
+            )
+        else:
+            outdated = {stage for stage, path in expected.items() if not output_exists(path)}
+        await self._record(StageResult('analysis', new_name, True, duration), expected['analysis'])
+        job.needs_markdown = 'markdown' in outdated
+        job.needs_png = 'png' in outdated
+        await self._dispatch_local(job)
+
+    async def _dispatch_local(self, job: PDFJob):
+        """Fan a job out to the Markdown and PNG queues."""
+        if job.needs_markdown:
+            await self._queues['markdown'].put(job)
+        if job.needs_png:
+            await self._queues['png'].put(job)
+
+    async def _record(self, stage_result: StageResult, output_path: Optional[Path] = None):
+        """Keep a stage outcome in the results and, if configured, the manifest."""
+        self.results.append(stage_result)
+        if self.manifest:
+            await asyncio.to_thread(
+                self.manifest.record_stage, stage_result.pdf_name, stage_result.stage,
+                STATUS_DONE if stage_result.success else STATUS_FAILED,
+                output_path=output_path, duration=stage_result.duration, error=stage_result.error,
+                settings_hash=self.settings.get(stage_result.stage) if stage_result.success else None
+            )
+
+    async def _run_stage(self, stage: str, job: PDFJob, func: Callable, backoff: int,
+                         output_path: Optional[Path] = None, record_success: bool = True):
+        """
+        Run a stage with retries and linear backoff, recording the outcome.
+
+        The analysis worker passes record_success=False and records its own success
+        once the PDF has been renamed and the output path is known.
+        """
+        started = time.monotonic()
+        error = None
+        for attempt in range(self.config.max_retries):
+            try:
+                result = await func()
+                if result:
+                    if record_success:
+                        await self._record(
+                            StageResult(stage, job.pdf_path.name, True, time.monotonic() - started), output_path
+                        )
+                    logger.info(f"✅ {stage.capitalize()} completed for {job.pdf_path.name}")
+                    return result
+                error = "no result"
+            except Exception as e:
+                error = str(e)
+            if attempt < self.config.max_retries - 1:
+                wait_time = (attempt + 1) * backoff
+                logger.warning(
+                    f"{stage.capitalize()} attempt {attempt + 1} failed for {job.pdf_path.name}: {error}. "
+                    f"Retrying in {wait_time} seconds..."
+                )
+                await asyncio.sleep(wait_time)
+
+        await self._record(StageResult(stage, job.pdf_path.name, False, time.monotonic() - started, error))
+        logger.error(f"❌ {stage.capitalize()} failed for {job.pdf_path.name} after {self.config.max_retries} attempts")
+        return None
+
+    async def _analysis_worker(self):
+        queue = self._queues['analysis']
+        while True:
+            job = await queue.get()
+            try:
+                job.pdf_path = shorten_filename(job.pdf_path)
+
+                # Read and parse the PDF once for hashing, token estimates and upload.
+                # Pacing against the Gemini quota happens inside the analyzer's rate limiter
+                started = time.monotonic()
+                with PDFDocumentSession(job.pdf_path) as session:
+                    result = await self._run_stage(
+                        'analysis', job,
+                        lambda: self.analyzer.analyze_single_pdf_async(job.pdf_path, session),
+                        backoff=30, record_success=False
+                    )
+                if result:
+                    _, new_name = result
+                    await self.finish_analysis(job, new_name, time.monotonic() - started)
+            except Exception as e:
+                logger.error(f"❌ Error processing {job.pdf_path.name}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _markdown_worker(self):
+        queue = self._queues['markdown']
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await queue.get()
+            try:
+                output_path = self.markdown_dir / f"{job.pdf_path.stem}.md"
+                result = await self._run_stage(
+                    'markdown', job,
+                    lambda: loop.run_in_executor(self._executor, convert_markdown, str(job.pdf_path), str(output_path)),
+                    backoff=10, output_path=output_path
+                )
+                # Index in this process so only one writer touches each index
+                for index in (self.search_index, self.semantic_index):
+                    if result and index:
+                        try:
+                            await asyncio.to_thread(index.index_file, output_path, True)
+                        except Exception as e:
+                            logger.warning(f"Could not index {output_path.name}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _png_worker(self):
+        queue = self._queues['png']
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await queue.get()
+            try:
+                output_dir = self.png_dir / job.pdf_path.stem
+                # Drop pages left over from an earlier render of a different version
+                await asyncio.to_thread(remove_output, output_dir)
+                await self._run_stage(
+                    'png', job,
+                    lambda: loop.run_in_executor(
+                        self._executor, convert_png, str(job.pdf_path), str(output_dir),
+                        self.config.png_page_workers, self.config.png_profile
+                    ),
+                    backoff=10, output_path=output_dir
+                )
+            finally:
+                queue.task_done()
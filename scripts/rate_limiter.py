@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Shared rate limiting for Gemini API calls.
+
+Requests-per-minute and tokens-per-minute budgets are enforced with token
+buckets, and the number of in-flight requests adapts with AIMD: it grows
+while calls succeed and is cut back (honouring the server's retry hint)
+whenever a 429 / quota error comes back.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """A token bucket refilled continuously at `capacity` units per minute."""
+
+    def __init__(self, capacity: float):
+        """Initialize a full bucket holding one minute's worth of budget."""
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Take `amount` units out of the bucket."""
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Refund (positive) or charge (negative) units after the fact."""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether an exception is a 429 / quota exhaustion error."""
+    if getattr(error, 'code', None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource exhausted" in message or "rate limit" in message
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the server's retry hint from a rate limit error, if it sent one."""
+    # Already parsed by the caller (e.g. AsyncGeminiClient)
+    if getattr(error, 'retry_after', None) is not None:
+        return float(error.retry_after)
+
+    # google.rpc.RetryInfo carried in the error details
+    for detail in getattr(error, 'details', None) or ():
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            return getattr(delay, 'seconds', 0) + getattr(delay, 'nanos', 0) / 1e9
+
+    # Retry-After header on the HTTP response
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After') if hasattr(headers, 'get') else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    # Fall back to hints embedded in the message text
+    message = str(error)
+    match = re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', message)
+    if match:
+        return float(match.group(1))
+    match = re.search(r'retry in\s*([\d.]+)\s*s', message, re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    match = re.search(r'"retryDelay":\s*"([\d.]+)s"', message)
+    if match:
+        return float(match.group(1))
+    return None
+
+class RateLimitPermit:
+    """A granted request slot. Set `actual_tokens` once the real usage is known."""
+
+    def __init__(self, limiter: 'GeminiRateLimiter', tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.actual_tokens: Optional[int] = None
+
+    def __enter__(self):
+        self.limiter.acquire(self.tokens)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release(self, exc)
+        return False
+
+    async def __aenter__(self):
+        await self.limiter.acquire_async(self.tokens)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.limiter.release(self, exc)
+        return False
+
+class GeminiRateLimiter:
+    """Thread-safe RPM/TPM limiter with AIMD concurrency control for Gemini calls."""
+
+    def __init__(self, requests_per_minute: float = 15, tokens_per_minute: float = 1_000_000,
+                 max_concurrency: int = 8, min_concurrency: int = 1,
+                 decrease_factor: float = 0.5, default_backoff: float = 60.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            requests_per_minute: Request budget per minute
+            tokens_per_minute: Input token budget per minute
+            max_concurrency: Upper bound for concurrent in-flight requests
+            min_concurrency: Lower bound the AIMD controller never drops below
+            decrease_factor: Multiplier applied to the concurrency limit on a 429
+            default_backoff: Pause in seconds when a 429 carries no retry hint
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.decrease_factor = decrease_factor
+        self.default_backoff = default_backoff
+
+        self.concurrency_limit = float(self.min_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'GeminiRateLimiter':
+        """Build a limiter from GEMINI_RPM, GEMINI_TPM and GEMINI_MAX_CONCURRENCY."""
+        return cls(
+            requests_per_minute=float(os.getenv('GEMINI_RPM', 15)),
+            tokens_per_minute=float(os.getenv('GEMINI_TPM', 1_000_000)),
+            max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', 8))
+        )
+
+    def request(self, tokens: int) -> RateLimitPermit:
+        """Reserve budget for one request of roughly `tokens` input tokens."""
+        return RateLimitPermit(self, tokens)
+
+    def try_acquire(self, tokens: int) -> float:
+        """Take a slot if one is free, returning 0. Otherwise return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.concurrency_limit):
+                return 0.05
+            delay = max(self.requests.delay_for(1, now), self.tokens.delay_for(tokens, now))
+            if delay > 0:
+                return delay
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens: int):
+        """Block until the request fits in the current budgets and concurrency limit."""
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return
+            if delay >= 1:
+                logger.info(f"Rate limiter waiting {delay:.1f} seconds...")
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int):
+        """Like acquire, but waits with asyncio.sleep so the event loop keeps running."""
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return
+            if delay >= 1:
+                logger.info(f"Rate limiter waiting {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+
+    def release(self, permit: RateLimitPermit, error: Optional[BaseException] = None):
+        """Return a slot and feed the outcome into the AIMD controller."""
+        with self._lock:
+            self.in_flight -= 1
+            if permit.actual_tokens is not None:
+                self.tokens.adjust(permit.tokens - permit.actual_tokens)
+
+            if error is None:
+                # Additive increase: roughly +1 per window of successful requests
+                self.concurrency_limit = min(
+                    self.max_concurrency,
+                    self.concurrency_limit + 1.0 / max(1.0, self.concurrency_limit)
+                )
+            elif is_rate_limit_error(error):
+                wait = retry_after_seconds(error)
+                if wait is None:
+                    wait = self.default_backoff
+                self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.decrease_factor)
+                logger.warning(
+                    f"Hit API rate limit. Pausing {wait:.1f} seconds, "
+                    f"concurrency limit now {int(self.concurrency_limit)}"
+                )
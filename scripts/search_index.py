@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Full-text search over sources_markdown.
+
+Each "## Page N" section of a converted paper is stored as one row of an SQLite
+FTS5 table, so hits are ranked with BM25 per page and grouped per paper. Files
+are (re)indexed when PDFToMarkdown writes them, and `sync` picks up anything
+added, changed or deleted behind the index's back by comparing size and mtime.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path('.cache') / 'search.sqlite'
+
+# Page rows use rowid = document id * PAGE_STRIDE + page number, so a paper's pages
+# form one rowid range that can be deleted without scanning the FTS table
+PAGE_STRIDE = 100_000
+
+PAGE_HEADER = re.compile(r'^## Page (\d+)[ \t]*$', re.MULTILINE)
+
+# Characters that make a query FTS5 syntax rather than plain words
+FTS_SYNTAX = re.compile(r'["*()^:]|\b(AND|OR|NOT|NEAR)\b')
+
+@dataclass
+class PageHit:
+    """A matching page."""
+    page: int
+    score: float
+    snippet: str
+
+@dataclass
+class PaperHit:
+    """A matching paper with its best pages, best first."""
+    name: str
+    score: float
+    pages: List[PageHit] = field(default_factory=list)
+
+def split_pages(markdown: str) -> List[Tuple[int, str]]:
+    """Split converted Markdown into (page number, text) pairs using its "## Page N" headers."""
+    headers = list(PAGE_HEADER.finditer(markdown))
+    pages = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(markdown)
+        text = markdown[header.end():end].strip()
+        if text.endswith('---'):
+            text = text[:-3].rstrip()
+        pages.append((int(header.group(1)), text))
+    return pages
+
+def plain_fts_query(query: str) -> str:
+    """FTS5 expression matching all words of `query` literally, whatever punctuation it contains."""
+    return ' '.join(f'"{term}"' for term in re.findall(r'\w+', query))
+
+def to_fts_query(query: str) -> str:
+    """
+    Turn a plain query into an FTS5 expression matching all of its words.
+
+    Queries that look like FTS5 syntax (quotes, AND/OR/NOT, NEAR, prefix*) are passed through;
+    callers fall back to plain_fts_query when SQLite rejects them.
+    """
+    if FTS_SYNTAX.search(query):
+        return query
+    return plain_fts_query(query)
+
+class SearchIndex:
+    """Page-level BM25 full-text index of the Markdown corpus."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Open or create the index. Defaults to SEARCH_INDEX_PATH or .cache/search.sqlite."""
+        self.path = Path(path or os.getenv('SEARCH_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # The index can always be rebuilt from the Markdown files, so skip per-commit fsyncs
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    pages INTEGER NOT NULL,
+                    indexed REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+                    body, tokenize = 'porter unicode61'
+                )
+            """)
+
+    def index_pages(self, name: str, pages: Iterable[Tuple[int, str]], path: Union[str, Path] = '',
+                    size: int = 0, mtime: float = 0.0) -> int:
+        """Replace a paper's pages in the index. Returns the number of pages stored."""
+        pages = [(page, text) for page, text in pages if text.strip() and 0 < page < PAGE_STRIDE]
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+            if row:
+                doc_id = row[0]
+                self._delete_pages(doc_id)
+                self._conn.execute(
+                    "UPDATE documents SET path = ?, size = ?, mtime = ?, pages = ?, indexed = ? WHERE id = ?",
+                    (str(path), size, mtime, len(pages), time.time(), doc_id)
+                )
+            else:
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (name, path, size, mtime, pages, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, str(path), size, mtime, len(pages), time.time())
+                ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO pages (rowid, body) VALUES (?, ?)",
+                [(doc_id * PAGE_STRIDE + page, text) for page, text in pages]
+            )
+        return len(pages)
+
+    def _delete_pages(self, doc_id: int):
+        self._conn.execute(
+            "DELETE FROM pages WHERE rowid >= ? AND rowid < ?",
+            (doc_id * PAGE_STRIDE, (doc_id + 1) * PAGE_STRIDE)
+        )
+
+    def index_file(self, markdown_path: Union[str, Path], force: bool = False) -> bool:
+        """Index one Markdown file unless it is unchanged since it was last indexed. Returns True if indexed."""
+        markdown_path = Path(markdown_path)
+        stat = markdown_path.stat()
+        if not force:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT size, mtime FROM documents WHERE name = ?", (markdown_path.stem,)
+                ).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+                return False
+
+        pages = split_pages(markdown_path.read_text(encoding='utf-8'))
+        self.index_pages(markdown_path.stem, pages, markdown_path, stat.st_size, stat.st_mtime)
+        logger.info(f"Indexed {len(pages)} pages of {markdown_path.name}")
+        return True
+
+    def remove(self, names: Iterable[str]):
+        """Drop papers from the index."""
+        with self._lock, self._conn:
+            for name in names:
+                row = self._conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+                if row:
+                    self._delete_pages(row[0])
+                    self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+    def sync(self, markdown_dir: Union[str, Path]) -> Tuple[int, int]:
+        """Bring the index in line with a Markdown directory. Returns (indexed, removed) counts."""
+        markdown_dir = Path(markdown_dir)
+        on_disk = {path.stem: path for path in markdown_dir.glob("*.md")}
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT name FROM documents")}
+
+        indexed = sum(1 for path in on_disk.values() if self.index_file(path))
+        removed = known - on_disk.keys()
+        if removed:
+            self.remove(removed)
+        return indexed, len(removed)
+
+    def _match_pages(self, expression: str, max_page_hits: int) -> List[Tuple[str, int, float, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT d.name, p.rowid % ?, p.score, p.snippet FROM ("
+                "  SELECT rowid, -bm25(pages) AS score, snippet(pages, 0, '[', ']', '…', 12) AS snippet"
+                "  FROM pages WHERE pages MATCH ? ORDER BY bm25(pages) LIMIT ?"
+                ") p JOIN documents d ON d.id = p.rowid / ? ORDER BY p.score DESC",
+                (PAGE_STRIDE, expression, max_page_hits, PAGE_STRIDE)
+            ).fetchall()
+
+    def search(self, query: str, limit: int = 10, pages_per_paper: int = 3,
+               max_page_hits: int = 500) -> List[PaperHit]:
+        """
+        Rank papers by their best-matching page.
+
+        Args:
+            query: Words to find (all must occur on a page), or an FTS5 query expression
+            limit: Maximum number of papers returned
+            pages_per_paper: Maximum number of page hits kept per paper
+            max_page_hits: Page hits considered before grouping by paper
+
+        Returns:
+            Matching papers, best first. Scores are BM25 (higher is better).
+        """
+        expression = to_fts_query(query)
+        if not expression:
+            return []
+        try:
+            rows = self._match_pages(expression, max_page_hits)
+        except sqlite3.OperationalError as e:
+            # Ordinary questions ("e.g. (RCT)", "heart: failure") can look like broken FTS5 syntax
+            fallback = plain_fts_query(query)
+            if fallback == expression:
+                raise
+            logger.info(f"Not a valid FTS5 query ({e}); searching for its words instead")
+            if not fallback:
+                return []
+            rows = self._match_pages(fallback, max_page_hits)
+
+        papers: dict = {}
+        for name, page, score, snippet in rows:
+            paper = papers.get(name)
+            if paper is None:
+                if len(papers) >= limit:
+                    continue
+                paper = papers[name] = PaperHit(name, score)
+            if len(paper.pages) < pages_per_paper:
+                paper.pages.append(PageHit(int(page), score, ' '.join(snippet.split())))
+        return list(papers.values())
+
+    def stats(self) -> Tuple[int, int]:
+        """Number of (papers, pages) in the index."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM documents").fetchone()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def print_results(query: str, results: List[PaperHit], elapsed: float):
+    """Print ranked paper and page hits."""
+    if not results:
+        print(f"No matches for '{query}' ({elapsed * 1000:.1f} ms)")
+        return
+    print(f"\n🔎 {len(results)} papers matching '{query}' ({elapsed * 1000:.1f} ms):\n")
+    for rank, paper in enumerate(results, 1):
+        print(f"{rank}. {paper.name}  (score {paper.score:.2f})")
+        for hit in paper.pages:
+            print(f"   p.{hit.page}: {hit.snippet}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the Markdown corpus')
+    parser.add_argument('query', nargs='+', help='Words to search for, or an FTS5 query')
+    parser.add_argument('-d', '--markdown-dir', default='sources_markdown', help='Markdown directory to index')
+    parser.add_argument('-n', '--limit', type=int, default=10, help='Maximum number of papers to show')
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    try:
+        index.sync(args.markdown_dir)
+        query = ' '.join(args.query)
+        started = time.perf_counter()
+        results = index.search(query, limit=args.limit)
+        print_results(query, results, time.perf_counter() - started)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""
+Passage-level semantic retrieval over sources_markdown.
+
+Each converted paper is split into overlapping passages that never cross a
+"## Page N" boundary, so every hit can be cited by page. Passages are embedded
+in batches by a pluggable embedder (a local sentence-transformers model, the
+Gemini embedding API, or a dependency-free hashing embedder) and the vectors
+are appended to a float32 matrix that is memory-mapped for search.
+
+Above a few thousand passages the matrix is partitioned with an IVF index
+(spherical k-means centroids); a query scores the centroids, then only the
+vectors in the closest lists. New papers are assigned to existing lists as they
+arrive; the centroids are retrained only when the corpus has doubled since they
+were trained. Replaced or deleted papers leave tombstoned rows that are
+compacted away once they outnumber the live ones.
+"""
+
+import argparse
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    from scripts.search_index import split_pages
+except ImportError:
+    from search_index import split_pages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path('.cache') / 'semantic'
+
+# Passage size in words, and words repeated between consecutive passages of a page
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+
+# Below this many live passages search is exact; above it the IVF index is trained
+MIN_TRAIN_ROWS = 4096
+# Rows sampled to train the centroids
+TRAIN_SAMPLE = 100_000
+# Rows per block when assigning or scoring the full matrix
+BLOCK_ROWS = 65_536
+
+# assignments value of a deleted row
+DELETED = -1
+
+@dataclass
+class Chunk:
+    """A passage of one page."""
+    page: int
+    text: str
+
+@dataclass
+class Passage:
+    """A search hit."""
+    name: str
+    page: int
+    score: float
+    text: str
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], max_words: int = CHUNK_WORDS,
+                overlap: int = CHUNK_OVERLAP) -> List[Chunk]:
+    """
+    Split pages into passages of at most `max_words` words.
+
+    Paragraphs are kept whole where they fit; consecutive passages of a page share
+    `overlap` words so a sentence cut at a boundary is still found in one piece.
+    """
+    chunks = []
+    for page, text in pages:
+        window: List[str] = []
+        fresh = 0
+        for paragraph in re.split(r'\n\s*\n', text):
+            words = paragraph.split()
+            if not words:
+                continue
+            if fresh and len(window) + len(words) > max_words:
+                chunks.append(Chunk(page, ' '.join(window)))
+                window, fresh = window[-overlap:] if overlap else [], 0
+            window += words
+            fresh += len(words)
+            while len(window) > max_words:
+                chunks.append(Chunk(page, ' '.join(window[:max_words])))
+                window = window[max_words - overlap:]
+                fresh = len(window) - overlap
+        if fresh > 0:
+            chunks.append(Chunk(page, ' '.join(window)))
+    return chunks
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows stay zero) so dot products are cosine similarities."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder: signed feature hashing of word unigrams and bigrams.
+
+    Matches shared vocabulary rather than meaning, but needs no model download and is
+    fast enough to embed a whole corpus on a laptop CPU.
+    """
+
+    STOPWORDS = frozenset(
+        'a an and are as at be by for from has have in is it its of on or that the this to was were '
+        'which with we our these those their been not but can than also such'.split()
+    )
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @property
+    def fingerprint(self) -> str:
+        return f"hashing:{self.dim}:v1"
+
+    @staticmethod
+    @lru_cache(maxsize=262_144)
+    def _hash(feature: str) -> int:
+        return zlib.crc32(feature.encode('utf-8'))
+
+    def embed(self, texts: Sequence[str], query: bool = False) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = [t for t in re.findall(r'\w+', text.lower()) if t not in self.STOPWORDS and len(t) > 1]
+            features = Counter(tokens)
+            features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+            if not features:
+                continue
+            columns, values = [], []
+            for feature, count in features.items():
+                h = self._hash(feature)
+                columns.append(h % self.dim)
+                values.append((1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count)))
+            np.add.at(matrix[i], columns, values)
+        return normalize_rows(matrix)
+
+class SentenceTransformerEmbedder:
+    """Local CPU/GPU model through the optional sentence-transformers package."""
+
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', batch_size: int = 64):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+
+    @property
+    def fingerprint(self) -> str:
+        return f"sentence-transformers:{self.model_name}"
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str], query: bool = False) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+class GeminiEmbedder:
+    """Gemini embedding API; documents and queries are embedded with their own task types."""
+
+    MAX_BATCH = 100
+
+    def __init__(self, model_name: str = 'models/text-embedding-004', api_key: Optional[str] = None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.getenv('GEMINI_API_KEY'))
+        self._genai = genai
+        self.model_name = model_name
+        self._dim: Optional[int] = None
+
+    @property
+    def fingerprint(self) -> str:
+        return f"gemini:{self.model_name}"
+
+    @property
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = self.embed(['dimension probe'], query=True).shape[1]
+        return self._dim
+
+    def embed(self, texts: Sequence[str], query: bool = False) -> np.ndarray:
+        task_type = 'retrieval_query' if query else 'retrieval_document'
+        vectors = []
+        for start in range(0, len(texts), self.MAX_BATCH):
+            result = self._genai.embed_content(model=self.model_name, content=list(texts[start:start + self.MAX_BATCH]),
+                                               task_type=task_type)
+            vectors.extend(result['embedding'])
+        return normalize_rows(np.array(vectors, dtype=np.float32))
+
+def get_embedder(spec: Optional[str] = None):
+    """
+    Build an embedder from a spec such as 'hashing', 'hashing:768', 'sentence-transformers',
+    'sentence-transformers:all-mpnet-base-v2' or 'gemini'.
+
+    Defaults to SEMANTIC_EMBEDDER, else 'auto': sentence-transformers when installed,
+    otherwise the hashing embedder.
+    """
+    spec = spec or os.getenv('SEMANTIC_EMBEDDER') or 'auto'
+    kind, _, option = spec.partition(':')
+    if kind == 'auto':
+        try:
+            import sentence_transformers  # noqa: F401
+            kind = 'sentence-transformers'
+        except ImportError:
+            logger.info("sentence-transformers not installed; using the hashing embedder")
+            kind = 'hashing'
+    if kind == 'hashing':
+        return HashingEmbedder(int(option) if option else 512)
+    if kind == 'sentence-transformers':
+        return SentenceTransformerEmbedder(option) if option else SentenceTransformerEmbedder()
+    if kind == 'gemini':
+        return GeminiEmbedder(option) if option else GeminiEmbedder()
+    raise ValueError(f"Unknown embedder '{spec}'")
+
+def train_centroids(sample: np.ndarray, nlist: int, iterations: int = 12, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: unit-length centroids maximizing cosine similarity to their members."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.flatnonzero(np.bincount(assignment, minlength=nlist) == 0)
+        # Re-seed empty lists with random rows so every list stays in use
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class SemanticIndex:
+    """Embedding store with an IVF index over memory-mapped vectors."""
+
+    def __init__(self, embedder=None, directory: Optional[Union[str, Path]] = None,
+                 batch_size: int = 64, chunk_words: int = CHUNK_WORDS, chunk_overlap: int = CHUNK_OVERLAP):
+        """
+        Open or create the index.
+
+        Args:
+            embedder: Embedder to use (see get_embedder); defaults to SEMANTIC_EMBEDDER
+            directory: Storage directory; defaults to SEMANTIC_INDEX_DIR or .cache/semantic
+            batch_size: Passages embedded per call
+            chunk_words: Passage size in words
+            chunk_overlap: Words shared by consecutive passages of a page
+        """
+        self.embedder = embedder or get_embedder()
+        self.directory = Path(directory or os.getenv('SEMANTIC_INDEX_DIR') or DEFAULT_INDEX_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.chunk_words = chunk_words
+        self.chunk_overlap = chunk_overlap
+
+        self._vectors_path = self.directory / 'vectors.f32'
+        self._assignments_path = self.directory / 'assignments.npy'
+        self._centroids_path = self.directory / 'centroids.npy'
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / 'meta.sqlite'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    chunks INTEGER NOT NULL,
+                    indexed REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    row INTEGER PRIMARY KEY,
+                    document_id INTEGER NOT NULL,
+                    page INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_id)")
+
+        self.dim: Optional[int] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._centroids: Optional[np.ndarray] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._load()
+
+    # Storage
+
+    def _info(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _reset(self):
+        """Drop all vectors and passages, e.g. after switching embedders."""
+        with self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM info")
+            self._set_info('embedder', self.embedder.fingerprint)
+            self._set_info('chunking', f"{self.chunk_words}:{self.chunk_overlap}")
+        for path in (self._vectors_path, self._assignments_path, self._centroids_path):
+            path.unlink(missing_ok=True)
+        self.dim = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._centroids = None
+        self._vectors = None
+        self._lists = None
+
+    def _load(self):
+        embedder = self._info('embedder')
+        chunking = f"{self.chunk_words}:{self.chunk_overlap}"
+        if embedder != self.embedder.fingerprint or self._info('chunking') != chunking:
+            if embedder is not None:
+                logger.info(f"Embedding settings changed ({embedder} -> {self.embedder.fingerprint}); "
+                            f"semantic index will be rebuilt")
+            self._reset()
+            return
+
+        dim = self._info('dim')
+        self.dim = int(dim) if dim else None
+        if self._assignments_path.exists():
+            self._assignments = np.load(self._assignments_path)
+        if self._centroids_path.exists():
+            self._centroids = np.load(self._centroids_path)
+
+        # Rows written by an interrupted update are not referenced by any passage; keep
+        # the vectors, assignments and passages consistent by tombstoning them
+        rows = self._vector_rows()
+        if len(self._assignments) != rows:
+            size = min(len(self._assignments), rows)
+            self._assignments = np.resize(self._assignments, rows)
+            self._assignments[size:] = DELETED
+        live = np.zeros(rows, dtype=bool)
+        referenced = np.fromiter((row for (row,) in self._conn.execute("SELECT row FROM chunks")), dtype=np.int64)
+        if len(referenced) and referenced.max() >= rows:
+            logger.warning("Semantic index is missing vectors; it will be rebuilt")
+            self._reset()
+            return
+        live[referenced] = True
+        if np.any(~live & (self._assignments != DELETED)):
+            self._assignments[~live] = DELETED
+            np.save(self._assignments_path, self._assignments)
+
+    def _vector_rows(self) -> int:
+        if self.dim is None or not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // (self.dim * 4)
+
+    def _matrix(self) -> np.ndarray:
+        """The vectors as a read-only memory map (re-mapped after appends)."""
+        rows = len(self._assignments)
+        if self._vectors is None or len(self._vectors) != rows:
+            if rows == 0:
+                self._vectors = np.zeros((0, self.dim or 1), dtype=np.float32)
+            else:
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        return self._vectors
+
+    def _append(self, vectors: np.ndarray) -> int:
+        """Append vectors to the matrix file and return the first new row."""
+        first = len(self._assignments)
+        with open(self._vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        if self._centroids is not None:
+            assignment = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+        else:
+            assignment = np.zeros(len(vectors), dtype=np.int32)
+        self._assignments = np.concatenate([self._assignments, assignment])
+        self._lists = None
+        return first
+
+    def _tombstone(self, document_id: int):
+        rows = [row for (row,) in self._conn.execute("SELECT row FROM chunks WHERE document_id = ?", (document_id,))]
+        if rows:
+            self._assignments[rows] = DELETED
+            self._lists = None
+        self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+
+    def _save_assignments(self):
+        temp_path = self._assignments_path.with_suffix('.tmp.npy')
+        np.save(temp_path, self._assignments)
+        os.replace(temp_path, self._assignments_path)
+
+    # IVF maintenance
+
+    def _live_count(self) -> int:
+        return int(np.count_nonzero(self._assignments != DELETED))
+
+    def _maybe_retrain(self):
+        """Train the centroids once there are enough passages, and again whenever the corpus doubles."""
+        live = self._live_count()
+        trained_rows = int(self._info('trained_rows') or 0)
+        if live < MIN_TRAIN_ROWS or (self._centroids is not None and live < 2 * trained_rows):
+            return
+
+        started = time.perf_counter()
+        matrix = self._matrix()
+        live_rows = np.flatnonzero(self._assignments != DELETED)
+        rng = np.random.default_rng(live)
+        sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), TRAIN_SAMPLE), replace=False))
+        nlist = int(min(4096, max(16, math.sqrt(live))))
+        centroids = train_centroids(np.asarray(matrix[sample_rows]), nlist)
+
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + BLOCK_ROWS])
+            assignment = np.argmax(block @ centroids.T, axis=1).astype(np.int32)
+            current = self._assignments[start:start + BLOCK_ROWS]
+            self._assignments[start:start + BLOCK_ROWS] = np.where(current == DELETED, DELETED, assignment)
+
+        self._centroids = centroids
+        np.save(self._centroids_path, centroids)
+        self._save_assignments()
+        self._set_info('trained_rows', live)
+        self._lists = None
+        logger.info(f"Trained {nlist} IVF lists over {live} passages in {time.perf_counter() - started:.1f}s")
+
+    def _maybe_compact(self):
+        """Rewrite the matrix without tombstoned rows once they outnumber the live ones."""
+        total = len(self._assignments)
+        live_rows = np.flatnonzero(self._assignments != DELETED)
+        if total - len(live_rows) <= max(len(live_rows), 1024):
+            return
+
+        matrix = self._matrix()
+        temp_path = self._vectors_path.with_suffix('.tmp')
+        with open(temp_path, 'wb') as f:
+            for start in range(0, len(live_rows), BLOCK_ROWS):
+                f.write(np.ascontiguousarray(matrix[live_rows[start:start + BLOCK_ROWS]]).tobytes())
+
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+        self._conn.execute("DELETE FROM remap")
+        self._conn.executemany("INSERT INTO remap (old, new) VALUES (?, ?)",
+                               ((int(old), new) for new, old in enumerate(live_rows)))
+        self._conn.execute("CREATE TABLE chunks_compacted AS "
+                           "SELECT r.new AS row, c.document_id, c.page, c.text FROM chunks c JOIN remap r ON r.old = c.row")
+        self._conn.execute("DELETE FROM chunks")
+        self._conn.execute("INSERT INTO chunks (row, document_id, page, text) SELECT * FROM chunks_compacted")
+        self._conn.execute("DROP TABLE chunks_compacted")
+
+        self._vectors = None
+        os.replace(temp_path, self._vectors_path)
+        self._assignments = self._assignments[live_rows]
+        self._save_assignments()
+        self._lists = None
+        logger.info(f"Compacted semantic index: {total} -> {len(live_rows)} rows")
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows grouped by list: (rows sorted by list, start offset of each list)."""
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind='stable')
+            nlist = len(self._centroids)
+            offsets = np.searchsorted(self._assignments[order], np.arange(nlist + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    # Indexing
+
+    def index_pages(self, name: str, pages: Iterable[Tuple[int, str]], path: Union[str, Path] = '',
+                    size: int = 0, mtime: float = 0.0) -> int:
+        """Replace a paper's passages. Returns the number of passages stored."""
+        chunks = chunk_pages(pages, self.chunk_words, self.chunk_overlap)
+        vectors = [self.embedder.embed([c.text for c in chunks[start:start + self.batch_size]])
+                   for start in range(0, len(chunks), self.batch_size)]
+
+        with self._lock, self._conn:
+            if vectors:
+                matrix = np.concatenate(vectors)
+                if self.dim is None:
+                    self.dim = matrix.shape[1]
+                    self._set_info('dim', self.dim)
+                first = self._append(matrix)
+
+            row = self._conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+            if row:
+                document_id = row[0]
+                self._tombstone(document_id)
+                self._conn.execute(
+                    "UPDATE documents SET path = ?, size = ?, mtime = ?, chunks = ?, indexed = ? WHERE id = ?",
+                    (str(path), size, mtime, len(chunks), time.time(), document_id)
+                )
+            else:
+                document_id = self._conn.execute(
+                    "INSERT INTO documents (name, path, size, mtime, chunks, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, str(path), size, mtime, len(chunks), time.time())
+                ).lastrowid
+            if vectors:
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, document_id, page, text) VALUES (?, ?, ?, ?)",
+                    [(first + i, document_id, chunk.page, chunk.text) for i, chunk in enumerate(chunks)]
+                )
+            self._save_assignments()
+            self._maybe_compact()
+            self._maybe_retrain()
+        return len(chunks)
+
+    def index_file(self, markdown_path: Union[str, Path], force: bool = False) -> bool:
+        """Index one Markdown file unless it is unchanged since it was last indexed. Returns True if indexed."""
+        markdown_path = Path(markdown_path)
+        stat = markdown_path.stat()
+        if not force:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT size, mtime FROM documents WHERE name = ?", (markdown_path.stem,)
+                ).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+                return False
+
+        pages = split_pages(markdown_path.read_text(encoding='utf-8'))
+        count = self.index_pages(markdown_path.stem, pages, markdown_path, stat.st_size, stat.st_mtime)
+        logger.info(f"Embedded {count} passages of {markdown_path.name}")
+        return True
+
+    def remove(self, names: Iterable[str]):
+        """Drop papers from the index."""
+        with self._lock, self._conn:
+            for name in names:
+                row = self._conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+                if row:
+                    self._tombstone(row[0])
+                    self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+            self._save_assignments()
+            self._maybe_compact()
+
+    def sync(self, markdown_dir: Union[str, Path]) -> Tuple[int, int]:
+        """Bring the index in line with a Markdown directory. Returns (indexed, removed) counts."""
+        on_disk = {path.stem: path for path in Path(markdown_dir).glob("*.md")}
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT name FROM documents")}
+
+        indexed = sum(1 for path in on_disk.values() if self.index_file(path))
+        removed = known - on_disk.keys()
+        if removed:
+            self.remove(removed)
+        return indexed, len(removed)
+
+    # Search
+
+    def search(self, query: str, limit: int = 10, nprobe: int = 16) -> List[Passage]:
+        """
+        Find the passages most similar to a query.
+
+        Args:
+            query: Natural-language question or statement
+            limit: Number of passages returned
+            nprobe: IVF lists scanned; more is slower but closer to exact search
+
+        Returns:
+            Passages, most similar first. Scores are cosine similarities.
+        """
+        q = self.embedder.embed([query], query=True)[0]
+        with self._lock:
+            if self.dim is None or not len(self._assignments):
+                return []
+            matrix = self._matrix()
+            if self._centroids is None:
+                rows = np.flatnonzero(self._assignments != DELETED)
+                scores = np.asarray(matrix[rows]) @ q if len(rows) < len(matrix) else np.asarray(matrix) @ q
+            else:
+                order, offsets = self._inverted_lists()
+                probe = np.argsort(self._centroids @ q)[::-1][:nprobe]
+                rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in probe])
+                rows.sort()  # sequential reads from the memory map
+                scores = np.asarray(matrix[rows]) @ q
+            if not len(rows):
+                return []
+
+            top = np.argpartition(-scores, min(limit, len(scores)) - 1)[:limit]
+            top = top[np.argsort(-scores[top])]
+            hits = [(int(rows[i]), float(scores[i])) for i in top]
+            placeholders = ', '.join('?' * len(hits))
+            metadata = {
+                row: (name, page, text) for row, name, page, text in self._conn.execute(
+                    f"SELECT c.row, d.name, c.page, c.text FROM chunks c JOIN documents d ON d.id = c.document_id "
+                    f"WHERE c.row IN ({placeholders})", [row for row, _ in hits]
+                )
+            }
+        return [Passage(*metadata[row][:2], score, metadata[row][2]) for row, score in hits if row in metadata]
+
+    def stats(self) -> Tuple[int, int]:
+        """Number of (papers, passages) in the index."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents").fetchone()
+
+    def close(self):
+        """Close the database connection and release the memory map."""
+        with self._lock:
+            self._vectors = None
+            self._conn.close()
+
+def print_passages(query: str, passages: List[Passage], elapsed: float, width: int = 240):
+    """Print ranked passages with their paper and page."""
+    if not passages:
+        print(f"No passages similar to '{query}' ({elapsed * 1000:.1f} ms)")
+        return
+    print(f"\n🧭 {len(passages)} passages similar to '{query}' ({elapsed * 1000:.1f} ms):\n")
+    for rank, passage in enumerate(passages, 1):
+        text = passage.text if len(passage.text) <= width else passage.text[:width].rsplit(' ', 1)[0] + ' …'
+        print(f"{rank}. {passage.name}  p.{passage.page}  (similarity {passage.score:.3f})")
+        print(f"   {text}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description='Semantic passage search over the Markdown corpus')
+    parser.add_argument('query', nargs='+', help='Research question or statement')
+    parser.add_argument('-d', '--markdown-dir', default='sources_markdown', help='Markdown directory to index')
+    parser.add_argument('-n', '--limit', type=int, default=10, help='Number of passages to show')
+    parser.add_argument('--embedder', help="Embedder spec, e.g. 'hashing' or 'sentence-transformers'")
+    args = parser.parse_args()
+
+    index = SemanticIndex(get_embedder(args.embedder))
+    try:
+        index.sync(args.markdown_dir)
+        query = ' '.join(args.query)
+        started = time.perf_counter()
+        passages = index.search(query, limit=args.limit)
+        print_passages(query, passages, time.perf_counter() - started)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Persistent registry of PDFs already uploaded to the Gemini Files API.
+
+Maps each PDF's content hash to its remote file name, URI, state and expiry
+so repeat analyses (new prompts, retries, reruns) can reference the existing
+upload instead of sending the file again and waiting for PROCESSING.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = Path('.cache') / 'uploads.sqlite'
+
+# Gemini deletes uploaded files 48 hours after upload
+DEFAULT_FILE_TTL = 48 * 3600
+# Don't hand out files that are about to expire mid-request
+EXPIRY_MARGIN = 15 * 60
+
+@dataclass
+class UploadRecord:
+    """A remote copy of a local PDF."""
+    pdf_sha256: str
+    remote_name: str
+    uri: str
+    mime_type: str
+    state: str
+    expires_at: float
+    uploaded_at: float
+
+def parse_expiration(value) -> Optional[float]:
+    """Convert an API expiration time (datetime or RFC 3339 string) to a Unix timestamp."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        text = str(value).replace('Z', '+00:00')
+        # Trim nanosecond precision, which fromisoformat does not accept
+        if '.' in text:
+            head, tail = text.split('.', 1)
+            digits = ''.join(c for c in tail if c.isdigit())
+            text = f"{head}.{digits[:6]}{tail[len(digits):]}"
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+class UploadRegistry:
+    """SQLite-backed map from PDF content hash to uploaded Gemini file."""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Initialize the registry. Defaults to UPLOAD_REGISTRY_PATH or .cache/uploads.sqlite."""
+        self.path = Path(path or os.getenv('UPLOAD_REGISTRY_PATH') or DEFAULT_REGISTRY_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                pdf_sha256 TEXT PRIMARY KEY,
+                remote_name TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                state TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                uploaded_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get_active(self, pdf_sha256: str) -> Optional[UploadRecord]:
+        """Return the upload for a hash if it is ACTIVE and not about to expire."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pdf_sha256, remote_name, uri, mime_type, state, expires_at, uploaded_at "
+                "FROM uploads WHERE pdf_sha256 = ?", (pdf_sha256,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = UploadRecord(*row)
+        if record.state != "ACTIVE" or record.expires_at - EXPIRY_MARGIN <= time.time():
+            return None
+        return record
+
+    def register(self, pdf_sha256: str, remote_name: str, uri: str, state: str,
+                 mime_type: str = "application/pdf", expires_at: Optional[float] = None):
+        """Record (or refresh) the remote file for a PDF hash."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads "
+                "(pdf_sha256, remote_name, uri, mime_type, state, expires_at, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (pdf_sha256, remote_name, uri, mime_type, state, expires_at or now + DEFAULT_FILE_TTL, now)
+            )
+            self._conn.commit()
+
+    def invalidate(self, pdf_sha256: str):
+        """Forget the upload for a hash, e.g. after the server rejected it."""
+        with self._lock:
+            self._conn.execute("DELETE FROM uploads WHERE pdf_sha256 = ?", (pdf_sha256,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete expired entries. Returns how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM uploads WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Watch a folder for new or replaced PDFs.
+
+Uses inotify on Linux (through libc, no extra dependency) and falls back to
+polling the directory elsewhere. A file is only reported once its size and
+mtime have stopped changing for the debounce interval and it ends with a PDF
+trailer, so half-copied downloads are not picked up.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import struct
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event: wd, mask, cookie, len, then `len` bytes of name
+EVENT_HEADER = struct.Struct('iIII')
+
+def has_pdf_trailer(path: Path) -> bool:
+    """True if the file ends with a PDF %%EOF marker, i.e. it has been written completely."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+class Inotify:
+    """Minimal non-blocking inotify watch on a single directory."""
+
+    def __init__(self, directory: Path, mask: int = WATCH_MASK):
+        """Start watching `directory`. Raises OSError if inotify is unavailable."""
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error))
+
+    def read_names(self) -> List[str]:
+        """Drain pending events and return the file names they refer to."""
+        names = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name:
+                    names.append(os.fsdecode(name))
+
+    def close(self):
+        """Stop watching."""
+        os.close(self.fd)
+
+class FolderWatcher:
+    """Report PDFs that appear in, or are replaced in, a directory."""
+
+    def __init__(self, directory: Union[str, Path], pattern: str = '*.pdf', debounce: float = 2.0,
+                 poll_interval: float = 2.0, use_inotify: bool = True):
+        """
+        Initialize the watcher.
+
+        Args:
+            directory: Directory to watch (not recursive)
+            pattern: Glob pattern of file names to report
+            debounce: Seconds a file's size and mtime must stay unchanged before it is reported
+            poll_interval: Seconds between directory scans when polling
+            use_inotify: Use inotify if available; otherwise always poll
+        """
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+        # (size, mtime) of every file as last reported, so unchanged files are ignored
+        self._seen: Dict[str, Tuple[int, float]] = {}
+        # name -> ((size, mtime), time of the last observed change) while waiting to settle
+        self._pending: Dict[str, Tuple[Tuple[int, float], float]] = {}
+
+    def _stat(self, name: str) -> Optional[Tuple[int, float]]:
+        try:
+            stat = (self.directory / name).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _scan(self) -> List[str]:
+        """Names of matching files whose size or mtime differ from what was last reported."""
+        changed = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.pattern):
+                    continue
+                stat = entry.stat()
+                if self._seen.get(entry.name) != (stat.st_size, stat.st_mtime):
+                    changed.append(entry.name)
+        return changed
+
+    def _note(self, names: List[str], now: float):
+        """Start or restart the debounce timer for the given file names."""
+        for name in names:
+            if not fnmatch.fnmatch(name, self.pattern):
+                continue
+            stat = self._stat(name)
+            if stat is None or stat == self._seen.get(name):
+                continue
+            previous = self._pending.get(name)
+            if previous is None or previous[0] != stat:
+                self._pending[name] = (stat, now)
+
+    def _settled(self, now: float) -> List[Path]:
+        """Pop pending files that have been stable for the debounce interval."""
+        ready = []
+        for name, (stat, changed_at) in list(self._pending.items()):
+            current = self._stat(name)
+            if current is None:
+                del self._pending[name]
+            elif current != stat:
+                self._pending[name] = (current, now)
+            elif now - changed_at >= self.debounce:
+                del self._pending[name]
+                path = self.directory / name
+                if has_pdf_trailer(path):
+                    self._seen[name] = current
+                    ready.append(path)
+                else:
+                    # Still being written, or not a PDF; look again after the next change
+                    logger.warning(f"Ignoring {name}: no PDF trailer")
+        return ready
+
+    def _open_inotify(self) -> Optional[Inotify]:
+        if not self.use_inotify:
+            return None
+        try:
+            return Inotify(self.directory)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({e}), polling {self.directory} every {self.poll_interval}s")
+            return None
+
+    def mark_existing(self):
+        """Treat the files present now as already reported; later changes to them are still reported."""
+        for name in self._scan():
+            self._seen[name] = self._stat(name)
+
+    async def changes(self, include_existing: bool = False) -> AsyncIterator[Path]:
+        """
+        Yield PDFs as they finish being created or replaced.
+
+        Args:
+            include_existing: Also report files already present when watching starts, except
+                those marked by an earlier mark_existing() and unchanged since
+        """
+        if not include_existing:
+            self.mark_existing()
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        inotify = self._open_inotify()
+        if inotify:
+            loop.add_reader(inotify.fd, lambda: events.put_nowait(inotify.read_names()))
+            logger.info(f"Watching {self.directory} with inotify")
+            # Catch anything that landed before the watch was set up
+            self._note(self._scan(), time.monotonic())
+        else:
+            logger.info(f"Polling {self.directory} every {self.poll_interval}s")
+
+        try:
+            while True:
+                # Wake up when the next pending file could settle, or for the next poll
+                timeout = self.poll_interval if inotify is None else None
+                if self._pending:
+                    wait = min(changed_at for _, changed_at in self._pending.values()) + self.debounce
+                    timeout = max(0.05, wait - time.monotonic())
+                    if inotify is None:
+                        timeout = min(timeout, self.poll_interval)
+                try:
+                    names = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    names = [] if inotify else self._scan()
+
+                now = time.monotonic()
+                self._note(names, now)
+                for path in self._settled(now):
+                    yield path
+        finally:
+            if inotify:
+                loop.remove_reader(inotify.fd)
+                inotify.close()
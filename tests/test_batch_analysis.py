@@ -0,0 +1,107 @@
+"""Batch analysis against the local fake Gemini server."""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import fitz
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scripts import batch_analysis
+from scripts.analysis_cache import AnalysisCache
+from scripts.batch_analysis import BatchAnalyzer, BatchJobStore
+from scripts.fake_gemini_server import FakeGeminiServer, start_fake_server
+from scripts.gemini_async import GeminiAPIError
+from scripts.pdf_analyze import PDFAnalyzer
+from scripts.upload_registry import UploadRegistry
+
+def make_pdfs(directory: Path, count: int):
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = directory / f"paper{i}.pdf"
+        with fitz.open() as doc:
+            doc.new_page().insert_text((72, 72), f"Paper number {i} about randomized trials.")
+            doc.save(str(path))
+        paths.append(path)
+    return paths
+
+def make_analyzer(tmp_path: Path) -> PDFAnalyzer:
+    return PDFAnalyzer('test-key', cache=AnalysisCache(tmp_path / 'cache.sqlite'),
+                       uploads=UploadRegistry(tmp_path / 'uploads.sqlite'), analysis_mode='pdf')
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_jobs_resume_after_restart(workdir, monkeypatch):
+    pdfs = make_pdfs(workdir / 'sources_pdf', 3)
+    store_path = workdir / 'batch_jobs.sqlite'
+    results = []
+
+    async def on_result(pdf_path, new_name):
+        results.append(new_name)
+
+    async def scenario():
+        server, runner, base_url = await start_fake_server(FakeGeminiServer(batch_seconds=0.5))
+        monkeypatch.setenv('GEMINI_API_BASE_URL', base_url)
+        try:
+            first = make_analyzer(workdir)
+            store = BatchJobStore(store_path)
+            stats = await BatchAnalyzer(first, store, batch_size=2).submit(pdfs)
+            assert (stats.submitted, stats.jobs) == (3, 2)
+            assert await BatchAnalyzer(first, store).poll(on_result) == 2
+            await first.close_async()
+            store.close()
+
+            # A new process picks up the open jobs from the store
+            second = make_analyzer(workdir)
+            store = BatchJobStore(store_path)
+            assert await BatchAnalyzer(second, store).submit(pdfs) == batch_analysis.BatchStats()
+            await asyncio.sleep(0.6)
+            stats = await BatchAnalyzer(second, store, poll_interval=0.1).run([], on_result)
+            await second.close_async()
+            assert store.open_jobs() == []
+            store.close()
+            return server, stats
+        finally:
+            await runner.cleanup()
+
+    server, stats = asyncio.run(scenario())
+    assert stats.completed == 3 and stats.failed == 0
+    assert server.batch_requests == 3
+    assert len(results) == 3
+    assert len(list((workdir / 'sources_analysis').glob('*.xml'))) == 3
+
+def test_job_creation_retries_rate_limits(workdir, monkeypatch):
+    pdfs = make_pdfs(workdir / 'sources_pdf', 2)
+    monkeypatch.setattr(batch_analysis, 'CREATE_RETRY_BACKOFF', 0.01)
+
+    async def scenario():
+        server, runner, base_url = await start_fake_server(FakeGeminiServer())
+        monkeypatch.setenv('GEMINI_API_BASE_URL', base_url)
+        try:
+            analyzer = make_analyzer(workdir)
+            client = analyzer.get_async_client()
+            create_batch = client.create_batch
+            failures = [GeminiAPIError(429, "Resource exhausted", retry_after=0.01), GeminiAPIError(503, "Unavailable")]
+
+            async def flaky_create_batch(*args, **kwargs):
+                if failures:
+                    raise failures.pop(0)
+                return await create_batch(*args, **kwargs)
+
+            monkeypatch.setattr(client, 'create_batch', flaky_create_batch)
+            store = BatchJobStore(workdir / 'batch_jobs.sqlite')
+            stats = await BatchAnalyzer(analyzer, store).submit(pdfs)
+            await analyzer.close_async()
+            store.close()
+            return stats
+        finally:
+            await runner.cleanup()
+
+    stats = asyncio.run(scenario())
+    assert (stats.submitted, stats.jobs, stats.failed) == (2, 1, 0)